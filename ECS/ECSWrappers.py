@@ -52,7 +52,7 @@ def query(query_name: str, *components: type[Component]):
         @functools.wraps(func)
         async def wrapper_decorator(*args, **kwargs):
             world = _extract_world(*args, **kwargs)
-            query_result = world.query_components(*components)
+            query_result = await world.query_components_async(*components)
             kwargs[query_name] = query_result
             return await func(*args, **kwargs)
 
@@ -70,7 +70,7 @@ def query_component_loop(query_name: str, aggregator_func: Callable[[list], Any]
         @functools.wraps(func)
         async def wrapper_decorator(*args, **kwargs):
             world = _extract_world(*args, **kwargs)
-            component_list = [world.get_components(r, *components) for r in world.query_components(*components)]
+            component_list = [row[1] for row in await world.query_component_rows_async(*components)]
             return await _query_loop(func, world, component_list, query_name, aggregator_func, *args, **kwargs)
 
         return wrapper_decorator
@@ -87,7 +87,7 @@ def query_entity_loop(query_name: str, aggregator_func: Callable[[list], Any] =
         @functools.wraps(func)
         async def wrapper_decorator(*args, **kwargs):
             world = _extract_world(*args, **kwargs)
-            query_result = world.query_components(*components)
+            query_result = await world.query_components_async(*components)
             return await _query_loop(func, world, query_result, query_name, aggregator_func, *args, **kwargs)
 
         return wrapper_decorator
@@ -105,7 +105,7 @@ def query_entity_component_loop(query_name: str, aggregator_func: Callable[[list
         @functools.wraps(func)
         async def wrapper_decorator(*args, **kwargs):
             world = _extract_world(*args, **kwargs)
-            entities = ((id_, world.get_components(id_)) for id_ in world.query_components(*components))
+            entities = ((id_, world.get_components(id_)) for id_ in await world.query_components_async(*components))
             return await _query_loop(func, world, entities, query_name, aggregator_func, *args, **kwargs)
 
         return wrapper_decorator
@@ -113,6 +113,27 @@ def query_entity_component_loop(query_name: str, aggregator_func: Callable[[list
     return check_argument_wrapper
 
 
+# fields map an indexed attribute of component to the name of the kwarg holding the value to look up
+def lookup(query_name: str, component: type[Component], *components: type[Component], **fields: str):
+    def check_argument_wrapper(func):
+        if not _check_world_argument(func):
+            raise InvalidParameterError("Functions with the lookup decorator must have an argument \"world\" of type "
+                                        "ECS.World")
+
+        @functools.wraps(func)
+        async def wrapper_decorator(*args, **kwargs):
+            world = _extract_world(*args, **kwargs)
+            lookup_result = await world.lookup_async(component, **{field: kwargs[key] for field, key in fields.items()})
+            if components:
+                lookup_result = lookup_result & await world.query_components_async(component, *components)
+            kwargs[query_name] = lookup_result
+            return await func(*args, **kwargs)
+
+        return wrapper_decorator
+
+    return check_argument_wrapper
+
+
 async def _query_loop(func, world: World, query_, query_name: str,
                       aggregator: Callable[[list], Any] = None, *args, **kwargs):
     results = []
@@ -1,24 +1,18 @@
 from typing import Self
 
-from ECS import Component
+from ECS import Component, component
 
 
+# subclasses only choose the key and still need the component decorator to stay slotted
+@component
 class IntWrapper(Component):
-
-    def __init__(self, data_: int):
-        super().__init__()
-        self.data = data_
+    data: int
 
     def __dict__(self):
         return {
             self.data_key(): self.data
         }
 
-    def __eq__(self, other):
-        if type(self) != type(other):
-            return False
-        return self.data == other.data
-
     @classmethod
     def from_dict(cls, data: dict) -> Self:
         return cls(data[cls.data_key()])
@@ -26,3 +20,7 @@ class IntWrapper(Component):
     @classmethod
     def data_key(cls) -> str:
         raise NotImplementedError
+
+    @classmethod
+    def storage_key(cls, field: str) -> str:
+        return cls.data_key() if field == "data" else field
@@ -0,0 +1,221 @@
+import asyncio
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Callable, Any, Optional, Iterable
+
+import Events
+from ECS.WorldManager import ROUTING_KEY
+
+logger = logging.getLogger(__name__)
+
+# message kinds
+_REQUEST = 0
+_RESPONSE = 1
+
+# request kinds
+_EVENT = 0  # dispatch an event on the other side
+_CALL = 1  # call a coroutine function, given by its dotted path, on the other side
+
+
+def _resolve_path(path: str) -> Callable:
+    module, name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)
+
+
+class _Connection:
+    """One end of the pair of queues between the front end and a worker process."""
+    _send: Queue = None
+    _receive: Queue = None
+    _pending: dict[int, asyncio.Future] = None
+
+    def __init__(self, send: Queue, receive: Queue):
+        self._send = send
+        self._receive = receive
+        self._pending = {}
+        self._ids = itertools.count()
+
+    async def request(self, kind: int, name: str, *args, **kwargs) -> Any:
+        id_ = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[id_] = future
+        self._send.put((_REQUEST, id_, kind, name, args, kwargs))
+        return await future
+
+    # reads messages until the other side sends None
+    # the blocking reads get a thread of their own so they never take one from the loop's default executor
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="WorkerPoolReader")
+        tasks = set()
+        try:
+            while True:
+                try:
+                    message = await loop.run_in_executor(reader, self._receive.get)
+                except (EOFError, OSError):
+                    break
+                except Exception as e:
+                    # a message that cannot be unpickled is lost, the ones after it are still read
+                    logger.error(f"Failed to read a message: {type(e).__name__}: {e}")
+                    continue
+                if message is None:
+                    break
+                if message[0] == _RESPONSE:
+                    self._resolve(*message[1:])
+                    continue
+                task = asyncio.create_task(self._handle(*message[1:]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            reader.shutdown(wait=False)
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RemoteError("Connection closed"))
+            self._pending.clear()
+
+    def close(self):
+        self._send.put(None)
+
+    def _resolve(self, id_: int, result: Any, error: Optional[str]):
+        future = self._pending.pop(id_, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RemoteError(error))
+        else:
+            future.set_result(result)
+
+    async def _handle(self, id_: int, kind: int, name: str, args: tuple, kwargs: dict):
+        try:
+            if kind == _EVENT:
+                result = await Events.EVENT_MANAGER.dispatch_event(name, *args, **kwargs)
+            else:
+                result = await _resolve_path(name)(*args, **kwargs)
+            self._send.put((_RESPONSE, id_, _without_exceptions(result), None))
+        except Exception as e:
+            # exceptions may not survive pickling so only the message is sent back
+            logger.error(f"Failed to handle remote request: {name}")
+            logger.error(f"{str(e)}")
+            self._send.put((_RESPONSE, id_, None, f"{type(e).__name__}: {e}"))
+
+
+# exceptions may not survive pickling (nextcord's HTTPException does not) so results carry their messages instead
+def _without_exceptions(result: Any) -> Any:
+    if isinstance(result, BaseException):
+        return f"{type(result).__name__}: {result}"
+    if isinstance(result, dict):
+        return {k: _without_exceptions(v) for k, v in result.items()}
+    if isinstance(result, list):
+        return [_without_exceptions(r) for r in result]
+    if type(result) is tuple:
+        return tuple(_without_exceptions(r) for r in result)
+    return result
+
+
+def _worker_main(setup: Callable[[], Any], remote_calls: tuple[str, ...], receive: Queue, send: Queue):
+    asyncio.run(_worker_loop(setup, remote_calls, receive, send))
+
+
+async def _worker_loop(setup: Callable[[], Any], remote_calls: tuple[str, ...], receive: Queue, send: Queue):
+    connection = _Connection(send, receive)
+    # the front end owns these (e.g. the discord client) so calls to them are sent back to it
+    for path in remote_calls:
+        module, name = path.rsplit(".", 1)
+        setattr(importlib.import_module(module), name, partial(connection.request, _CALL, path))
+
+    world = setup()
+    logger.info(f"Worker {os.getpid()} started")
+    try:
+        await connection.serve()
+    finally:
+        world.flush()
+        connection.close()
+        logger.info(f"Worker {os.getpid()} stopped")
+
+
+class WorkerPool:
+    """Hosts the game worlds in worker processes and forwards events to them by guild.
+
+    setup runs in every worker and must register the processors and return something with a flush method
+    (a World or WorldManager). It is sent to the workers by pickling so it has to be a module level function or
+    a partial of one. remote_calls are dotted paths of coroutine functions that are replaced in the workers with
+    calls back to the front end."""
+    _setup: Callable[[], Any] = None
+    _remote_calls: tuple[str, ...] = None
+    _processes: list[BaseProcess] = None
+    _connections: list[_Connection] = None
+    _serving: Optional[asyncio.Future] = None
+
+    def __init__(self, setup: Callable[[], Any], num_workers: Optional[int] = None,
+                 remote_calls: Iterable[str] = ()):
+        self._setup = setup
+        self._num_workers = num_workers or os.cpu_count() or 1
+        self._remote_calls = tuple(remote_calls)
+        self._processes = []
+        self._connections = []
+        self._serving = None
+
+    def __len__(self):
+        return len(self._processes)
+
+    def start(self):
+        # spawn so the workers do not inherit the front end's event loop or open connections
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self._num_workers):
+            to_worker = context.Queue()
+            from_worker = context.Queue()
+            process = context.Process(target=_worker_main, daemon=True,
+                                      args=(self._setup, self._remote_calls, to_worker, from_worker))
+            process.start()
+            self._processes.append(process)
+            self._connections.append(_Connection(to_worker, from_worker))
+        logger.info(f"Started {len(self._processes)} workers")
+
+    def stop(self, timeout: Optional[float] = None):
+        for connection in self._connections:
+            connection.close()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.pid} did not stop, terminating")
+                process.terminate()
+        self._processes = []
+        self._connections = []
+        self._serving = None
+        logger.info("Stopped workers")
+
+    def worker_for(self, guild: int) -> int:
+        return guild % len(self._connections)
+
+    def register_events(self, *events: str):
+        for e in events:
+            Events.EVENT_MANAGER.set_forwarder(e, partial(self.forward, e))
+
+    def unregister_events(self, *events: str):
+        for e in events:
+            Events.EVENT_MANAGER.remove_forwarder(e)
+
+    # events without a routing key go to every worker and their results are concatenated
+    async def forward(self, name: str, *args, **kwargs) -> list[Any]:
+        self._ensure_serving()
+        guild = kwargs.get(ROUTING_KEY)
+        if guild is not None:
+            return await self._connections[self.worker_for(guild)].request(_EVENT, name, *args, **kwargs)
+
+        results = await asyncio.gather(*(c.request(_EVENT, name, *args, **kwargs) for c in self._connections))
+        return [r for worker_results in results for r in worker_results]
+
+    # the queues are read on whichever loop forwards the first event, which is the bot's loop in production
+    def _ensure_serving(self):
+        if self._serving is None or self._serving.done():
+            self._serving = asyncio.gather(*(c.serve() for c in self._connections))
+
+
+class RemoteError(Exception):
+    pass
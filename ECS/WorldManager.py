@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from functools import partial
+from typing import Callable, Any, Optional
+
+import Events
+from ECS import World, PROCESSOR_TYPE
+from Events.EventWrappers import is_batch_handler
+
+logger = logging.getLogger(__name__)
+
+ROUTING_KEY = "guild"
+
+# set while a processor runs on a shard so the events it dispatches go to the same shard
+_current_shard: ContextVar[Optional[int]] = ContextVar("current_shard", default=None)
+
+
+class WorldManager:
+    _world_factory: Callable[[int], World] = None
+    _shards: dict[int, World] = None
+    _events: dict[PROCESSOR_TYPE, (partial, set[str])] = None
+
+    def __init__(self, world_factory: Callable[[int], World]):
+        self._world_factory = world_factory
+        self._shards = {}
+        self._events = {}
+
+    def __len__(self):
+        return len(self._shards)
+
+    def __contains__(self, shard_id: int) -> bool:
+        return shard_id in self._shards
+
+    def get_shard(self, shard_id: int) -> World:
+        if shard_id not in self._shards:
+            return self.load_shard(shard_id)
+        return self._shards[shard_id]
+
+    def load_shard(self, shard_id: int) -> World:
+        if shard_id in self._shards:
+            return self._shards[shard_id]
+        world = self._world_factory(shard_id)
+        self._shards[shard_id] = world
+        logger.info(f"Loaded shard {shard_id}")
+        return world
+
+    def unload_shard(self, shard_id: int) -> Optional[World]:
+        if shard_id not in self._shards:
+            return None
+        world = self._shards.pop(shard_id)
+        world.flush()
+        logger.info(f"Unloaded shard {shard_id}")
+        return world
+
+    def flush(self) -> bool:
+        return all([world.flush() for world in self._shards.values()])
+
+    async def flush_async(self) -> bool:
+        return all(await asyncio.gather(*(world.flush_async() for world in self._shards.values())))
+
+    # events without a routing key run on every loaded shard and the results are passed to the aggregator
+    def register_processor_events(self, processor: PROCESSOR_TYPE, *events: str,
+                                  aggregator: Callable[[list], Any] = None):
+        part = partial(self.route, processor, aggregator)
+        if is_batch_handler(processor):
+            setattr(part, Events.BATCH_ATTRIBUTE, True)
+        if processor not in self._events:
+            self._events[processor] = (part, set())
+        for e in events:
+            self._events[processor][1].add(e)  # [1] accesses the set [0] is the partial function
+            Events.EVENT_MANAGER.set_handler(e, self._events[processor][0])
+
+    def unregister_processor_events(self, processor: PROCESSOR_TYPE):
+        if processor not in self._events:
+            return
+        part = self._events[processor][0]
+        for e in self._events[processor][1]:
+            Events.EVENT_MANAGER.remove_handler(e, part)
+        del self._events[processor]
+
+    async def route(self, processor: PROCESSOR_TYPE, aggregator: Optional[Callable[[list], Any]], *args,
+                    **kwargs) -> Any:
+        shard_id = kwargs.get(ROUTING_KEY, _current_shard.get())
+        if shard_id is not None:
+            return await self._run_on_shard(shard_id, processor, *args, **kwargs)
+        if Events.PAYLOADS_KEY in kwargs:
+            return await self._route_batch(processor, aggregator, *args, **kwargs)
+        results = await asyncio.gather(*(self._run_on_shard(id_, processor, *args, **kwargs)
+                                         for id_ in list(self._shards)))
+        if aggregator is not None:
+            return aggregator(list(results))
+        return None
+
+    # each shard gets the payloads for its guild, payloads without a guild go to every shard
+    async def _route_batch(self, processor: PROCESSOR_TYPE, aggregator: Optional[Callable[[list], Any]], *args,
+                           **kwargs) -> Any:
+        unrouted = [p for p in kwargs[Events.PAYLOADS_KEY] if p.get(ROUTING_KEY) is None]
+        batches: dict[int, list[dict]] = {id_: list(unrouted) for id_ in self._shards}
+        for payload in kwargs[Events.PAYLOADS_KEY]:
+            if payload.get(ROUTING_KEY) is not None:
+                batches.setdefault(payload[ROUTING_KEY], []).append(payload)
+
+        kwargs = {k: v for k, v in kwargs.items() if k != Events.PAYLOADS_KEY}
+        results = await asyncio.gather(*(self._run_on_shard(id_, processor, *args,
+                                                            **{Events.PAYLOADS_KEY: batch}, **kwargs)
+                                         for id_, batch in batches.items() if batch))
+        if aggregator is not None:
+            return aggregator(list(results))
+        return None
+
+    async def _run_on_shard(self, shard_id: int, processor: PROCESSOR_TYPE, *args, **kwargs) -> Any:
+        token = _current_shard.set(shard_id)
+        try:
+            return await self.get_shard(shard_id).run_processor(processor, *args, **kwargs)
+        finally:
+            _current_shard.reset(token)
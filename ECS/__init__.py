@@ -1,17 +1,46 @@
 from __future__ import annotations
 
+import inspect
 import logging
 import uuid
+from collections import OrderedDict
 from functools import partial
-from typing import Optional, Self, TypeVar, Any, Callable, Awaitable
+from typing import Optional, Self, TypeVar, Any, Callable, Awaitable, Iterable
 
 import Events
 import Storage
+from Events.EventWrappers import is_batch_handler
+from Storage import Snapshot
+from Storage.WriteAheadLog import WriteAheadLog, DEFAULT_GROUP_SIZE, DEFAULT_SYNC_DELAY, DEFAULT_COMPACT_INTERVAL
+from Storage.WriteBehind import WriteBehindBuffer, DEFAULT_MAX_STALENESS, DEFAULT_MAX_BATCH_SIZE
 
 logger = logging.getLogger(__name__)
 
 
-class Component:
+class _ComponentType(type):
+    # a subclass without __slots__ gets an instance __dict__ descriptor that would hide the inherited __dict__ method,
+    # so the method is copied into its namespace (where it was before components could have slots)
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        if "__slots__" not in namespace and "__dict__" not in namespace:
+            method = _inherited(bases, "__dict__")
+            if method is not None:
+                namespace["__dict__"] = method[1]
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+def _inherited(bases: tuple[type, ...], name: str) -> Optional[tuple[type, Any]]:
+    for base in bases:
+        for cls in base.__mro__:
+            value = vars(cls).get(name)
+            if value is not None and not inspect.isgetsetdescriptor(value):
+                return cls, value
+    return None
+
+
+class Component(metaclass=_ComponentType):
+    # subclasses made with the component decorator have slots, so the base must not add a __dict__ to them
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -25,9 +54,111 @@ class Component:
     def from_dict(cls, data: dict) -> Self:
         raise NotImplementedError
 
+    # override to build many components of this type faster than one at a time
+    @classmethod
+    def from_dicts(cls, data: list[dict]) -> list[Self]:
+        return [cls.from_dict(d) for d in data]
+
+    # the key __dict__ stores an attribute under, so lookups on it can run in storage
+    @classmethod
+    def storage_key(cls, field: str) -> str:
+        for f in getattr(cls, FIELDS_ATTRIBUTE, ()):
+            if f.name == field:
+                return f.key
+        return field
+
 
 C = TypeVar("C", bound=Component)
 
+FIELDS_ATTRIBUTE = "__component_fields__"
+GENERATED_ATTRIBUTE = "__component_generated__"
+
+
+class Field:
+    """Options for a component field, the serialized key defaults to the field name."""
+
+    def __init__(self, key: Optional[str] = None, compare: bool = True):
+        self.name = None
+        self.key = key
+        self.compare = compare
+
+
+def field(key: Optional[str] = None, compare: bool = True) -> Any:
+    return Field(key, compare)
+
+
+# makes a slotted component with generated __init__, __eq__, __dict__ and from_dict from the annotated fields,
+# keeping hand written ones. subclasses need it too or their instances get a __dict__
+def component(cls: type[C]) -> type[C]:
+    fields = dict((f.name, f) for f in getattr(cls, FIELDS_ATTRIBUTE, ()))
+    namespace = dict(vars(cls))
+    for name in inspect.get_annotations(cls):
+        f = namespace.pop(name, None)
+        f = f if isinstance(f, Field) else Field()
+        f.name = name
+        f.key = f.key or name
+        fields[name] = f
+    fields = tuple(fields.values())
+
+    inherited_slots = set().union(*(getattr(base, "__slots__", ()) for base in cls.__mro__[1:]))
+    namespace["__slots__"] = tuple(f.name for f in fields if f.name not in inherited_slots)
+    namespace[FIELDS_ATTRIBUTE] = fields
+    # drop what the old class got for not having slots: the __dict__ method _ComponentType copied in and __weakref__
+    inherited = _inherited(cls.__bases__, "__dict__")
+    if inherited is not None and namespace.get("__dict__") is inherited[1]:
+        del namespace["__dict__"]
+    namespace.pop("__weakref__", None)
+    for name, method in _component_methods(cls.__name__, fields).items():
+        if name not in namespace and _is_generated(*_inherited(cls.__bases__, name)):
+            namespace[name] = method
+
+    new_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+    _fix_class_cells(cls, new_cls)
+    return new_cls
+
+
+def _component_methods(class_name: str, fields: tuple[Field, ...]) -> dict[str, Any]:
+    names = [f.name for f in fields]
+    compared = [f.name for f in fields if f.compare]
+    source = "\n".join([
+        f"def __init__(self, {', '.join(names)}):",
+        *[f"    self.{n} = {n}" for n in names],
+        "    pass",
+        "def __eq__(self, other):",
+        "    if type(self) != type(other):",
+        "        return False",
+        f"    return {' and '.join(f'self.{n} == other.{n}' for n in compared) or 'True'}",
+        "def __dict__(self):",
+        f"    return {{{', '.join(f'{f.key!r}: self.{f.name}' for f in fields)}}}",
+        "@classmethod",
+        "def from_dict(cls, data):",
+        f"    return cls({', '.join(f'data[{f.key!r}]' for f in fields)})",
+    ])
+    namespace = {}
+    exec(source, {}, namespace)
+    for method in namespace.values():
+        func = getattr(method, "__func__", method)
+        func.__qualname__ = f"{class_name}.{func.__name__}"
+        setattr(func, GENERATED_ATTRIBUTE, True)
+    return namespace
+
+
+# generated methods are replaced in subclasses since they may add fields, hand written ones are kept
+def _is_generated(owner: type, method: Any) -> bool:
+    return owner is Component or getattr(getattr(method, "__func__", method), GENERATED_ATTRIBUTE, False)
+
+
+# methods using super() hold the class they were defined in, which the decorator replaced
+def _fix_class_cells(old_cls: type, new_cls: type):
+    for member in vars(new_cls).values():
+        func = getattr(member, "__func__", member)
+        if not hasattr(func, "__code__") or func.__closure__ is None:
+            continue
+        for name, cell in zip(func.__code__.co_freevars, func.__closure__):
+            if name == "__class__" and cell.cell_contents is old_cls:
+                cell.cell_contents = new_cls
+
+
 _component_mapping: dict[str, type(C)] = {}
 
 
@@ -78,6 +209,28 @@ def entity_from_dict(data: dict) -> Optional[tuple[uuid, list[Component]]]:
     return uuid_, [*components]
 
 
+# deserializes the components of many entities a component type at a time, so each type is looked up once
+def entities_from_dicts(data: Iterable[dict]) -> list[tuple[uuid, list[Component]]]:
+    entities = []
+    components_data: dict[str, list[tuple[list[Component], dict]]] = {}
+    for e in data:
+        if "id" not in e:
+            continue
+        components = []
+        entities.append((e["id"], components))
+        for component_type, component_data in e.get("components").items():
+            components_data.setdefault(component_type, []).append((components, component_data))
+    for component_type, rows in components_data.items():
+        try:
+            class_: type(C) = get_component_type(component_type)
+        except ComponentNotRegisteredError:  # pragma: no cover
+            logger.error(f"Tried to load unknown component type {component_type}")
+            continue
+        for (components, _), component in zip(rows, class_.from_dicts([d for _, d in rows])):
+            components.append(component)
+    return entities
+
+
 def compare_entities(world: World, ent1: uuid, ent2: uuid):
     ent1_components = world.get_components(ent1)
     ent2_components = world.get_components(ent2)
@@ -87,20 +240,199 @@ def compare_entities(world: World, ent1: uuid, ent2: uuid):
     return True
 
 
+class Archetype:
+    component_types: frozenset[type[C]] = None
+    entities: list[uuid] = None
+    rows: dict[uuid, int] = None
+    columns: dict[type[C], list[Component]] = None
+
+    def __init__(self, component_types: frozenset[type[C]]):
+        self.component_types = component_types
+        self.entities = []
+        self.rows = {}
+        self.columns = {c: [] for c in component_types}
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, uuid_: uuid) -> bool:
+        return uuid_ in self.rows
+
+    def add(self, uuid_: uuid, components: dict[type[C], Component]):
+        self.rows[uuid_] = len(self.entities)
+        self.entities.append(uuid_)
+        for component_type, column in self.columns.items():
+            column.append(components[component_type])
+
+    def remove(self, uuid_: uuid) -> dict[type[C], Component]:
+        components = self.get(uuid_)
+        self._discard(uuid_)
+        return components
+
+    # copies the entity's row straight into the target's columns, taking the components the target has and this
+    # archetype does not from added
+    def move(self, uuid_: uuid, target: "Archetype", added: Optional[dict[type[C], Component]] = None):
+        row = self.rows[uuid_]
+        target.rows[uuid_] = len(target.entities)
+        target.entities.append(uuid_)
+        for component_type, column in target.columns.items():
+            own = self.columns.get(component_type)
+            column.append(own[row] if own is not None else added[component_type])
+        self._discard(uuid_)
+
+    def replace(self, uuid_: uuid, component: Component):
+        self.columns[type(component)][self.rows[uuid_]] = component
+
+    # swaps the last row into the removed slot so the columns stay dense
+    def _discard(self, uuid_: uuid):
+        row = self.rows.pop(uuid_)
+        last = len(self.entities) - 1
+        for column in self.columns.values():
+            column[row] = column[last]
+            column.pop()
+        moved = self.entities[last]
+        self.entities[row] = moved
+        self.entities.pop()
+        if row != last:
+            self.rows[moved] = row
+
+    def get(self, uuid_: uuid, *components: type[C]) -> dict[type[C], Component]:
+        row = self.rows[uuid_]
+        if len(components) == 0:
+            return {component_type: column[row] for component_type, column in self.columns.items()}
+        return {c: self.columns[c][row] for c in components if c in self.columns}
+
+    def get_rows(self, *components: type[C]) -> list[tuple[uuid, dict[type[C], Component]]]:
+        columns = [(c, self.columns[c]) for c in components]
+        return [(uuid_, {c: column[row] for c, column in columns}) for row, uuid_ in enumerate(self.entities)]
+
+
+class Query:
+    components: frozenset[type[C]] = None
+    _entities: set[uuid] = None
+    _result: Optional[frozenset[uuid]] = None
+
+    def __init__(self, components: frozenset[type[C]], entities: set[uuid]):
+        self.components = components
+        self._entities = entities
+        self._result = None
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __contains__(self, uuid_: uuid) -> bool:
+        return uuid_ in self._entities
+
+    def add(self, uuid_: uuid):
+        if uuid_ in self._entities:
+            return
+        self._entities.add(uuid_)
+        self._result = None
+
+    def discard(self, uuid_: uuid):
+        if uuid_ not in self._entities:
+            return
+        self._entities.remove(uuid_)
+        self._result = None
+
+    # the frozen result is shared between calls until the next change to the query
+    @property
+    def result(self) -> frozenset[uuid]:
+        if self._result is None:
+            self._result = frozenset(self._entities)
+        return self._result
+
+
+class Index:
+    component: type[C] = None
+    field: str = None
+    _values: dict[Any, set[uuid]] = None
+    _entities: dict[uuid, Any] = None
+
+    def __init__(self, component: type[C], field: str):
+        self.component = component
+        self.field = field
+        self._values = {}
+        self._entities = {}
+
+    def add(self, uuid_: uuid, component: Component):
+        self.discard(uuid_)
+        value = getattr(component, self.field)
+        if value not in self._values:
+            self._values[value] = set()
+        self._values[value].add(uuid_)
+        self._entities[uuid_] = value
+
+    def discard(self, uuid_: uuid):
+        if uuid_ not in self._entities:
+            return
+        value = self._entities.pop(uuid_)
+        self._values[value].remove(uuid_)
+        if not self._values[value]:
+            del self._values[value]
+
+    def get(self, value: Any) -> frozenset[uuid]:
+        return frozenset(self._values.get(value, ()))
+
+
+class CachePolicy:
+    max_entities: Optional[int] = None
+    pinned: frozenset[type[C]] = None
+
+    # entities with a pinned component are never unloaded
+    def __init__(self, max_entities: Optional[int] = None, *pinned: type[C]):
+        self.max_entities = max_entities
+        self.pinned = frozenset(pinned)
+
+    def can_evict(self, archetype: Archetype) -> bool:
+        return not (self.pinned & archetype.component_types)
+
+
 class World:
-    _entities: dict[uuid, dict[type[C], Component]] = None
+    shard_id: Optional[int] = None
+    _entities: dict[uuid, Archetype] = None
+    _archetypes: dict[frozenset[type[C]], Archetype] = None
+    _query_archetypes: dict[frozenset[type[C]], list[Archetype]] = None
+    _queries: dict[frozenset[type[C]], Query] = None
+    _component_queries: dict[type[C], list[Query]] = None
     _components_cache: dict[type[C], set[uuid]] = None
+    _indexes: dict[type[C], dict[str, Index]] = None
     _events: dict[PROCESSOR_TYPE, (partial, set[str])] = None
+    _write_behind: Optional[WriteBehindBuffer] = None
+    _log: Optional[WriteAheadLog] = None
+    _cache_policy: Optional[CachePolicy] = None
+    _resident: OrderedDict[uuid, None] = None
+    _loaded_queries: set[frozenset[type[C]]] = None
+    _loaded_lookups: set[tuple[type[C], frozenset[tuple[str, Any]]]] = None
+    _changed: dict[uuid, Optional[set[type[C]]]] = None
 
-    def __init__(self):
+    # worlds with a shard id only load and save the entities that belong to that shard
+    def __init__(self, shard_id: Optional[int] = None):
+        self.shard_id = shard_id
         self._entities = {}
+        self._archetypes = {}
+        self._query_archetypes = {}
+        self._queries = {}
+        self._component_queries = {}
         self._components_cache = {}
+        self._indexes = {}
         self._events = {}
+        self._write_behind = None
+        self._log = None
+        self._cache_policy = None
+        self._resident = None
+        self._loaded_queries = None
+        self._loaded_lookups = None
+        # component types changed since the entity was last saved, None when the whole entity has to be written
+        self._changed = {}
 
     def add_to_component_cache(self, uuid_: uuid, component: type[C]):
         if component not in self._components_cache:
             self._components_cache[component] = set()
         self._components_cache[component].add(uuid_)
+        for query_ in self._component_queries.get(component, ()):
+            if all(uuid_ in self._components_cache.get(c, ()) for c in query_.components):
+                query_.add(uuid_)
 
     def remove_from_component_cache(self, uuid_: uuid, component: type[C]):
         if component not in self._components_cache:
@@ -108,71 +440,449 @@ class World:
         if uuid_ not in self._components_cache[component]:
             return
         self._components_cache[component].remove(uuid_)
+        for query_ in self._component_queries.get(component, ()):
+            query_.discard(uuid_)
+
+    def _get_archetype(self, component_types: frozenset[type[C]]) -> Archetype:
+        archetype = self._archetypes.get(component_types)
+        if archetype is None:
+            archetype = Archetype(component_types)
+            self._archetypes[component_types] = archetype
+            for signature, archetypes in self._query_archetypes.items():
+                if signature <= component_types:
+                    archetypes.append(archetype)
+        return archetype
+
+    def _place_entity(self, uuid_: uuid, components: dict[type[C], Component]):
+        archetype = self._get_archetype(frozenset(components))
+        archetype.add(uuid_, components)
+        self._entities[uuid_] = archetype
+
+    # entities are loaded from storage the first time they are accessed or matched by a query
+    def enable_lazy_loading(self, cache_policy: CachePolicy = None):
+        self._cache_policy = cache_policy if cache_policy is not None else CachePolicy()
+        self._resident = OrderedDict((uuid_, None) for uuid_ in self._entities)
+        self._loaded_queries = set()
+        self._loaded_lookups = set()
+        self._evict()
+
+    def _is_pending(self, uuid_: uuid) -> bool:
+        if self._log is not None and self._log.is_pending(uuid_):
+            return True
+        return self._write_behind is not None and self._write_behind.is_pending(uuid_)
+
+    def _is_pending_removal(self, uuid_: uuid) -> bool:
+        if self._log is not None and self._log.is_removed(uuid_):
+            return True
+        return self._write_behind is not None and self._write_behind.is_removed(uuid_)
+
+    def _touch(self, uuid_: uuid):
+        if self._cache_policy is None:
+            return
+        self._resident[uuid_] = None
+        self._resident.move_to_end(uuid_)
+
+    # a cache miss reads storage and blocks, processors on the event loop use the async versions of these loads
+    def _resolve(self, uuid_: uuid) -> Optional[Archetype]:
+        if not self._needs_load(uuid_):
+            return self._get_resident(uuid_)
+        return self._install_loaded(uuid_, Storage.load_entity(uuid_))
+
+    async def _resolve_async(self, uuid_: uuid) -> Optional[Archetype]:
+        if not self._needs_load(uuid_):
+            return self._get_resident(uuid_)
+        return self._install_loaded(uuid_, await Storage.load_entity_async(uuid_))
+
+    def _needs_load(self, uuid_: uuid) -> bool:
+        return self._cache_policy is not None and uuid_ not in self._entities and not self._is_pending_removal(uuid_)
+
+    def _get_resident(self, uuid_: uuid) -> Optional[Archetype]:
+        archetype = self._entities.get(uuid_)
+        if archetype is not None and self._cache_policy is not None:
+            self._touch(uuid_)
+            self._evict(uuid_)
+        return archetype
+
+    # the entity may have been added or removed while storage was read, which wins over the loaded data
+    def _install_loaded(self, uuid_: uuid, data: Optional[dict]) -> Optional[Archetype]:
+        if data is not None and self._needs_load(uuid_):
+            unpacked = entity_from_dict(data)
+            if unpacked is not None:
+                self._install_entity(*unpacked)
+        return self._get_resident(uuid_)
+
+    def _ensure_loaded(self, *components: type[C]):
+        signature = self._unloaded_query(components)
+        if signature is None:
+            return
+        self._install_found(Storage.find_entities((c.__name__ for c in signature), self.shard_id), signature)
+        self._loaded_queries.add(signature)
+
+    async def _ensure_loaded_async(self, *components: type[C]):
+        signature = self._unloaded_query(components)
+        if signature is None:
+            return
+        found = await Storage.find_entities_async((c.__name__ for c in signature), self.shard_id)
+        self._install_found(found, signature)
+        self._loaded_queries.add(signature)
+
+    def _unloaded_query(self, components: tuple[type[C], ...]) -> Optional[frozenset[type[C]]]:
+        if self._cache_policy is None:
+            return None
+        signature = frozenset(components)
+        return None if signature in self._loaded_queries else signature
+
+    # lazy lookups only load the entities storage finds for the fields, unless the whole component type is loaded
+    def _ensure_found(self, component: type[C], fields: dict[str, Any]):
+        if self._cache_policy is None:
+            return
+        if not fields or frozenset((component,)) in self._loaded_queries:
+            self._ensure_loaded(component)
+            return
+        lookup = self._lookup_key(component, fields)
+        if lookup is not None and lookup in self._loaded_lookups:
+            return
+        found = Storage.find_entities((component.__name__,), self.shard_id, self._lookup_where(component, fields))
+        self._install_found(found, frozenset((component,)))
+        if lookup is not None:
+            self._loaded_lookups.add(lookup)
+
+    async def _ensure_found_async(self, component: type[C], fields: dict[str, Any]):
+        if self._cache_policy is None:
+            return
+        if not fields or frozenset((component,)) in self._loaded_queries:
+            await self._ensure_loaded_async(component)
+            return
+        lookup = self._lookup_key(component, fields)
+        if lookup is not None and lookup in self._loaded_lookups:
+            return
+        found = await Storage.find_entities_async((component.__name__,), self.shard_id,
+                                                  self._lookup_where(component, fields))
+        self._install_found(found, frozenset((component,)))
+        if lookup is not None:
+            self._loaded_lookups.add(lookup)
+
+    # None when a value is unhashable, those lookups are sent to storage every time
+    @staticmethod
+    def _lookup_key(component: type[C], fields: dict[str, Any]) -> Optional[tuple[type[C], frozenset]]:
+        try:
+            return component, frozenset(fields.items())
+        except TypeError:
+            return None
+
+    @staticmethod
+    def _lookup_where(component: type[C], fields: dict[str, Any]) -> dict[str, Any]:
+        return {f"{component.__name__}.{component.storage_key(f)}": v for f, v in fields.items()}
+
+    def _install_found(self, found: Optional[Iterable[dict]], signature: frozenset[type[C]]):
+        for uuid_, components in entities_from_dicts(d for d in found or () if d.get("id") not in self._entities):
+            if self._is_pending_removal(uuid_):
+                continue
+            self._install_entity(uuid_, components)
+        self._evict(signature=signature)
+
+    # adds an entity that is already in storage, so nothing is saved
+    def _install_entity(self, uuid_: uuid, components: list[Component]):
+        entity = unpack_components(*components)
+        self._place_entity(uuid_, entity)
+        for c in entity.values():
+            self._index_component(uuid_, c)
+            self.add_to_component_cache(uuid_, type(c))
+        self._touch(uuid_)
+
+    def _detach_entity(self, uuid_: uuid) -> dict[type[C], Component]:
+        archetype = self._entities.pop(uuid_)
+        components = archetype.remove(uuid_)
+        for c in components:
+            self.remove_from_component_cache(uuid_, c)
+            self._unindex_component(uuid_, c)
+        if self._cache_policy is not None:
+            self._resident.pop(uuid_, None)
+        self._changed.pop(uuid_, None)
+        return components
+
+    # unloads the least recently used entities that have nothing waiting to be saved
+    # keep and signature protect the entity or query result that caused the load
+    def _evict(self, keep: Optional[uuid] = None, signature: Optional[frozenset[type[C]]] = None):
+        if self._cache_policy is None or self._cache_policy.max_entities is None:
+            return
+        excess = len(self._resident) - self._cache_policy.max_entities
+        if excess <= 0:
+            return
+        evicted = []
+        for uuid_ in self._resident:
+            if len(evicted) >= excess:
+                break
+            archetype = self._entities[uuid_]
+            if uuid_ == keep or self._is_pending(uuid_) or not self._cache_policy.can_evict(archetype):
+                continue
+            if signature is not None and signature <= archetype.component_types:
+                continue
+            evicted.append((uuid_, archetype.component_types))
+        for uuid_, component_types in evicted:
+            self._detach_entity(uuid_)
+            self._loaded_queries = {s for s in self._loaded_queries if not s <= component_types}
+            self._loaded_lookups = {l for l in self._loaded_lookups if l[0] not in component_types}
+        logger.debug(f"Unloaded {len(evicted)} entities")
+
+    def add_index(self, component: type[C], field: str) -> Index:
+        indexes = self._indexes.setdefault(component, {})
+        if field in indexes:
+            return indexes[field]
+        Storage.declare_index(f"{component.__name__}.{component.storage_key(field)}")
+        index = Index(component, field)
+        for archetype in self._matching_archetypes(component):
+            for uuid_, row in archetype.get_rows(component):
+                index.add(uuid_, row[component])
+        indexes[field] = index
+        return index
+
+    # fields without a declared index get one built on first lookup
+    def lookup(self, component: type[C], **fields: Any) -> frozenset[uuid]:
+        self._ensure_found(component, fields)
+        return self._lookup_resident(component, fields)
+
+    async def lookup_async(self, component: type[C], **fields: Any) -> frozenset[uuid]:
+        await self._ensure_found_async(component, fields)
+        return self._lookup_resident(component, fields)
+
+    def _lookup_resident(self, component: type[C], fields: dict[str, Any]) -> frozenset[uuid]:
+        indexes = self._indexes.get(component, {})
+        result = None
+        for field, value in fields.items():
+            index = indexes[field] if field in indexes else self.add_index(component, field)
+            matches = index.get(value)
+            result = matches if result is None else result & matches
+        return result if result is not None else self.register_query(component).result
+
+    # call after changing an indexed field on a component in place
+    def reindex(self, entity_id: uuid, *components: type[C]):
+        archetype = self._resolve(entity_id)
+        if archetype is None:
+            return
+        for component in archetype.get(entity_id, *components).values():
+            self._index_component(entity_id, component)
+
+    def _index_component(self, uuid_: uuid, component: Component):
+        for index in self._indexes.get(type(component), {}).values():
+            index.add(uuid_, component)
+
+    def _unindex_component(self, uuid_: uuid, component: type[C]):
+        for index in self._indexes.get(component, {}).values():
+            index.discard(uuid_)
 
     # call with uuid_=None to make a new entity with a random uuid
-    def add_components(self, uuid_: Optional[uuid], *components: Component) -> uuid.UUID:
+    # components the entity already has are kept unless replace is set, the first of duplicate types wins
+    def add_components(self, uuid_: Optional[uuid], *components: Component, replace: bool = False) -> uuid.UUID:
+        uuid_, changed = self._add_components(uuid_, components, replace)
+        if changed is None:
+            self.save_entity(uuid_)
+        elif changed:
+            self.save_entity(uuid_, *changed)
+        return uuid_
+
+    # adds (uuid, components) pairs in one call and saves them with a single write
+    def add_components_bulk(self, *entities: tuple[Optional[uuid], Iterable[Component]],
+                            replace: bool = False) -> list[uuid.UUID]:
+        uuids = []
+        for uuid_, components in entities:
+            uuid_, changed = self._add_components(uuid_, components, replace)
+            uuids.append(uuid_)
+            if changed is None or changed:
+                self._mark_changed(uuid_, *(changed or ()))
+        self._save_changed(dict.fromkeys(uuids))
+        return uuids
+
+    # returns the changed component types, None for a new entity
+    # without resolve an entity that is not resident counts as new instead of being loaded from storage
+    def _add_components(self, uuid_: Optional[uuid], components: Iterable[Component], replace: bool,
+                        resolve: bool = True) -> tuple[uuid.UUID, Optional[list[type[C]]]]:
         if uuid_ is None:
             uuid_ = uuid.uuid4()
-        if uuid_ not in self._entities:
-            self._entities[uuid_] = {}
-        temp = self._entities[uuid_].copy()
-        self._entities[uuid_] = unpack_components(*components)
-        self._entities[uuid_].update(temp)
+            archetype = None
+        elif resolve:
+            archetype = self._resolve(uuid_)
+        else:
+            archetype = self._entities.get(uuid_)
+        if archetype is None:
+            entity = unpack_components(*components)
+            self._place_entity(uuid_, entity)
+            for c in entity.values():
+                self._index_component(uuid_, c)
+                self.add_to_component_cache(uuid_, type(c))
+            if self._cache_policy is not None:
+                self._touch(uuid_)
+                self._evict(uuid_)
+            return uuid_, None
+
+        changed = []
+        added = None
         for c in components:
-            self.add_to_component_cache(uuid_, type(c))
-        self.save_entity(uuid_)
-        return uuid_
+            component_type = type(c)
+            if component_type in archetype.columns:
+                if not replace or component_type in changed:
+                    continue
+                self._unindex_component(uuid_, component_type)
+                archetype.replace(uuid_, c)
+                self._index_component(uuid_, c)
+                changed.append(component_type)
+            elif added is None:
+                added = {component_type: c}
+            elif component_type not in added:
+                added[component_type] = c
+        if added is not None:
+            target = self._get_archetype(archetype.component_types.union(added))
+            archetype.move(uuid_, target, added)
+            self._entities[uuid_] = target
+            for component_type, c in added.items():
+                self._index_component(uuid_, c)
+                self.add_to_component_cache(uuid_, component_type)
+            changed.extend(added)
+        return uuid_, changed
 
     def remove_components(self, uuid_: uuid, *components: type[C]) -> Optional[dict[type[C], C]]:
-        if uuid_ not in self._entities:
+        archetype = self._resolve(uuid_)
+        if archetype is None:
             return None
-        components_return = {}
-        for c in components:
-            if c not in self._components_cache:
-                continue
-            if uuid_ in self._components_cache[c]:
-                components_return[c] = self._entities[uuid_].pop(c)
-                self.remove_from_component_cache(uuid_, c)
-        self.save_entity(uuid_)
-        return components_return if components_return != {} else None
+        components_return = archetype.get(uuid_, *components)
+        if not components_return:
+            return None
+        target = self._get_archetype(archetype.component_types.difference(components_return))
+        archetype.move(uuid_, target)
+        self._entities[uuid_] = target
+        for c in components_return:
+            self.remove_from_component_cache(uuid_, c)
+            self._unindex_component(uuid_, c)
+        self.save_entity(uuid_, *components_return)
+        return components_return
 
     def remove_entity(self, entity_id: uuid) -> Optional[dict[type[C], C]]:
-        if entity_id not in self._entities:
+        if self._resolve(entity_id) is None:
             return None
-        for c in self._entities.get(entity_id):
-            self.remove_from_component_cache(entity_id, c)
-        Storage.remove_entity(entity_id)
-        return self._entities.pop(entity_id)
+        components = self._detach_entity(entity_id)
+        if self._log is not None:
+            self._log.append_removal(entity_id)
+        elif self._write_behind is not None:
+            self._write_behind.mark_removed(entity_id)
+        else:
+            Storage.remove_entity(entity_id)
+        return components
 
     def get_components(self, entity_id: uuid, *components: type[C]) -> Optional[dict[type[C], C]]:
-        if entity_id not in self._entities:
+        archetype = self._resolve(entity_id)
+        if archetype is None:
             return None
-        if len(components) == 0:
-            return self._entities.get(entity_id)
-        return {key: self._entities.get(entity_id).get(key)
-                for key in self._entities.get(entity_id) if key in components}
+        return archetype.get(entity_id, *components)
 
-    def save_entity(self, entity_id: uuid):
+    async def get_components_async(self, entity_id: uuid, *components: type[C]) -> Optional[dict[type[C], C]]:
+        archetype = await self._resolve_async(entity_id)
+        if archetype is None:
+            return None
+        return archetype.get(entity_id, *components)
+
+    # only the given component types are written, or the whole entity when none are given
+    def save_entity(self, entity_id: uuid, *components: type[C]):
         if entity_id not in self._entities:
             logger.error(f"Tried to save entity that does not exist. id: {entity_id}")
             return
-        Storage.save_entity(self.get_entity_data(entity_id))
+        self._mark_changed(entity_id, *components)
+        if self._log is not None:
+            self._log.append_update(self.get_entity_update(entity_id))
+        elif self._write_behind is not None:
+            self._write_behind.mark_dirty(entity_id)
+        else:
+            Storage.save_entity(self.get_entity_update(entity_id))
+
+    def _mark_changed(self, entity_id: uuid, *components: type[C]):
+        if not components:
+            self._changed[entity_id] = None
+        elif self._changed.get(entity_id, ()) is not None:
+            self._changed.setdefault(entity_id, set()).update(components)
+
+    def _save_changed(self, entity_ids: Iterable[uuid]):
+        entity_ids = [e for e in entity_ids if e in self._changed]
+        if self._log is not None:
+            for entity_id in entity_ids:
+                self._log.append_update(self.get_entity_update(entity_id))
+            return
+        if self._write_behind is not None:
+            for entity_id in entity_ids:
+                self._write_behind.mark_dirty(entity_id)
+            return
+        Storage.bulk_write([self.get_entity_update(e) for e in entity_ids], ())
+
+    # saves are batched and written at most max_staleness seconds after the first unsaved change
+    def enable_write_behind(self, max_staleness: float = DEFAULT_MAX_STALENESS,
+                            max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        self.flush()
+        self._write_behind = WriteBehindBuffer(self.get_entity_update, max_staleness, max_batch_size)
+
+    # changes are durable once the log is synced and reach storage when it is compacted, which takes the place of
+    # write behind. Records left in the log by a crash are applied to storage here, so enable it before loading
+    def enable_write_ahead_log(self, path: str, group_size: int = DEFAULT_GROUP_SIZE,
+                               sync_delay: float = DEFAULT_SYNC_DELAY,
+                               compact_interval: float = DEFAULT_COMPACT_INTERVAL):
+        self.flush()
+        self._write_behind = None
+        self._log = WriteAheadLog(path, group_size, sync_delay, compact_interval)
+
+    def flush(self) -> bool:
+        if self._log is not None:
+            return self._log.compact()
+        if self._write_behind is None:
+            return True
+        return self._write_behind.flush()
+
+    # lets processors wait for their changes to reach storage without blocking the event loop
+    async def flush_async(self) -> bool:
+        if self._log is not None:
+            return await self._log.compact_async()
+        if self._write_behind is None:
+            return True
+        return await self._write_behind.flush_async()
 
     def get_entity_data(self, entity_id: uuid) -> Optional[dict]:
         if entity_id not in self._entities:
             return None
-        return {
+        data = {
             "id": entity_id,
             "components": {
-                type(comp).__name__: comp.__dict__() for comp in self._entities.get(entity_id).values()
+                type(comp).__name__: comp.__dict__() for comp in self.get_components(entity_id).values()
             }
         }
+        if self.shard_id is not None:
+            data["shard"] = self.shard_id
+        return data
+
+    # a mongo update with $set and $unset for the components changed since the last save, which clears them
+    def get_entity_update(self, entity_id: uuid) -> Optional[dict]:
+        if entity_id not in self._entities:
+            return None
+        changed = self._changed.pop(entity_id, None)
+        if changed is None:
+            return {"$set": self.get_entity_data(entity_id)}
+        archetype = self._entities[entity_id]
+        set_fields = {"id": entity_id}
+        unset_fields = {}
+        for c in changed:
+            if c in archetype.columns:
+                set_fields[f"components.{c.__name__}"] = archetype.columns[c][archetype.rows[entity_id]].__dict__()
+            else:
+                unset_fields[f"components.{c.__name__}"] = ""
+        if self.shard_id is not None:
+            set_fields["shard"] = self.shard_id
+        update = {"$set": set_fields}
+        if unset_fields:
+            update["$unset"] = unset_fields
+        return update
 
     def has_entity(self, entity_id: uuid) -> bool:
-        return entity_id in self._entities
+        return self._resolve(entity_id) is not None
 
     def register_processor_events(self, processor: PROCESSOR_TYPE, *events: str):
         part = partial(self.run_processor, processor)
+        if is_batch_handler(processor):
+            setattr(part, Events.BATCH_ATTRIBUTE, True)
         if processor not in self._events:
             self._events[processor] = (part, set())
         for e in events:
@@ -190,18 +900,140 @@ class World:
     async def run_processor(self, processor: PROCESSOR_TYPE, *args, **kwargs) -> Any:
         return await processor(self, *args, **kwargs)
 
-    def query_components(self, *components: type[C]) -> set[uuid]:
-        for c in components:
-            if c not in self._components_cache:
-                self._components_cache[c] = set()
-        return set.intersection(*(self._components_cache.get(c) for c in components))
+    def _matching_archetypes(self, *components: type[C]) -> list[Archetype]:
+        signature = frozenset(components)
+        archetypes = self._query_archetypes.get(signature)
+        if archetypes is None:
+            archetypes = [a for a in self._archetypes.values() if signature <= a.component_types]
+            self._query_archetypes[signature] = archetypes
+        return archetypes
+
+    def register_query(self, *components: type[C]) -> Query:
+        signature = frozenset(components)
+        query_ = self._queries.get(signature)
+        if query_ is not None:
+            return query_
+        entities = set()
+        for archetype in self._matching_archetypes(*components):
+            entities.update(archetype.entities)
+        query_ = Query(signature, entities)
+        self._queries[signature] = query_
+        for c in signature:
+            self._component_queries.setdefault(c, []).append(query_)
+        return query_
+
+    def query_components(self, *components: type[C]) -> frozenset[uuid]:
+        self._ensure_loaded(*components)
+        return self.register_query(*components).result
+
+    async def query_components_async(self, *components: type[C]) -> frozenset[uuid]:
+        await self._ensure_loaded_async(*components)
+        return self.register_query(*components).result
 
+    # reads the requested columns straight out of each matching archetype table
+    def query_component_rows(self, *components: type[C]) -> list[tuple[uuid, dict[type[C], Component]]]:
+        self._ensure_loaded(*components)
+        return self._component_rows(*components)
+
+    async def query_component_rows_async(self, *components: type[C]) -> list[tuple[uuid, dict[type[C], Component]]]:
+        await self._ensure_loaded_async(*components)
+        return self._component_rows(*components)
+
+    def _component_rows(self, *components: type[C]) -> list[tuple[uuid, dict[type[C], Component]]]:
+        rows = []
+        for archetype in self._matching_archetypes(*components):
+            rows.extend(archetype.get_rows(*components))
+        return rows
+
+    # imports entities loaded from storage, so nothing is written back and nothing is loaded for them either
     def add_entities(self, *data: dict):
-        for e in data:
-            unpacked = entity_from_dict(e)
-            if unpacked is None:
+        for uuid_, components in entities_from_dicts(data):
+            self._add_components(uuid_, components, False, resolve=False)
+
+    # streams the world's shard from storage, returns the number of entities loaded
+    def load_entities(self, batch_size: int = Storage.DEFAULT_LOAD_BATCH_SIZE) -> int:
+        count = 0
+        for batch in Storage.iter_entities(self.shard_id, batch_size):
+            self.add_entities(*batch)
+            count += len(batch)
+        return count
+
+    # entities are usable as soon as their batch is added, before the whole load finishes
+    async def load_entities_async(self, batch_size: int = Storage.DEFAULT_LOAD_BATCH_SIZE) -> int:
+        count = 0
+        async for batch in Storage.iter_entities_async(self.shard_id, batch_size):
+            self.add_entities(*batch)
+            count += len(batch)
+        return count
+
+    # writes the archetypes and declared indexes to a local file that load_snapshot can restore from
+    # pending changes are flushed first so the snapshot is never ahead of storage
+    def save_snapshot(self, path: str) -> bool:
+        if self._cache_policy is not None:
+            logger.warning("Tried to snapshot a lazily loaded world")
+            return False
+        if not self.flush():
+            return False
+        taken_at = Snapshot.replay_from()
+        archetypes = []
+        for archetype in self._archetypes.values():
+            if len(archetype) == 0:
                 continue
-            self.add_components(unpacked[0], *(unpacked[1]))
+            archetypes.append(([c.__name__ for c in archetype.columns], list(archetype.entities),
+                               [[c.__dict__() for c in column] for column in archetype.columns.values()]))
+        indexes = [(c.__name__, field) for c, fields in self._indexes.items() for field in fields]
+        Snapshot.write_snapshot(path, {
+            Snapshot.SHARD_KEY: self.shard_id,
+            Snapshot.TAKEN_AT_KEY: taken_at,
+            Snapshot.ARCHETYPES_KEY: archetypes,
+            Snapshot.INDEXES_KEY: indexes,
+        })
+        return True
+
+    # fills an empty world from a snapshot then replays the storage changes made since it was taken
+    # returns False when there is no usable snapshot, in which case load_entities should be used instead
+    def load_snapshot(self, path: str, batch_size: int = Storage.DEFAULT_LOAD_BATCH_SIZE) -> bool:
+        if self._cache_policy is not None or self._entities:
+            logger.warning("Snapshots can only be loaded into an empty world without lazy loading")
+            return False
+        snapshot = Snapshot.read_snapshot(path)
+        if snapshot is None or snapshot[Snapshot.SHARD_KEY] != self.shard_id:
+            return False
+        try:
+            archetypes = [([get_component_type(c) for c in types], entities, columns)
+                          for types, entities, columns in snapshot[Snapshot.ARCHETYPES_KEY]]
+            indexes = [(get_component_type(c), field) for c, field in snapshot[Snapshot.INDEXES_KEY]]
+        except ComponentNotRegisteredError:
+            logger.warning(f"Ignoring snapshot {path} with unknown component types")
+            return False
+
+        for types, entities, columns in archetypes:
+            archetype = self._get_archetype(frozenset(types))
+            archetype.rows.update((uuid_, row) for row, uuid_ in enumerate(entities))
+            archetype.entities.extend(entities)
+            for component_type, data in zip(types, columns):
+                column = archetype.columns[component_type]
+                column.extend(component_type.from_dicts(data))
+                for uuid_, c in zip(entities, column):
+                    self.add_to_component_cache(uuid_, component_type)
+                    self._index_component(uuid_, c)
+            self._entities.update(dict.fromkeys(entities, archetype))
+        for component, field in indexes:
+            self.add_index(component, field)
+
+        replayed = 0
+        for batch in Storage.iter_entities(self.shard_id, batch_size, since=snapshot[Snapshot.TAKEN_AT_KEY]):
+            for data in batch:
+                if data["id"] in self._entities:
+                    self._detach_entity(data["id"])
+            self.add_entities(*batch)
+            replayed += len(batch)
+        stored = Storage.list_entity_ids(self.shard_id)
+        if stored is not None:
+            for uuid_ in [u for u in self._entities if u not in stored]:
+                self._detach_entity(uuid_)
+        logger.info(f"Loaded snapshot {path} with {len(self._entities)} entities, replayed {replayed}")
+        return True
 
 
 PROCESSOR_TYPE = Callable[[World, Any], Awaitable[Any]]
@@ -0,0 +1,170 @@
+import asyncio
+import collections
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Optional
+
+import Events
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE_SIZE = 1000
+DEFAULT_QUEUE_WORKERS = 8
+
+# set inside the queue's workers so events dispatched by handlers run straight away instead of queueing behind
+# the event that is waiting for them
+_in_worker: ContextVar[bool] = ContextVar("in_queue_worker", default=False)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class QueueMetrics:
+    depth: int = 0
+    max_depth: int = 0
+    processed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record_put(self, depth: int):
+        self.depth = depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def record_start(self, depth: int, wait: float):
+        self.depth = depth
+        self.processed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.processed if self.processed else 0.0
+
+    def __dict__(self) -> dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "average_wait": self.average_wait,
+            "max_wait": self.max_wait,
+        }
+
+
+class EventQueue:
+    """Runs events from a bounded priority queue on a fixed number of workers.
+
+    Lower priorities run first and events of the same priority run in order. Once max_size events are waiting
+    dispatch blocks until there is room. Events can also be limited to a number of concurrent runs, events over
+    their limit wait aside without holding a worker."""
+    _event_manager: Any = None
+    _queue: Optional[asyncio.PriorityQueue] = None
+    # a slot for every waiting event, queued or parked, so parked events still count against max_size
+    _slots: Optional[asyncio.Semaphore] = None
+    _workers: list[asyncio.Task] = None
+    _priorities: dict[str, Priority] = None
+    _limits: dict[str, int] = None
+    _running: dict[str, int] = None
+    # queue items of limited events that were taken while the event was at its limit, oldest first
+    _parked: dict[str, collections.deque] = None
+    metrics: QueueMetrics = None
+
+    def __init__(self, event_manager=None, max_size: int = DEFAULT_MAX_QUEUE_SIZE,
+                 num_workers: int = DEFAULT_QUEUE_WORKERS):
+        self._event_manager = event_manager if event_manager is not None else Events.EVENT_MANAGER
+        self._max_size = max_size
+        self._num_workers = num_workers
+        self._queue = None
+        self._slots = None
+        self._workers = []
+        self._priorities = {}
+        self._limits = {}
+        self._running = {}
+        self._parked = {}
+        self._order = itertools.count()
+        self.metrics = QueueMetrics()
+
+    def __len__(self):
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + sum(len(parked) for parked in self._parked.values())
+
+    def set_priority(self, name: str, priority: Priority):
+        self._priorities[name] = priority
+
+    def set_limit(self, name: str, max_concurrent: int):
+        self._limits[name] = max_concurrent
+
+    @staticmethod
+    def in_worker() -> bool:
+        return _in_worker.get()
+
+    async def dispatch(self, name: str, *args, **kwargs) -> list[Any]:
+        return await (await self.put(name, *args, **kwargs))
+
+    # waits for room in the queue and returns a future for the event's results
+    async def put(self, name: str, *args, **kwargs) -> asyncio.Future:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        priority = self._priorities.get(name, Priority.NORMAL)
+        if self._slots is not None:
+            await self._slots.acquire()
+        await self._queue.put((priority, next(self._order), time.monotonic(), name, args, kwargs, future))
+        self.metrics.record_put(len(self))
+        return future
+
+    # the queue is created on whichever loop dispatches first, which is the bot's loop in production
+    def _ensure_started(self):
+        if self._workers and not all(w.done() for w in self._workers):
+            return
+        self._queue = asyncio.PriorityQueue(self._max_size)
+        self._slots = asyncio.Semaphore(self._max_size) if self._max_size > 0 else None
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._num_workers)]
+
+    async def stop(self):
+        if self._queue is not None:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _at_limit(self, name: str) -> bool:
+        limit = self._limits.get(name)
+        return limit is not None and self._running.get(name, 0) >= limit
+
+    # a worker that finishes a limited event runs the next parked one, which takes the place it left
+    async def _work(self):
+        _in_worker.set(True)
+        while True:
+            item = await self._queue.get()
+            name = item[3]
+            if self._at_limit(name):
+                self._parked.setdefault(name, collections.deque()).append(item)
+                continue
+            while item is not None:
+                await self._run(item)
+                parked = self._parked.get(name)
+                item = parked.popleft() if parked and not self._at_limit(name) else None
+
+    async def _run(self, item: tuple):
+        _, _, enqueued, name, args, kwargs, future = item
+        self._running[name] = self._running.get(name, 0) + 1
+        if self._slots is not None:
+            self._slots.release()
+        self.metrics.record_start(len(self), time.monotonic() - enqueued)
+        try:
+            results = await self._event_manager.dispatch_event(name, *args, **kwargs)
+            if not future.done():
+                future.set_result(results)
+        except Exception as e:
+            # e.g. a TypeError from calling a handler with the wrong arguments
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._running[name] -= 1
+            self._queue.task_done()
@@ -2,6 +2,8 @@ import functools
 import logging
 from typing import Any
 
+from Events import BATCH_ATTRIBUTE, PAYLOADS_KEY
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,3 +21,37 @@ def check_argument(name: str, type_: type = Any):
         return wrapper_decorator
 
     return check_argument_wrapper
+
+
+# a normal dispatch_event is passed on as a batch of one so the handler only deals with payloads
+def batch_handler(func):
+    @functools.wraps(func)
+    def wrapper_decorator(*args, **kwargs):
+        if PAYLOADS_KEY not in kwargs:
+            kwargs = {PAYLOADS_KEY: [kwargs]}
+        return func(*args, **kwargs)
+
+    setattr(wrapper_decorator, BATCH_ATTRIBUTE, True)
+    return wrapper_decorator
+
+
+# check_argument for every payload of a batch handler, goes under batch_handler
+def check_payloads(name: str, type_: type = Any):
+    def check_payloads_wrapper(func):
+        @functools.wraps(func)
+        def wrapper_decorator(*args, **kwargs):
+            for payload in kwargs[PAYLOADS_KEY]:
+                if name not in payload:
+                    raise ValueError(f"payload {name} not provided to {func.__name__}")
+                if type_ is not Any and not isinstance(payload[name], type_):
+                    raise ValueError(f"payload {name} provided to {func.__name__} is not of required type "
+                                     f"{type_.__name__}")
+            return func(*args, **kwargs)
+
+        return wrapper_decorator
+
+    return check_payloads_wrapper
+
+
+def is_batch_handler(func) -> bool:
+    return getattr(func, BATCH_ATTRIBUTE, False)
@@ -3,6 +3,11 @@ import logging
 from typing import Callable, Any, Awaitable
 
 HANDLER_TYPE = Callable[[Any], Awaitable[Any]]
+FORWARDER_TYPE = Callable[[Any], Awaitable[list[Any]]]
+
+# handlers with this attribute set take every payload of a dispatch_batch in one call under the PAYLOADS_KEY kwarg
+BATCH_ATTRIBUTE = "handles_batches"
+PAYLOADS_KEY = "payloads"
 
 logger = logging.getLogger(__name__)
 
@@ -13,26 +18,72 @@ class _EventManager:
 
     def __init__(self):
         self._subscribers: dict[str, set[HANDLER_TYPE]] = {}
+        # precompiled from _subscribers whenever it changes so dispatching does not rebuild them
+        self._handlers: dict[str, tuple[HANDLER_TYPE, ...]] = {}
+        self._forwarders: dict[str, FORWARDER_TYPE] = {}
+        self._queue = None
 
     async def dispatch_event(self, name: str, *args, **kwargs) -> list[Any | BaseException]:
-        calls = [func(*args, **kwargs) for func in self._subscribers.get(name, set())]
+        if self._queue is not None and not self._queue.in_worker():
+            return await self._queue.dispatch(name, *args, **kwargs)
+        if name in self._forwarders:
+            return await self._forward_event(name, *args, **kwargs)
+
+        handlers = self._handlers.get(name, ())
+        if not handlers:
+            return []
+        if len(handlers) == 1:
+            # calling outside the try keeps TypeErrors from bad arguments propagating like the gather path
+            call = handlers[0](*args, **kwargs)
+            try:
+                return [await call]
+            except Exception as e:
+                self._log_exception(name, e)
+                return []
+
+        calls = [func(*args, **kwargs) for func in handlers]
         # return is mostly for testing, but it may be useful later
-        unsafe_results = list(await asyncio.gather(*calls, return_exceptions=True))
+        return await self._gather(name, calls)
+
+    # handlers that do not take batches are called once per payload
+    # batches run straight away, even with a queue set, so they skip its priorities and limits
+    async def dispatch_batch(self, name: str, payloads: list[dict[str, Any]], *args) -> list[Any | BaseException]:
+        if not payloads:
+            return []
+        if name in self._forwarders:
+            results = await asyncio.gather(*(self._forward_event(name, *args, **p) for p in payloads))
+            return [r for payload_results in results for r in payload_results]
+
+        calls = []
+        for func in self._handlers.get(name, ()):
+            if getattr(func, BATCH_ATTRIBUTE, False):
+                calls.append(func(*args, **{PAYLOADS_KEY: payloads}))
+            else:
+                calls.extend(func(*args, **p) for p in payloads)
+        return await self._gather(name, calls)
+
+    async def _gather(self, name: str, calls: list[Awaitable[Any]]) -> list[Any]:
+        unsafe_results = await asyncio.gather(*calls, return_exceptions=True)
         results = []
         for r in unsafe_results:
             if isinstance(r, Exception):
-                logger.error(f"Uncaught exception when processing event: {name}")
-                logger.error(f"{str(r)}")
+                self._log_exception(name, r)
             else:
                 results.append(r)
 
         return results
 
+    @staticmethod
+    def _log_exception(name: str, exception: Exception):
+        logger.error(f"Uncaught exception when processing event: {name}")
+        logger.error(f"{str(exception)}")
+
     def set_handler(self, name: str, func: HANDLER_TYPE) -> None:
         if name not in self._subscribers:
             self._subscribers[name] = set()
 
         self._subscribers[name].add(func)
+        self._handlers[name] = tuple(self._subscribers[name])
 
     def remove_handler(self, name: str, func: HANDLER_TYPE) -> None:
         if func not in self._subscribers.get(name, []):
@@ -41,9 +92,34 @@ class _EventManager:
         self._subscribers[name].remove(func)
         if not self._subscribers[name]:
             del self._subscribers[name]
+            del self._handlers[name]
+        else:
+            self._handlers[name] = tuple(self._subscribers[name])
+
+    # forwarded events are handled somewhere else (e.g. a worker process) and the forwarder returns its results
+    def set_forwarder(self, name: str, func: FORWARDER_TYPE) -> None:
+        self._forwarders[name] = func
+
+    def remove_forwarder(self, name: str) -> None:
+        self._forwarders.pop(name, None)
+
+    async def _forward_event(self, name: str, *args, **kwargs) -> list[Any]:
+        try:
+            return await self._forwarders[name](*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Failed to forward event: {name}")
+            logger.error(f"{str(e)}")
+            return []
+
+    # with a queue set, events dispatched outside of a handler wait their turn in it (see Events.EventQueue)
+    def set_queue(self, queue) -> None:
+        self._queue = queue
 
     def clear(self):
         self._subscribers = {}
+        self._handlers = {}
+        self._forwarders = {}
+        self._queue = None
 
 
 EVENT_MANAGER = _EventManager()
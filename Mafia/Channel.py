@@ -1,11 +1,12 @@
+import asyncio
 import logging
 import uuid
 
 import UI
-from ECS import World
-from ECS.ECSWrappers import query_component_loop
+from ECS import World, component
 from ECS.UtilityComponents import IntWrapper
-from Events.EventWrappers import check_argument
+from Events import PAYLOADS_KEY
+from Events.EventWrappers import check_argument, batch_handler, check_payloads
 
 logger = logging.getLogger(__name__)
 
@@ -14,36 +15,43 @@ class GameNotRunningException(Exception):
     pass
 
 
+@component
 class PlayerRole(IntWrapper):
     @classmethod
     def data_key(cls) -> str:
         return "role_id"
 
 
+@component
 class Guild(IntWrapper):  # pragma: no cover
     @classmethod
     def data_key(cls) -> str:
         return "guild_id"
 
 
+@component
 class Channel(IntWrapper):  # pragma: no cover
     @classmethod
     def data_key(cls) -> str:
         return "channel_id"
 
 
+@component
 class AnnouncementChannel(Channel):
     pass
 
 
+@component
 class PlayerCategory(Channel):
     pass
 
 
+@component
 class PlayerChannel(Channel):
     pass
 
 
+@component
 class PlayerCommandChannel(Channel):
     pass
 
@@ -55,22 +63,25 @@ async def register_channel(world: World, *args, **kwargs):
 
 
 @check_argument("message", str)
-@query_component_loop("channels", None, Channel)
 async def send_message(world: World, *args, **kwargs):
-    await UI.send_message(kwargs["message"], kwargs["channels"][Channel].data)
+    channel_ids = [row[Channel].data for _, row in await world.query_component_rows_async(Channel)]
+    return await UI.broadcast_message(kwargs["message"], *channel_ids)
 
 
-@check_argument("uuid", uuid.UUID)
+@batch_handler
+@check_payloads("uuid", uuid.UUID)
 async def delete_player_role(world: World, *args, **kwargs):
-    components = world.get_components(kwargs["uuid"], Guild, PlayerRole)
-    if PlayerRole not in components or Guild not in components:
-        return
-    await UI.delete_role(components[Guild].data, components[PlayerRole].data)
+    roles = []
+    for payload in kwargs[PAYLOADS_KEY]:
+        components = await world.get_components_async(payload["uuid"], Guild, PlayerRole)
+        if PlayerRole in components and Guild in components:
+            roles.append((components[Guild].data, components[PlayerRole].data))
+    await asyncio.gather(*(UI.delete_role(guild, role) for guild, role in roles))
 
 
 @check_argument("uuid", uuid.UUID)
 async def create_player_role(world: World, *args, **kwargs):
-    components = world.get_components(kwargs["uuid"], Guild)
+    components = await world.get_components_async(kwargs["uuid"], Guild)
     if Guild not in components:
         return
     world.add_components(kwargs["uuid"], PlayerRole(await UI.make_role("player", components[Guild].data)))
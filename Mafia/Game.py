@@ -1,13 +1,16 @@
 import logging
 import uuid
 from typing import Self
+from uuid import UUID
 
-from ECS import Component
+from ECS import Component, component, field
 
 logger = logging.getLogger(__name__)
 
 
+@component
 class GameMeta(Component):
+    uuid: UUID = field(key="id")
 
     def __init__(self, uuid_: int = 0):
         super().__init__()
@@ -21,16 +24,6 @@ class GameMeta(Component):
                 uuid_ = uuid.uuid4()
         self.uuid = uuid_
 
-    def __dict__(self):
-        return {
-            "id": self.uuid
-        }
-
-    def __eq__(self, other):
-        if type(other) != type(self):
-            return False
-        return self.uuid == other.uuid
-
     @classmethod
     def from_dict(cls, data: dict) -> Self:
         return cls(int(data["id"]))
@@ -1,41 +1,28 @@
 import logging
 import uuid
-from typing import Self
 
 import Events
 import UI
-from ECS import Component, World
-from ECS.ECSWrappers import query_entity_component_loop, StopProcess, query
-from Events import EventList
-from Events.EventWrappers import check_argument
+from ECS import Component, World, component, field
+from ECS.ECSWrappers import query, lookup
+from Events import EventList, PAYLOADS_KEY
+from Events.EventWrappers import check_argument, batch_handler, check_payloads
 from Mafia import Guild, GameMeta
 from Mafia.Channel import PlayerChannel, PlayerCommandChannel, PlayerCategory, PlayerRole, GameNotRunningException
 
 logger = logging.getLogger(__name__)
 
 
+@component
 class DiscordUser(Component):
+    discord_id: int
+    display_name: str = field(compare=False)
 
     def __init__(self, user_id: int, display_name: str):
         super().__init__()
         self.discord_id = user_id
         self.display_name = display_name
 
-    def __dict__(self):
-        return {
-            "discord_id": self.discord_id,
-            "display_name": self.display_name
-        }
-
-    def __eq__(self, other):
-        if type(self) != type(other):
-            return False
-        return self.discord_id == other.discord_id
-
-    @classmethod
-    def from_dict(cls, data: dict) -> Self:
-        return cls(data["discord_id"], data["display_name"])
-
 
 @check_argument("discord_id", int)
 @check_argument("display_name", str)
@@ -47,51 +34,62 @@ async def register_user(world: World, *args, **kwargs):
     logger.info(f"Registered {display_name}")
 
 
-@check_argument("entity_id", uuid.UUID)
+@batch_handler
+@check_payloads("entity_id", uuid.UUID)
 @query("game", GameMeta, Guild)
 async def make_channels(world: World, *args, **kwargs):
-    user_id = kwargs["entity_id"]
-    user: DiscordUser = world.get_components(user_id, DiscordUser)[DiscordUser]
     guild: Guild = world.get_components(list(kwargs["game"])[0], Guild)[Guild]
-    channels = await UI.make_player_channels(user.display_name, user.discord_id, guild.data)
-    world.add_components(user_id, PlayerChannel(channels[0]), PlayerCommandChannel(channels[1]),
-                         PlayerCategory(channels[2]))
+    users: dict[int, uuid.UUID] = {}
+    players = []
+    for payload in kwargs[PAYLOADS_KEY]:
+        user: DiscordUser = (await world.get_components_async(payload["entity_id"], DiscordUser))[DiscordUser]
+        users[user.discord_id] = payload["entity_id"]
+        players.append((user.display_name, user.discord_id))
+
+    results = await UI.make_player_channels_batch(guild.data, *players)
+    for discord_id, channels in results.items():
+        # failed players hold the error message, it is logged by the front end
+        if isinstance(channels, str):
+            continue
+        world.add_components(users[discord_id], PlayerChannel(channels[0]), PlayerCommandChannel(channels[1]),
+                             PlayerCategory(channels[2]))
 
 
 @check_argument("discord_id", int)
-@query_entity_component_loop("users", any, DiscordUser)
+@lookup("users", DiscordUser, discord_id="discord_id")
 async def unregister_user(world: World, *args, **kwargs):
-    user_id = kwargs["users"][0]
-    user: DiscordUser = kwargs["users"][1][DiscordUser]
-    if user.discord_id == kwargs["discord_id"]:
-        logger.info(f"Removing user {user.display_name}")
-        await Events.EVENT_MANAGER.dispatch_event(EventList.LEAVE_USER, entity_id=user_id)
-        world.remove_entity(user_id)
-        raise StopProcess(True)
-    return False
+    if len(kwargs["users"]) < 1:
+        return False
+    user_id = next(iter(kwargs["users"]))
+    user: DiscordUser = world.get_components(user_id, DiscordUser)[DiscordUser]
+    logger.info(f"Removing user {user.display_name}")
+    await Events.EVENT_MANAGER.dispatch_event(EventList.LEAVE_USER, entity_id=user_id)
+    world.remove_entity(user_id)
+    return True
 
 
-@check_argument("entity_id", uuid.UUID)
+@batch_handler
+@check_payloads("entity_id", uuid.UUID)
 @query("game", GameMeta, Guild)
 async def remove_user_channels(world: World, *args, **kwargs):
-    entity = world.get_components(kwargs["entity_id"], PlayerChannel, PlayerCommandChannel, PlayerCategory)
     guild_id = world.get_components(list(kwargs["game"])[0], Guild)[Guild].data
     channels = []
-    if PlayerCategory in entity:
-        channels.append(entity[PlayerCategory].data)
-    if PlayerChannel in entity:
-        channels.append(entity[PlayerChannel].data)
-    if PlayerCommandChannel in entity:
-        channels.append(entity[PlayerCommandChannel].data)
+    for payload in kwargs[PAYLOADS_KEY]:
+        entity = await world.get_components_async(payload["entity_id"], PlayerChannel, PlayerCommandChannel,
+                                                  PlayerCategory)
+        if PlayerCategory in entity:
+            channels.append(entity[PlayerCategory].data)
+        if PlayerChannel in entity:
+            channels.append(entity[PlayerChannel].data)
+        if PlayerCommandChannel in entity:
+            channels.append(entity[PlayerCommandChannel].data)
     await UI.remove_channels(guild_id, *channels)
 
 
 @check_argument("user", int)
-@query_entity_component_loop("users", any, DiscordUser)
+@lookup("users", DiscordUser, discord_id="user")
 async def check_user_exists(world: World, *args, **kwargs):
-    user_id = kwargs["user"]
-    user: DiscordUser = kwargs["users"][1][DiscordUser]
-    return user.discord_id == user_id
+    return len(kwargs["users"]) > 0
 
 
 @check_argument("entity_id", uuid.UUID)
@@ -99,7 +97,7 @@ async def check_user_exists(world: World, *args, **kwargs):
 async def add_player_role(world: World, *args, **kwargs):
     if len(kwargs["game"]) < 1:
         raise GameNotRunningException
-    user_id = world.get_components(kwargs["entity_id"], DiscordUser)[DiscordUser].discord_id
+    user_id = (await world.get_components_async(kwargs["entity_id"], DiscordUser))[DiscordUser].discord_id
     game_uuid = list(kwargs["game"])[0]
     game = world.get_components(game_uuid, Guild, PlayerRole)
     guild_id = game[Guild].data
@@ -112,7 +110,7 @@ async def add_player_role(world: World, *args, **kwargs):
 async def remove_player_role(world: World, *args, **kwargs):
     if len(kwargs["game"]) < 1:
         raise GameNotRunningException
-    user_id = world.get_components(kwargs["entity_id"], DiscordUser)[DiscordUser].discord_id
+    user_id = (await world.get_components_async(kwargs["entity_id"], DiscordUser))[DiscordUser].discord_id
     game_uuid = list(kwargs["game"])[0]
     game = world.get_components(game_uuid, Guild, PlayerRole)
     guild_id = game[Guild].data
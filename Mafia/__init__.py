@@ -1,11 +1,18 @@
 import logging
 import uuid
+from functools import partial
+from typing import Optional, Callable
 
 import ECS
 import Events.EventList
 import Storage
-from ECS import World
-from ECS.ECSWrappers import query, query_entity_loop, query_component_loop, StopProcess, query_entity_component_loop
+from ECS import World, CachePolicy
+from ECS.WorldManager import WorldManager
+from ECS.WorkerPool import WorkerPool
+from Storage.Backend import StorageBackend, as_update
+from Storage.WriteBehind import DEFAULT_MAX_STALENESS, DEFAULT_MAX_BATCH_SIZE
+from ECS.ECSWrappers import query, lookup
+from Events.EventQueue import EventQueue, Priority, DEFAULT_MAX_QUEUE_SIZE, DEFAULT_QUEUE_WORKERS
 from Events.EventWrappers import check_argument
 from Mafia.Channel import Guild, Channel, AnnouncementChannel, send_message, register_channel, PlayerRole, \
     delete_player_role, create_player_role
@@ -26,27 +33,6 @@ def register_mafia_components():  # pragma: no cover
     ECS.add_component_mapping(GameMeta)
 
 
-def setup_world() -> World:  # pragma: no cover
-    world_ = World()
-    world_.register_processor_events(send_message, Events.EventList.SEND_MESSAGE_EVENT)
-    world_.register_processor_events(register_channel, Events.EventList.REGISTER_CHANNEL_EVENT)
-    world_.register_processor_events(register_user, Events.EventList.REGISTER_DISCORD_USER_EVENT)
-    world_.register_processor_events(unregister_user, Events.EventList.UNREGISTER_DISCORD_USER_EVENT)
-    world_.register_processor_events(create_game, Events.EventList.CREATE_GAME_EVENT)
-    world_.register_processor_events(remove_game, Events.EventList.REMOVE_GAME_EVENT)
-    world_.register_processor_events(remove_games, Events.EventList.REMOVE_ALL_GAMES_EVENT)
-    world_.register_processor_events(game_exists, Events.EventList.CHECK_GAME_EXISTS)
-    world_.register_processor_events(make_channels, Events.EventList.JOIN_USER)
-    world_.register_processor_events(add_player_role, Events.EventList.JOIN_USER)
-    world_.register_processor_events(check_user_exists, Events.EventList.CHECK_USER_EXIST)
-    world_.register_processor_events(remove_user_channels, Events.EventList.LEAVE_USER)
-    world_.register_processor_events(remove_player_role, Events.EventList.LEAVE_USER)
-    world_.register_processor_events(delete_player_role, Events.EventList.PRE_REMOVE_GAME_EVENT)
-    world_.register_processor_events(create_player_role, Events.EventList.PRE_CREATE_GAME_EVENT)
-    world_.add_entities(*Storage.load_all_entities())
-    return world_
-
-
 @check_argument("guild", int)
 @query("games", GameMeta, Guild)
 async def create_game(world: World, *args, **kwargs):
@@ -63,35 +49,186 @@ async def create_game(world: World, *args, **kwargs):
     return True
 
 
-@query_entity_loop("games", sum, GameMeta)
+@query("games", GameMeta)
 async def remove_games(world: World, *args, **kwargs):
-    entity_id = kwargs["games"]
-    components = world.get_components(entity_id, GameMeta, Guild, PlayerRole)
-    await Events.EVENT_MANAGER.dispatch_event(Events.EventList.PRE_REMOVE_GAME_EVENT, uuid=entity_id)
-    world.remove_entity(entity_id)
-    return 1
+    game_ids = list(kwargs["games"])
+    if not game_ids:
+        return 0
+    await Events.EVENT_MANAGER.dispatch_batch(Events.EventList.PRE_REMOVE_GAME_EVENT,
+                                              [{"uuid": game_id} for game_id in game_ids])
+    for game_id in game_ids:
+        world.remove_entity(game_id)
+    return len(game_ids)
 
 
 @check_argument("guild", int)
-@query_entity_component_loop("games", any, GameMeta, Guild)
+@lookup("games", Guild, GameMeta, data="guild")
 async def remove_game(world: World, *args, **kwargs):
-    guild_id: int = kwargs["guild"]
-    game_id: uuid = kwargs["games"][0]
-    guild: Guild = kwargs["games"][1][Guild]
-
-    if guild.data != guild_id:
-        return
+    if len(kwargs["games"]) < 1:
+        return False
+    game_id: uuid = next(iter(kwargs["games"]))
 
-    components = world.get_components(game_id, GameMeta, Guild, PlayerRole)
     await Events.EVENT_MANAGER.dispatch_event(Events.EventList.PRE_REMOVE_GAME_EVENT, uuid=game_id)
     world.remove_entity(game_id)
-    raise StopProcess(True)
+    return True
 
 
 @check_argument("guild", int)
-@query_component_loop("games", any, GameMeta, Guild)
+@lookup("games", Guild, GameMeta, data="guild")
 async def game_exists(world: World, *args, **kwargs):
-    guild_id: int = kwargs["guild"]
-    guild: Guild = kwargs["games"][Guild]
-    if guild.data == guild_id:
-        raise StopProcess(True)
+    return len(kwargs["games"]) > 0
+
+
+PROCESSOR_EVENTS = (
+    (send_message, Events.EventList.SEND_MESSAGE_EVENT),
+    (register_channel, Events.EventList.REGISTER_CHANNEL_EVENT),
+    (register_user, Events.EventList.REGISTER_DISCORD_USER_EVENT),
+    (unregister_user, Events.EventList.UNREGISTER_DISCORD_USER_EVENT),
+    (create_game, Events.EventList.CREATE_GAME_EVENT),
+    (remove_game, Events.EventList.REMOVE_GAME_EVENT),
+    (remove_games, Events.EventList.REMOVE_ALL_GAMES_EVENT),
+    (game_exists, Events.EventList.CHECK_GAME_EXISTS),
+    (make_channels, Events.EventList.JOIN_USER),
+    (add_player_role, Events.EventList.JOIN_USER),
+    (check_user_exists, Events.EventList.CHECK_USER_EXIST),
+    (remove_user_channels, Events.EventList.LEAVE_USER),
+    (remove_player_role, Events.EventList.LEAVE_USER),
+    (delete_player_role, Events.EventList.PRE_REMOVE_GAME_EVENT),
+    (create_player_role, Events.EventList.PRE_CREATE_GAME_EVENT),
+)
+
+# UI functions the processors call, in a worker process these are sent back to the front end
+UI_CALLS = (
+    "UI.broadcast_message",
+    "UI.make_role",
+    "UI.delete_role",
+    "UI.assign_role",
+    "UI.remove_role",
+    "UI.make_player_channels",
+    "UI.make_player_channels_batch",
+    "UI.remove_channels",
+)
+
+# events not listed here are Priority.NORMAL
+EVENT_PRIORITIES = {
+    Events.EventList.CHECK_GAME_EXISTS: Priority.INTERACTIVE,
+    Events.EventList.CHECK_USER_EXIST: Priority.INTERACTIVE,
+    Events.EventList.REGISTER_DISCORD_USER_EVENT: Priority.INTERACTIVE,
+    Events.EventList.UNREGISTER_DISCORD_USER_EVENT: Priority.INTERACTIVE,
+    Events.EventList.REMOVE_ALL_GAMES_EVENT: Priority.BACKGROUND,
+}
+
+# joining and leaving make several discord api calls each
+EVENT_LIMITS = {
+    Events.EventList.REGISTER_DISCORD_USER_EVENT: 4,
+    Events.EventList.UNREGISTER_DISCORD_USER_EVENT: 4,
+}
+
+# combines the results of processors that run on every shard
+PROCESSOR_AGGREGATORS = {
+    remove_games: sum,
+}
+
+
+def create_world(shard_id: Optional[int] = None, max_staleness: float = DEFAULT_MAX_STALENESS,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, lazy: bool = False,
+                 max_resident: Optional[int] = None, snapshot_path: Optional[str] = None,
+                 log_path: Optional[str] = None) -> World:  # pragma: no cover
+    world_ = World(shard_id)
+    if log_path is not None:
+        # each shard keeps its own log so they can be compacted independently
+        world_.enable_write_ahead_log(log_path if shard_id is None else f"{log_path}.{shard_id}")
+    else:
+        world_.enable_write_behind(max_staleness, max_batch_size)
+    if lazy:
+        # games are few and touched by most commands so they always stay loaded
+        world_.enable_lazy_loading(CachePolicy(max_resident, GameMeta))
+    world_.add_index(DiscordUser, "discord_id")
+    world_.add_index(Guild, "data")
+    if not lazy and (snapshot_path is None or not world_.load_snapshot(snapshot_path)):
+        world_.load_entities()
+    return world_
+
+
+def setup_world(max_staleness: float = DEFAULT_MAX_STALENESS, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                lazy: bool = False, max_resident: Optional[int] = None, snapshot_path: Optional[str] = None,
+                log_path: Optional[str] = None) -> World:  # pragma: no cover
+    world_ = create_world(None, max_staleness, max_batch_size, lazy, max_resident, snapshot_path, log_path)
+    for processor, event in PROCESSOR_EVENTS:
+        world_.register_processor_events(processor, event)
+    return world_
+
+
+class UnshardedEntitiesError(RuntimeError):
+    pass
+
+
+# worlds saved unsharded never wrote a shard and sharded worlds only load their own, so run this once before
+# going sharded. games move to their guild's shard, the other entities only when there is a single guild to
+# put them in, otherwise nothing is written and the entities are reported instead of hidden
+def shard_unsharded_entities(batch_size: int = Storage.DEFAULT_LOAD_BATCH_SIZE) -> int:
+    unsharded = [d for batch in Storage.iter_entities(None, batch_size) for d in batch if d.get("shard") is None]
+    guilds = {d["id"]: Guild.from_dict(d["components"][Guild.__name__]).data
+              for d in unsharded if Guild.__name__ in d.get("components", {})}
+    rest = [d["id"] for d in unsharded if d["id"] not in guilds]
+    if rest and len(set(guilds.values())) != 1:
+        raise UnshardedEntitiesError(f"{len(rest)} entities have no shard and no single guild to take it from, "
+                                     f"set their shard or run unsharded: {rest[:10]}")
+    shards = {**guilds, **dict.fromkeys(rest, next(iter(guilds.values()), None))}
+    if shards:
+        Storage.apply_mutations(as_update({"$set": {"id": id_, "shard": shard}}) for id_, shard in shards.items())
+        logger.info(f"Moved {len(shards)} unsharded entities to their guild's shard")
+    return len(shards)
+
+
+# one world per guild, loaded the first time the guild sends an event
+def setup_world_manager(max_staleness: float = DEFAULT_MAX_STALENESS, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                        lazy: bool = False, max_resident: Optional[int] = None,
+                        log_path: Optional[str] = None) -> WorldManager:  # pragma: no cover
+    manager = WorldManager(partial(create_world, max_staleness=max_staleness, max_batch_size=max_batch_size,
+                                   lazy=lazy, max_resident=max_resident, log_path=log_path))
+    for processor, event in PROCESSOR_EVENTS:
+        manager.register_processor_events(processor, event, aggregator=PROCESSOR_AGGREGATORS.get(processor))
+    if not lazy:
+        for shard_id in Storage.list_shards() or ():
+            manager.load_shard(shard_id)
+    return manager
+
+
+# runs in each worker process, which starts with nothing configured
+# make_backend is pickled to the worker, so a backend class or a partial of one, and each worker makes its own
+def setup_worker(make_backend: Callable[[], StorageBackend], max_workers: int = Storage.DEFAULT_MAX_WORKERS,
+                 max_staleness: float = DEFAULT_MAX_STALENESS, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 lazy: bool = False, max_resident: Optional[int] = None,
+                 require_indexes: bool = True) -> WorldManager:  # pragma: no cover
+    Storage.configure_backend(make_backend())
+    Storage.configure_executor(max_workers)
+    Storage.require_indexes(require_indexes)
+    register_mafia_components()
+    manager = setup_world_manager(max_staleness, max_batch_size, lazy, max_resident)
+    Storage.ensure_indexes()
+    return manager
+
+
+# hosts the shards in worker processes and forwards the processor events to them
+def setup_worker_pool(num_workers: int, make_backend: Callable[[], StorageBackend],
+                      max_workers: int = Storage.DEFAULT_MAX_WORKERS,
+                      max_staleness: float = DEFAULT_MAX_STALENESS, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                      lazy: bool = False, max_resident: Optional[int] = None,
+                      require_indexes: bool = True) -> WorkerPool:  # pragma: no cover
+    pool = WorkerPool(partial(setup_worker, make_backend, max_workers, max_staleness, max_batch_size, lazy,
+                              max_resident, require_indexes), num_workers, UI_CALLS)
+    pool.start()
+    pool.register_events(*{event for _, event in PROCESSOR_EVENTS})
+    return pool
+
+
+def setup_event_queue(max_size: int = DEFAULT_MAX_QUEUE_SIZE,
+                      num_workers: int = DEFAULT_QUEUE_WORKERS) -> EventQueue:  # pragma: no cover
+    queue = EventQueue(Events.EVENT_MANAGER, max_size, num_workers)
+    for event, priority in EVENT_PRIORITIES.items():
+        queue.set_priority(event, priority)
+    for event, limit in EVENT_LIMITS.items():
+        queue.set_limit(event, limit)
+    Events.EVENT_MANAGER.set_queue(queue)
+    return queue
@@ -0,0 +1,155 @@
+import copy
+import uuid
+from datetime import datetime, timezone
+from typing import Optional, Iterable, Iterator, Any
+
+DEFAULT_LOAD_BATCH_SIZE = 500
+# set by the backend on every write so changes since a point in time can be found
+SAVED_AT_KEY = "saved_at"
+
+# every write and load filters on id, so the stores refuse to run them without this index
+ID_INDEX = "id"
+# the index paths every backend keeps, mapped to whether the index is unique
+BASE_INDEXES = {ID_INDEX: True, "shard": False, SAVED_AT_KEY: False}
+
+INDEX_READY = "ready"
+INDEX_CREATED = "created"
+INDEX_MISSING = "missing"
+INDEX_FAILED = "failed"
+
+
+class MissingIndexError(RuntimeError):
+    pass
+
+
+class DuplicateEntityIdError(RuntimeError):
+    pass
+
+
+# entity_data is either a whole entity document or an update document made of $set and $unset
+def as_update(entity_data: dict) -> tuple[uuid, dict]:
+    update = entity_data if any(k.startswith("$") for k in entity_data) else {"$set": entity_data}
+    if "id" not in update.get("$set", {}):
+        raise KeyError("entity_data must have id field")
+    return update["$set"]["id"], {**update, "$currentDate": {SAVED_AT_KEY: True}}
+
+
+# the time stamped into saved_at by backends without a database clock, naive utc like mongo returns
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _parent(doc: dict, path: str, create: bool) -> tuple[Optional[dict], str]:
+    *parents, key = path.split(".")
+    for p in parents:
+        if p not in doc:
+            if not create:
+                return None, key
+            doc[p] = {}
+        doc = doc[p]
+    return doc, key
+
+
+# applies the $set, $unset and $currentDate of an update document to a plain document in place
+def apply_update(doc: dict, update: dict, now: datetime) -> dict:
+    for path, value in update.get("$set", {}).items():
+        parent, key = _parent(doc, path, True)
+        parent[key] = copy.deepcopy(value)
+    for path in update.get("$unset", {}):
+        parent, key = _parent(doc, path, False)
+        if parent is not None:
+            parent.pop(key, None)
+    for path in update.get("$currentDate", {}):
+        parent, key = _parent(doc, path, True)
+        parent[key] = now
+    return doc
+
+
+# where maps "<component type>.<key>" paths to the value that stored field must equal
+# like mongo a missing field equals None
+def matches(doc: dict, where: Optional[dict[str, Any]]) -> bool:
+    if not where:
+        return True
+    for path, value in where.items():
+        parent, key = _parent(doc.get("components", {}), path, False)
+        if (parent.get(key) if parent is not None else None) != value:
+            return False
+    return True
+
+
+# the paths of the base indexes and of the component fields, which are "<component type>.<key>" like in where
+def index_paths(fields: Iterable[str]) -> dict[str, bool]:
+    return {**BASE_INDEXES, **{f"components.{field}": False for field in fields}}
+
+
+def project(doc: dict, components: Optional[Iterable[str]]) -> dict:
+    if components is None:
+        return doc
+    projected = {k: doc[k] for k in ("id", "shard") if k in doc}
+    projected["components"] = {c: doc["components"][c] for c in components if c in doc.get("components", {})}
+    return projected
+
+
+def batched(docs: Iterable[dict], batch_size: int) -> Iterator[list[dict]]:
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StorageBackend:
+    """Where entity documents are kept. The functions of the Storage module run on the configured backend.
+
+    Documents look like {"id": uuid, "components": {name: data}, "shard": int, "saved_at": datetime}. Updates are
+    made of $set and $unset on dotted paths, plus $currentDate for saved_at, and upsert. Methods return None after
+    logging a database error, like the rest of Storage."""
+
+    def save_entity(self, uuid_: uuid, update: dict) -> Optional[bool]:
+        raise NotImplementedError
+
+    def remove_entity(self, uuid_: uuid) -> Optional[bool]:
+        raise NotImplementedError
+
+    # the updates and removals can be applied in any order
+    def bulk_write(self, updates: list[tuple[uuid, dict]], removed: list[uuid]) -> Optional[bool]:
+        raise NotImplementedError
+
+    # applied in order, an update of None removes the entity
+    def apply_mutations(self, mutations: list[tuple[uuid, Optional[dict]]]) -> Optional[bool]:
+        raise NotImplementedError
+
+    def load_entity(self, uuid_: uuid) -> Optional[dict]:
+        raise NotImplementedError
+
+    def iter_entities(self, shard: Optional[int], batch_size: int, components: Optional[list[str]],
+                      since: Optional[datetime]) -> Iterator[list[dict]]:
+        raise NotImplementedError
+
+    # where is as for matches
+    def find_entities(self, component_types: list[str], shard: Optional[int],
+                      where: Optional[dict[str, Any]]) -> Optional[tuple[dict, ...]]:
+        raise NotImplementedError
+
+    def list_entity_ids(self, shard: Optional[int]) -> Optional[set[uuid]]:
+        raise NotImplementedError
+
+    def list_shards(self) -> Optional[list[int]]:
+        raise NotImplementedError
+
+    # maps each index path to its status, backends that build their indexes when created have them all ready
+    def index_status(self, fields: list[str]) -> dict[str, str]:
+        return dict.fromkeys(index_paths(fields), INDEX_READY)
+
+    # builds the missing indexes and reports the status of each one like index_status
+    def ensure_indexes(self, fields: list[str]) -> dict[str, str]:
+        return self.index_status(fields)
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
@@ -0,0 +1,77 @@
+import copy
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional, Iterator, Any
+
+from Storage.Backend import StorageBackend, SAVED_AT_KEY, apply_update, matches, project, batched, utc_now
+
+
+class MemoryBackend(StorageBackend):
+    """Keeps the entities in a dict, for tests and runs that do not need them to outlive the process.
+
+    Documents are copied on the way in and out so changes to them only reach the backend through updates."""
+    _documents: dict[uuid, dict] = None
+    _lock: threading.Lock = None
+
+    def __init__(self):
+        self._documents = {}
+        # the storage executor calls in from several threads
+        self._lock = threading.Lock()
+
+    def save_entity(self, uuid_: uuid, update: dict) -> Optional[bool]:
+        with self._lock:
+            self._update(uuid_, update, utc_now())
+        return True
+
+    def remove_entity(self, uuid_: uuid) -> Optional[bool]:
+        with self._lock:
+            self._documents.pop(uuid_, None)
+        return True
+
+    def bulk_write(self, updates: list[tuple[uuid, dict]], removed: list[uuid]) -> Optional[bool]:
+        return self.apply_mutations([*updates, *((uuid_, None) for uuid_ in removed)])
+
+    def apply_mutations(self, mutations: list[tuple[uuid, Optional[dict]]]) -> Optional[bool]:
+        now = utc_now()
+        with self._lock:
+            for uuid_, update in mutations:
+                if update is None:
+                    self._documents.pop(uuid_, None)
+                else:
+                    self._update(uuid_, update, now)
+        return True
+
+    def _update(self, uuid_: uuid, update: dict, now: datetime):
+        apply_update(self._documents.setdefault(uuid_, {"id": uuid_}), update, now)
+
+    def load_entity(self, uuid_: uuid) -> Optional[dict]:
+        with self._lock:
+            return copy.deepcopy(self._documents.get(uuid_))
+
+    def iter_entities(self, shard: Optional[int], batch_size: int, components: Optional[list[str]],
+                      since: Optional[datetime]) -> Iterator[list[dict]]:
+        with self._lock:
+            documents = [copy.deepcopy(project(doc, components)) for doc in self._documents.values()
+                         if (shard is None or doc.get("shard") == shard)
+                         and (since is None or doc.get(SAVED_AT_KEY, datetime.min) > since)]
+        yield from batched(documents, batch_size)
+
+    def find_entities(self, component_types: list[str], shard: Optional[int],
+                      where: Optional[dict[str, Any]]) -> Optional[tuple[dict, ...]]:
+        with self._lock:
+            return tuple(copy.deepcopy(doc) for doc in self._documents.values()
+                         if (shard is None or doc.get("shard") == shard)
+                         and all(c in doc.get("components", {}) for c in component_types) and matches(doc, where))
+
+    def list_entity_ids(self, shard: Optional[int]) -> Optional[set[uuid]]:
+        with self._lock:
+            return {u for u, doc in self._documents.items() if shard is None or doc.get("shard") == shard}
+
+    def list_shards(self) -> Optional[list[int]]:
+        with self._lock:
+            return list({doc["shard"] for doc in self._documents.values() if doc.get("shard") is not None})
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
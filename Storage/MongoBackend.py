@@ -0,0 +1,220 @@
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Optional, Iterator, Any
+
+from pymongo import MongoClient, collection, UpdateOne, DeleteOne, DESCENDING
+from pymongo.errors import PyMongoError, DuplicateKeyError
+
+from Storage.Backend import StorageBackend, SAVED_AT_KEY, INDEX_READY, INDEX_CREATED, INDEX_MISSING, INDEX_FAILED, \
+    DuplicateEntityIdError, batched, index_paths
+
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 27017
+
+logger = logging.getLogger(__name__)
+
+# one client per server, shared by every backend using it
+_clients: dict[tuple[str, int], MongoClient] = {}
+
+
+def _client(host: str, port: int) -> MongoClient:
+    if (host, port) not in _clients:
+        _clients[(host, port)] = MongoClient(host, port, uuidRepresentation="standard")
+    return _clients[(host, port)]
+
+
+def _shard_filter(shard: Optional[int]) -> dict:
+    return {} if shard is None else {"shard": shard}
+
+
+class MongoBackend(StorageBackend):
+    """Keeps the entities in a mongo collection. Nothing connects until the first request."""
+    database_name: str = None
+    collection_name: str = None
+    host: str = None
+    port: int = None
+    _indexed: set[str] = None
+
+    def __init__(self, database_name: str, collection_name: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.host = host
+        self.port = port
+        self._indexed = set()
+
+    # creating an index that exists is cheap for mongo but still a round trip, so each path is only sent once
+    def ensure_index(self, path: str, sparse: bool = False, unique: bool = False):
+        if path in self._indexed:
+            return
+        self.collection().create_index(path, sparse=sparse, unique=unique)
+        self._indexed.add(path)
+
+    # the single field indexes of the collection by path, a unique one first, compound indexes do not serve the stores
+    def _existing_indexes(self) -> dict[str, tuple[str, dict]]:
+        existing = {}
+        for name, info in self.collection().index_information().items():
+            if len(info["key"]) != 1:
+                continue
+            path = info["key"][0][0]
+            if path not in existing or info.get("unique"):
+                existing[path] = (name, info)
+        return existing
+
+    def index_status(self, fields: list[str]) -> dict[str, str]:
+        try:
+            existing = self._existing_indexes()
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            return dict.fromkeys(index_paths(fields), INDEX_FAILED)
+        return {path: INDEX_READY if path in existing and (not unique or existing[path][1].get("unique"))
+                else INDEX_MISSING for path, unique in index_paths(fields).items()}
+
+    # raises DuplicateEntityIdError when a unique index cannot be built because stored ids are duplicated
+    def ensure_indexes(self, fields: list[str]) -> dict[str, str]:
+        status = self.index_status(fields)
+        try:
+            existing = self._existing_indexes()
+        except PyMongoError:  # pragma: no cover
+            return status
+        for path, unique in index_paths(fields).items():
+            if status[path] == INDEX_READY:
+                self._indexed.add(path)
+                continue
+            try:
+                start = time.perf_counter()
+                if path in existing:
+                    self._rebuild_unique(path, existing[path][0])
+                else:
+                    self.ensure_index(path, unique=unique)
+                logger.info(f"Built index on {path} in {time.perf_counter() - start:.2f}s")
+                status[path] = INDEX_CREATED
+            except DuplicateKeyError:
+                duplicates = ", ".join(str(id_) for id_ in self._duplicates(path))
+                raise DuplicateEntityIdError(f"Cannot build a unique index on {path}, these values are stored more "
+                                             f"than once: {duplicates}")
+            except PyMongoError as e:
+                logger.error(f"Failed to build index on {path}: {e}")
+                status[path] = INDEX_FAILED
+        return status
+
+    # the unique index is built next to the old one, keyed the other way so mongo allows both, and the old one is
+    # only dropped once it exists so the collection is never left without an index on the path
+    def _rebuild_unique(self, path: str, old_name: str):
+        logger.warning(f"Rebuilding index on {path} as unique")
+        self.collection().create_index([(path, DESCENDING)], unique=True, name=f"{path}_unique")
+        self.collection().drop_index(old_name)
+        self._indexed.add(path)
+
+    def _duplicates(self, path: str, limit: int = 10) -> list:
+        pipeline = [{"$group": {"_id": f"${path}", "count": {"$sum": 1}}}, {"$match": {"count": {"$gt": 1}}},
+                    {"$limit": limit}]
+        return [doc["_id"] for doc in self.collection().aggregate(pipeline)]
+
+    def collection(self) -> collection:
+        return _client(self.host, self.port).get_database(self.database_name).get_collection(self.collection_name)
+
+    def save_entity(self, uuid_: uuid, update: dict) -> Optional[bool]:
+        try:
+            self.collection().update_one({"id": uuid_}, update, upsert=True)
+            return True
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"Entity update: {update}")
+            # close app
+
+    def remove_entity(self, uuid_: uuid) -> Optional[bool]:
+        try:
+            self.collection().delete_one({"id": uuid_})
+            return True
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"Failed to delete entity with id: {uuid_}")
+            # close app
+
+    def bulk_write(self, updates: list[tuple[uuid, dict]], removed: list[uuid]) -> Optional[bool]:
+        operations = [UpdateOne({"id": uuid_}, update, upsert=True) for uuid_, update in updates]
+        operations.extend(DeleteOne({"id": uuid_}) for uuid_ in removed)
+        return self._bulk_write(operations, False)
+
+    def apply_mutations(self, mutations: list[tuple[uuid, Optional[dict]]]) -> Optional[bool]:
+        operations = []
+        for uuid_, update in mutations:
+            if update is None:
+                operations.append(DeleteOne({"id": uuid_}))
+            else:
+                operations.append(UpdateOne({"id": uuid_}, update, upsert=True))
+        return self._bulk_write(operations, True)
+
+    def _bulk_write(self, operations: list, ordered: bool) -> Optional[bool]:
+        if not operations:
+            return True
+        try:
+            self.collection().bulk_write(operations, ordered=ordered)
+            return True
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"Failed to write batch of {len(operations)} operations")
+            # close app
+
+    def load_entity(self, uuid_: uuid) -> Optional[dict]:
+        try:
+            return self.collection().find_one({"id": uuid_})
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"failed to load entity with id: {uuid_}")
+            # close app
+
+    def iter_entities(self, shard: Optional[int], batch_size: int, components: Optional[list[str]],
+                      since: Optional[datetime]) -> Iterator[list[dict]]:
+        filter_ = _shard_filter(shard)
+        if since is not None:
+            filter_[SAVED_AT_KEY] = {"$gt": since}
+        projection = None
+        if components is not None:
+            projection = {"id": 1, "shard": 1}
+            projection.update({f"components.{c}": 1 for c in components})
+        try:
+            yield from batched(self.collection().find(filter_, projection).batch_size(batch_size), batch_size)
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error("Failed to stream entities")
+            # close app
+
+    # component paths get sparse indexes, which only hold the documents that have the component
+    def find_entities(self, component_types: list[str], shard: Optional[int],
+                      where: Optional[dict[str, Any]]) -> Optional[tuple[dict, ...]]:
+        filter_ = _shard_filter(shard)
+        filter_.update({f"components.{c}": {"$exists": True} for c in component_types})
+        filter_.update({f"components.{path}": value for path, value in (where or {}).items()})
+        try:
+            for c in component_types:
+                self.ensure_index(f"components.{c}", sparse=True)
+            for path in where or ():
+                self.ensure_index(f"components.{path}")
+            return tuple(self.collection().find(filter_))
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"Failed to find entities with components: {component_types}")
+            # close app
+
+    def list_entity_ids(self, shard: Optional[int]) -> Optional[set[uuid]]:
+        try:
+            return {doc["id"] for doc in self.collection().find(_shard_filter(shard), {"id": 1})}
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error("Failed to list entity ids")
+            # close app
+
+    def list_shards(self) -> Optional[list[int]]:
+        try:
+            return [shard for shard in self.collection().distinct("shard") if shard is not None]
+        except PyMongoError as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error("Failed to list shards")
+            # close app
+
+    def clear(self):
+        self.collection().delete_many({})
+        self._indexed.clear()
@@ -0,0 +1,157 @@
+import logging
+import pickle
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Optional, Iterator, Any
+
+from Storage.Backend import StorageBackend, SAVED_AT_KEY, apply_update, matches, project, utc_now
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entities (id TEXT PRIMARY KEY, shard INTEGER, saved_at TEXT, document BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entities_shard ON entities (shard)",
+    "CREATE INDEX IF NOT EXISTS entities_saved_at ON entities (saved_at)",
+    "CREATE TABLE IF NOT EXISTS components (component TEXT NOT NULL, entity TEXT NOT NULL, "
+    "PRIMARY KEY (component, entity)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS components_entity ON components (entity)",
+)
+
+
+# fixed width so the stored times sort as text
+def _timestamp(time: datetime) -> str:
+    return time.isoformat(sep=" ", timespec="microseconds")
+
+
+class SQLiteBackend(StorageBackend):
+    """Keeps the entities in a local SQLite file, ":memory:" by default.
+
+    Documents are stored pickled next to their id, shard and save time, and a second table indexes them by
+    component type so finding entities by their components does not read every document."""
+    path: str = None
+    _connection: sqlite3.Connection = None
+    _lock: threading.Lock = None
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # the storage executor calls in from several threads, which take turns on the one connection
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def save_entity(self, uuid_: uuid, update: dict) -> Optional[bool]:
+        return self.apply_mutations([(uuid_, update)])
+
+    def remove_entity(self, uuid_: uuid) -> Optional[bool]:
+        return self.apply_mutations([(uuid_, None)])
+
+    def bulk_write(self, updates: list[tuple[uuid, dict]], removed: list[uuid]) -> Optional[bool]:
+        return self.apply_mutations([*updates, *((uuid_, None) for uuid_ in removed)])
+
+    # every mutation in the call is one transaction
+    def apply_mutations(self, mutations: list[tuple[uuid, Optional[dict]]]) -> Optional[bool]:
+        now = utc_now()
+        try:
+            with self._lock, self._connection:
+                for uuid_, update in mutations:
+                    if update is None:
+                        self._remove(uuid_)
+                    else:
+                        self._update(uuid_, update, now)
+            return True
+        except sqlite3.Error as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"Failed to apply {len(mutations)} mutations")
+            # close app
+
+    def _update(self, uuid_: uuid, update: dict, now: datetime):
+        row = self._connection.execute("SELECT document FROM entities WHERE id = ?", (str(uuid_),)).fetchone()
+        doc = apply_update(pickle.loads(row[0]) if row is not None else {"id": uuid_}, update, now)
+        self._connection.execute("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)",
+                                 (str(uuid_), doc.get("shard"), _timestamp(doc[SAVED_AT_KEY]),
+                                  pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL)))
+        self._connection.execute("DELETE FROM components WHERE entity = ?", (str(uuid_),))
+        self._connection.executemany("INSERT INTO components VALUES (?, ?)",
+                                     ((c, str(uuid_)) for c in doc.get("components", {})))
+
+    def _remove(self, uuid_: uuid):
+        self._connection.execute("DELETE FROM entities WHERE id = ?", (str(uuid_),))
+        self._connection.execute("DELETE FROM components WHERE entity = ?", (str(uuid_),))
+
+    def load_entity(self, uuid_: uuid) -> Optional[dict]:
+        try:
+            with self._lock:
+                row = self._connection.execute("SELECT document FROM entities WHERE id = ?", (str(uuid_),)).fetchone()
+            return pickle.loads(row[0]) if row is not None else None
+        except sqlite3.Error as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"failed to load entity with id: {uuid_}")
+            # close app
+
+    def iter_entities(self, shard: Optional[int], batch_size: int, components: Optional[list[str]],
+                      since: Optional[datetime]) -> Iterator[list[dict]]:
+        query = "SELECT document FROM entities WHERE (? IS NULL OR shard = ?) AND (? IS NULL OR saved_at > ?)"
+        since_ = _timestamp(since) if since is not None else None
+        try:
+            with self._lock:
+                cursor = self._connection.execute(query, (shard, shard, since_, since_))
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield [project(pickle.loads(row[0]), components) for row in rows]
+        except sqlite3.Error as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error("Failed to stream entities")
+            # close app
+
+    # the component table narrows the documents down and where is checked on what is left
+    def find_entities(self, component_types: list[str], shard: Optional[int],
+                      where: Optional[dict[str, Any]]) -> Optional[tuple[dict, ...]]:
+        query = "SELECT document FROM entities WHERE (? IS NULL OR shard = ?)"
+        if component_types:
+            matching = " INTERSECT ".join(["SELECT entity FROM components WHERE component = ?"] * len(component_types))
+            query += f" AND id IN ({matching})"
+        try:
+            with self._lock:
+                rows = self._connection.execute(query, (shard, shard, *component_types)).fetchall()
+            return tuple(doc for doc in (pickle.loads(row[0]) for row in rows) if matches(doc, where))
+        except sqlite3.Error as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error(f"Failed to find entities with components: {component_types}")
+            # close app
+
+    def list_entity_ids(self, shard: Optional[int]) -> Optional[set[uuid]]:
+        try:
+            with self._lock:
+                rows = self._connection.execute("SELECT id FROM entities WHERE (? IS NULL OR shard = ?)",
+                                                (shard, shard)).fetchall()
+            return {uuid.UUID(row[0]) for row in rows}
+        except sqlite3.Error as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error("Failed to list entity ids")
+            # close app
+
+    def list_shards(self) -> Optional[list[int]]:
+        try:
+            with self._lock:
+                rows = self._connection.execute("SELECT DISTINCT shard FROM entities WHERE shard IS NOT NULL")
+                return [row[0] for row in rows]
+        except sqlite3.Error as e:  # pragma: no cover
+            logger.critical(f"Database error: {e}")
+            logger.error("Failed to list shards")
+            # close app
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entities")
+            self._connection.execute("DELETE FROM components")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,47 @@
+import logging
+import os
+import pickle
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+# the database keeps milliseconds and its clock may be ahead of ours, so replays start a little before the snapshot
+REPLAY_MARGIN = timedelta(seconds=5)
+
+VERSION_KEY = "version"
+SHARD_KEY = "shard"
+TAKEN_AT_KEY = "taken_at"
+ARCHETYPES_KEY = "archetypes"
+INDEXES_KEY = "indexes"
+
+
+# the time to replay storage changes from when loading a snapshot taken now
+def replay_from() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None) - REPLAY_MARGIN
+
+
+# written to a temporary file first so a crash while saving leaves the previous snapshot intact
+def write_snapshot(path: str, snapshot: dict[str, Any]):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump({VERSION_KEY: SNAPSHOT_VERSION, **snapshot}, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    logger.info(f"Saved snapshot to {path}")
+
+
+# snapshots are unpickled so only load ones the bot wrote itself
+def read_snapshot(path: str) -> Optional[dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as file:
+            snapshot = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        logger.warning(f"Failed to read snapshot {path}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get(VERSION_KEY) != SNAPSHOT_VERSION:
+        logger.warning(f"Ignoring snapshot {path} with unsupported version")
+        return None
+    return snapshot
@@ -0,0 +1,211 @@
+import asyncio
+import contextlib
+import logging
+import os
+import pickle
+import struct
+import uuid
+from typing import Optional, Iterator
+
+import Storage
+
+DEFAULT_GROUP_SIZE = 64
+DEFAULT_SYNC_DELAY = 0.01
+DEFAULT_COMPACT_INTERVAL = 5.0
+
+COMPACTING_SUFFIX = ".compacting"
+
+logger = logging.getLogger(__name__)
+
+# each record is its pickled length followed by the pickled (uuid, update) pair, None for a removal
+_LENGTH = struct.Struct(">I")
+
+
+def _read_record(file) -> Optional[bytes]:
+    header = file.read(_LENGTH.size)
+    if len(header) < _LENGTH.size:
+        return None
+    length = _LENGTH.unpack(header)[0]
+    data = file.read(length)
+    return data if len(data) == length else None
+
+
+def read_records(path: str) -> Iterator[tuple[uuid, Optional[dict]]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as file:
+        while (data := _read_record(file)) is not None:
+            yield pickle.loads(data)
+
+
+# a crash halfway through a write leaves a partial record, which was never synced so nothing relied on it
+def _truncate_partial_record(path: str):
+    if not os.path.exists(path):
+        return
+    with open(path, "r+b") as file:
+        end = 0
+        while _read_record(file) is not None:
+            end = file.tell()
+        if end < os.path.getsize(path):
+            logger.warning(f"Dropping partial record at the end of {path}")
+            file.truncate(end)
+
+
+class RecoveryError(RuntimeError):
+    pass
+
+
+class WriteAheadLog:
+    """Local append only log of entity updates and removals that is replayed into storage in the background.
+
+    Records are fsynced in groups of group_size or after sync_delay seconds, whichever comes first, and every
+    compact_interval seconds the log is moved aside and applied to storage in order. Records left over from a crash
+    are applied when the log is opened, which raises RecoveryError if they cannot be."""
+    path: str = None
+    group_size: int = None
+    sync_delay: float = None
+    compact_interval: float = None
+    _file = None
+    _unsynced: int = 0
+    _sequence: int = 0
+    _compacting_through: Optional[int] = None
+    _pending: dict[uuid, tuple[int, bool]] = None
+    _sync_handle: Optional[asyncio.TimerHandle] = None
+    _compact_handle: Optional[asyncio.TimerHandle] = None
+    _compact_lock: asyncio.Lock = None
+    _compact_tasks: set[asyncio.Task] = None
+
+    def __init__(self, path: str, group_size: int = DEFAULT_GROUP_SIZE, sync_delay: float = DEFAULT_SYNC_DELAY,
+                 compact_interval: float = DEFAULT_COMPACT_INTERVAL):
+        self.path = path
+        self.group_size = group_size
+        self.sync_delay = sync_delay
+        self.compact_interval = compact_interval
+        self._pending = {}
+        self._compact_lock = asyncio.Lock()
+        self._compact_tasks = set()
+        _truncate_partial_record(path)
+        _truncate_partial_record(self._compacting_path)
+        self._file = open(path, "ab")
+        # loading storage without the records would start the world from stale data
+        if not self.recover():
+            self._file.close()
+            raise RecoveryError(f"Failed to apply the records left in {path}, they are kept for the next start")
+
+    def __len__(self):
+        return len(self._pending)
+
+    def is_pending(self, uuid_: uuid) -> bool:
+        return uuid_ in self._pending
+
+    def is_removed(self, uuid_: uuid) -> bool:
+        return self._pending.get(uuid_, (0, False))[1]
+
+    # applies the records a previous run did not get to, the log must not have been written to yet
+    def recover(self) -> bool:
+        if self._sequence != 0:
+            raise RuntimeError("Can only recover a log that has not been written to")
+        if os.path.getsize(self.path) == 0 and not os.path.exists(self._compacting_path):
+            return True
+        logger.info(f"Recovering write ahead log {self.path}")
+        # the first compaction may only get through a log that was already moved aside
+        return self.compact() and self.compact()
+
+    def append_update(self, update: dict):
+        self._append(update["$set"]["id"], update)
+
+    def append_removal(self, uuid_: uuid):
+        self._append(uuid_, None)
+
+    def _append(self, uuid_: uuid, update: Optional[dict]):
+        data = pickle.dumps((uuid_, update), protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.write(_LENGTH.pack(len(data)) + data)
+        self._sequence += 1
+        self._pending[uuid_] = (self._sequence, update is None)
+        self._unsynced += 1
+        self._schedule()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # there is no loop to run the timers so sync straight away and leave compaction to flushes
+            self.sync()
+            return
+        if self._unsynced >= self.group_size:
+            self.sync()
+        elif self._sync_handle is None:
+            self._sync_handle = loop.call_later(self.sync_delay, self.sync)
+        if self._compact_handle is None:
+            self._compact_handle = loop.call_later(self.compact_interval, self._start_compaction, loop)
+
+    def sync(self):
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        if self._unsynced == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    @property
+    def _compacting_path(self) -> str:
+        return self.path + COMPACTING_SUFFIX
+
+    # moves the log aside for compaction unless an earlier compaction failed, which has to be applied first
+    def _take_compaction(self) -> Optional[list[tuple[uuid, Optional[dict]]]]:
+        if self._compact_handle is not None:
+            self._compact_handle.cancel()
+            self._compact_handle = None
+        self.sync()
+        if not os.path.exists(self._compacting_path):
+            if self._file.tell() == 0:
+                return None
+            self._file.close()
+            os.replace(self.path, self._compacting_path)
+            self._file = open(self.path, "ab")
+            self._compacting_through = self._sequence
+        return list(read_records(self._compacting_path))
+
+    def _finish_compaction(self, applied: bool) -> bool:
+        if not applied:
+            logger.error(f"Failed to compact write ahead log {self.path}, will retry")
+            return False
+        # a flush may have applied and removed it while this compaction was waiting on storage
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._compacting_path)
+        through = self._compacting_through or 0
+        self._pending = {u: p for u, p in self._pending.items() if p[0] > through}
+        self._compacting_through = None
+        return True
+
+    def compact(self) -> bool:
+        mutations = self._take_compaction()
+        if mutations is None:
+            return True
+        logger.debug(f"Compacting {len(mutations)} records")
+        return self._finish_compaction(bool(Storage.apply_mutations(mutations)))
+
+    async def compact_async(self) -> bool:
+        async with self._compact_lock:
+            mutations = self._take_compaction()
+            if mutations is None:
+                return True
+            logger.debug(f"Compacting {len(mutations)} records")
+            compacted = self._finish_compaction(bool(await Storage.apply_mutations_async(mutations)))
+            if not compacted and self._compact_handle is None:
+                loop = asyncio.get_running_loop()
+                self._compact_handle = loop.call_later(self.compact_interval, self._start_compaction, loop)
+            return compacted
+
+    def _start_compaction(self, loop: asyncio.AbstractEventLoop):
+        self._compact_handle = None
+        task = loop.create_task(self.compact_async())
+        self._compact_tasks.add(task)
+        task.add_done_callback(self._compact_tasks.discard)
+
+    def close(self) -> bool:
+        compacted = self.compact()
+        self._file.close()
+        return compacted
@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import logging
+import uuid
+from typing import Callable, Optional
+
+import Storage
+
+DEFAULT_MAX_STALENESS = 1.0
+DEFAULT_MAX_BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+# the uuids that were dirty, the data loaded for them and the removed uuids
+_Batch = tuple[set[uuid], list[dict], set[uuid]]
+
+
+class WriteBehindBuffer:
+    max_staleness: float = None
+    max_batch_size: int = None
+    _load_data: Callable[[uuid], Optional[dict]] = None
+    _dirty: set[uuid] = None
+    _removed: set[uuid] = None
+    # taken for a write that has not finished, with the number of such writes and whether the latest is a removal
+    _in_flight: dict[uuid, tuple[int, bool]] = None
+    # batches a cancelled or failed flush did not finish, written before anything taken after them
+    _retry: list[_Batch] = None
+    _flush_queued: bool = False
+    _flush_handle: Optional[asyncio.TimerHandle] = None
+    _flush_lock: asyncio.Lock = None
+    _flush_tasks: set[asyncio.Task] = None
+
+    # load_data is called at flush time so several changes to one entity are written once
+    def __init__(self, load_data: Callable[[uuid], Optional[dict]], max_staleness: float = DEFAULT_MAX_STALENESS,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        self.max_staleness = max_staleness
+        self.max_batch_size = max_batch_size
+        self._load_data = load_data
+        self._dirty = set()
+        self._removed = set()
+        self._in_flight = {}
+        self._retry = []
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_tasks = set()
+
+    def __len__(self):
+        return len(self._dirty) + len(self._removed)
+
+    # entities stay pending until their write has finished, so they are not reloaded from storage before that
+    def is_pending(self, uuid_: uuid) -> bool:
+        return uuid_ in self._dirty or uuid_ in self._removed or uuid_ in self._in_flight
+
+    def is_removed(self, uuid_: uuid) -> bool:
+        if uuid_ in self._dirty:
+            return False
+        return uuid_ in self._removed or self._in_flight.get(uuid_, (0, False))[1]
+
+    def mark_dirty(self, uuid_: uuid):
+        self._removed.discard(uuid_)
+        self._dirty.add(uuid_)
+        self._schedule_flush()
+
+    def mark_removed(self, uuid_: uuid):
+        self._dirty.discard(uuid_)
+        self._removed.add(uuid_)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # there is no loop to run the timer so write straight away
+            self.flush()
+            return
+        # a flush that has not taken its batch yet writes these changes too
+        if self._flush_queued:
+            return
+        if len(self) >= self.max_batch_size:
+            self._start_flush(loop)
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_staleness, self._start_flush, loop)
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._flush_queued = True
+        task = loop.create_task(self._write_async())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    # oldest first, the entities in them count as in flight until _finish_batch
+    def _take_batches(self) -> list[_Batch]:
+        self._flush_queued = False
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batches, self._retry = self._retry, []
+        if len(self) == 0:
+            return batches
+        dirty, removed = self._dirty, self._removed
+        self._dirty, self._removed = set(), set()
+        entities_data = [data for data in (self._load_data(uuid_) for uuid_ in dirty) if data is not None]
+        for uuid_ in dirty:
+            self._track(uuid_, False)
+        for uuid_ in removed:
+            self._track(uuid_, True)
+        batches.append((dirty, entities_data, removed))
+        return batches
+
+    def _track(self, uuid_: uuid, removal: bool):
+        count = self._in_flight.get(uuid_, (0, False))[0]
+        self._in_flight[uuid_] = (count + 1, removal)
+
+    def _finish_batch(self, batch: _Batch):
+        dirty, _, removed = batch
+        for uuid_ in itertools.chain(dirty, removed):
+            count, removal = self._in_flight[uuid_]
+            if count > 1:
+                self._in_flight[uuid_] = (count - 1, removal)
+            else:
+                del self._in_flight[uuid_]
+
+    # a batch that failed to write is kept, its entities stay pending until a later flush writes it
+    def _keep_failed(self, batches: list[_Batch]):
+        logger.exception(f"Flushing failed, keeping {len(batches)} batches for the next flush")
+        self._retry.extend(batches)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # without a loop they are written by the next flush
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_staleness, self._start_flush, loop)
+
+    # writes left to flush tasks that have not run yet are taken and written here
+    def flush(self) -> bool:
+        written = True
+        batches = self._take_batches()
+        for i, batch in enumerate(batches):
+            _, entities_data, removed = batch
+            try:
+                if entities_data or removed:
+                    logger.debug(f"Flushing {len(entities_data)} saves and {len(removed)} removals")
+                    written = bool(Storage.bulk_write(entities_data, removed)) and written
+            except Exception:
+                self._keep_failed(batches[i:])
+                return False
+            self._finish_batch(batch)
+        return written
+
+    # waits for the flushes already started, so their writes have reached storage too when this returns
+    async def flush_async(self) -> bool:
+        if self._flush_tasks:
+            await asyncio.wait(set(self._flush_tasks))
+        return await self._write_async()
+
+    # the batch is only taken once the lock is held, so a flush cancelled while waiting leaves its changes queued
+    async def _write_async(self) -> bool:
+        try:
+            async with self._flush_lock:
+                batches = self._take_batches()
+                written = True
+                for i, batch in enumerate(batches):
+                    _, entities_data, removed = batch
+                    try:
+                        if entities_data or removed:
+                            logger.debug(f"Flushing {len(entities_data)} saves and {len(removed)} removals")
+                            written = bool(await Storage.bulk_write_async(entities_data, removed)) and written
+                    except asyncio.CancelledError:
+                        # writing an update that did reach storage again changes nothing
+                        self._retry.extend(batches[i:])
+                        raise
+                    except Exception:
+                        self._keep_failed(batches[i:])
+                        return False
+                    self._finish_batch(batch)
+                return written
+        except asyncio.CancelledError:
+            self._flush_queued = False
+            raise
@@ -1,83 +1,245 @@
+import asyncio
 import logging
+import time
 import uuid
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Iterable, Callable, Any, Iterator, AsyncIterator
 
-from pymongo import MongoClient, collection, database
-from pymongo.errors import PyMongoError
+from Storage.Backend import StorageBackend, DEFAULT_LOAD_BATCH_SIZE, ID_INDEX, INDEX_READY, \
+    INDEX_CREATED, INDEX_MISSING, INDEX_FAILED, MissingIndexError, as_update
 
 DEFAULT_DATABASE_NAME = "Mafia"
 DEFAULT_ENTITY_COLLECTION = "Entities"
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_INDEX_RETRY_DELAY = 1.0
+MAX_INDEX_RETRY_DELAY = 60.0
 
 logger = logging.getLogger(__name__)
 
-_connection: MongoClient = MongoClient('localhost', 27017, uuidRepresentation="standard")
-_database: database = _connection.get_database(DEFAULT_DATABASE_NAME)
+# mongo on localhost until configured otherwise, created on first use so importing connects to nothing
+_backend: Optional[StorageBackend] = None
 
 _database_name: str = DEFAULT_DATABASE_NAME
 _entity_collection_name: str = DEFAULT_ENTITY_COLLECTION
 
+# component fields to index as "<component type>.<key>" paths, the same paths find_entities takes
+_index_fields: set[str] = set()
+_require_indexes: bool = True
+# only a successful check is kept, a failed one is retried from _index_retry_at with a doubling delay
+_indexes_ready: bool = False
+_index_retry_at: float = 0.0
+_index_retry_delay: float = DEFAULT_INDEX_RETRY_DELAY
+
+# the backends are blocking so the async api runs them on a small dedicated pool
+_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="Storage")
+
 
 def configure_database(database_: str = _database_name,
                        entity_collection: str = _entity_collection_name):
-    global _database, _database_name, _entity_collection_name
+    from Storage.MongoBackend import MongoBackend
+    global _database_name, _entity_collection_name
     _database_name = database_
     _entity_collection_name = entity_collection
-    _database = _connection.get_database(database_)
+    configure_backend(MongoBackend(database_, entity_collection))
     logger.info(f"Setup database as {database_} and {entity_collection}")
 
 
-def save_entity(entity_data: dict):
-    if "id" not in entity_data:
-        raise KeyError("entity_data must have id field")
+def configure_backend(backend: StorageBackend):
+    global _backend, _indexes_ready, _index_retry_at, _index_retry_delay
+    if _backend is not None and _backend is not backend:
+        _backend.close()
+    _backend = backend
+    _indexes_ready = False
+    _index_retry_at = 0.0
+    _index_retry_delay = DEFAULT_INDEX_RETRY_DELAY
+    logger.info(f"Setup storage backend {type(backend).__name__}")
+
+
+def get_backend() -> StorageBackend:
+    if _backend is None:
+        configure_database(_database_name, _entity_collection_name)
+    return _backend
+
+
+# indexes declared once the others are reconciled, by shards loaded later or lookups on new fields, are built here
+def declare_index(path: str):
+    if path in _index_fields:
+        return
+    _index_fields.add(path)
+    if _indexes_ready:
+        ensure_indexes()
+
+
+# with required=False writes and loads run without the id index, which scans the collection for every one of them
+def require_indexes(required: bool = True):
+    global _require_indexes
+    _require_indexes = required
+
+
+# builds the indexes the backend is missing, call at startup once the component indexes are declared
+def ensure_indexes() -> dict[str, str]:
+    global _indexes_ready, _index_retry_delay
     try:
-        collection_: collection = _database.get_collection(_entity_collection_name)
-        collection_.update_one({"id": entity_data["id"]}, {"$set": entity_data}, upsert=True)
-        return True
-    except PyMongoError as e:  # pragma: no cover
-        logger.critical(f"Database error: {e}")
-        logger.error(f"Entity data: {entity_data}")
-        # close app
+        status = get_backend().ensure_indexes(sorted(_index_fields))
+    except Exception:
+        _indexes_ready = False
+        _delay_index_retry()
+        raise
+    for path, state in status.items():
+        log = logger.error if state in (INDEX_MISSING, INDEX_FAILED) else logger.info
+        log(f"Index on {path}: {state}")
+    _indexes_ready = status.get(ID_INDEX) in (INDEX_READY, INDEX_CREATED)
+    if _indexes_ready:
+        _index_retry_delay = DEFAULT_INDEX_RETRY_DELAY
+    else:
+        _delay_index_retry()
+    return status
+
+
+def _delay_index_retry():
+    global _index_retry_at, _index_retry_delay
+    _index_retry_at = time.monotonic() + _index_retry_delay
+    _index_retry_delay = min(_index_retry_delay * 2, MAX_INDEX_RETRY_DELAY)
+
+
+def index_status() -> dict[str, str]:
+    return get_backend().index_status(sorted(_index_fields))
+
+
+# writes and loads reconcile the indexes until a check succeeds, streaming and finding entities count as loads
+def _check_indexes():
+    if not _indexes_ready and time.monotonic() >= _index_retry_at:
+        try:
+            ensure_indexes()
+        except Exception as e:
+            if _require_indexes:
+                raise
+            logger.error(f"Checking the indexes failed: {type(e).__name__}: {e}")
+    if not _indexes_ready and _require_indexes:
+        raise MissingIndexError(f"No unique index on {ID_INDEX}, build it or call require_indexes(False)")
+
+
+def configure_executor(max_workers: int = DEFAULT_MAX_WORKERS):
+    global _executor
+    _executor.shutdown(wait=True)
+    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Storage")
+    logger.info(f"Setup storage executor with {max_workers} workers")
+
+
+# waits for queued writes so nothing is lost when the bot stops
+def shutdown_executor():
+    _executor.shutdown(wait=True)
+
+
+async def _run_in_executor(func: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+def save_entity(entity_data: dict):
+    return _save_update(*as_update(entity_data))
+
+
+def _save_update(uuid_: uuid, update: dict):
+    _check_indexes()
+    return get_backend().save_entity(uuid_, update)
 
 
 def remove_entity(uuid_: uuid):
-    try:
-        collection_: collection = _database.get_collection(_entity_collection_name)
-        collection_.delete_one({"id": uuid_})
-        return True
-    except PyMongoError as e:  # pragma: no cover
-        logger.critical(f"Database error: {e}")
-        logger.error(f"Failed to delete entity with id: {uuid_}")
-        # close app
+    _check_indexes()
+    return get_backend().remove_entity(uuid_)
+
+
+def bulk_write(entities_data: Iterable[dict], removed: Iterable[uuid]):
+    _check_indexes()
+    return get_backend().bulk_write([as_update(data) for data in entities_data], list(removed))
+
+
+# applies (uuid, update) pairs in order, an update of None removes the entity
+def apply_mutations(mutations: Iterable[tuple[uuid, Optional[dict]]]) -> bool:
+    _check_indexes()
+    return get_backend().apply_mutations([(uuid_, None if update is None else as_update(update)[1])
+                                          for uuid_, update in mutations])
 
 
 def load_entity(uuid_: uuid) -> Optional[dict]:
-    try:
-        collection_: collection = _database.get_collection(_entity_collection_name)
-        entity_data: dict = collection_.find_one({"id": uuid_})
-        if entity_data is None:
-            logger.warning(f"Tried to load nonexistent entity with uuid: {uuid_}")
-            return None
-        return entity_data
-    except PyMongoError as e:  # pragma: no cover
-        logger.critical(f"Database error: {e}")
-        logger.error(f"failed to load entity with id: {uuid_}")
-        # close app
-
-
-def load_all_entities() -> tuple[dict, ...]:
-    try:
-        entities = []
-        collection_: collection = _database.get_collection(_entity_collection_name)
-        documents = collection_.find({})
-        for doc in documents:
-            entities.append(dict(doc))
-        return tuple(entities)
-    except PyMongoError as e:  # pragma: no cover
-        logger.critical(f"Database error: {e}")
-        logger.error("Failed to load all entities")
-        # close app
+    _check_indexes()
+    entity_data = get_backend().load_entity(uuid_)
+    if entity_data is None:
+        logger.warning(f"Tried to load nonexistent entity with uuid: {uuid_}")
+    return entity_data
+
+
+# prefer iter_entities for large collections
+def load_all_entities(shard: Optional[int] = None) -> tuple[dict, ...]:
+    return tuple(doc for batch in iter_entities(shard) for doc in batch)
+
+
+# streams the entities in lists of batch_size documents so they never all sit in memory at once
+# components limits the loaded documents to those component types
+# since limits them to the entities saved after that time (naive utc, like the database returns)
+def iter_entities(shard: Optional[int] = None, batch_size: int = DEFAULT_LOAD_BATCH_SIZE,
+                  components: Optional[Iterable[str]] = None, since: Optional[datetime] = None) -> Iterator[list[dict]]:
+    _check_indexes()
+    return get_backend().iter_entities(shard, batch_size, None if components is None else list(components), since)
+
+
+# runs in the backend, where maps "<component type>.<key>" paths to the value that stored field must equal
+def find_entities(component_types: Iterable[str], shard: Optional[int] = None,
+                  where: Optional[dict[str, Any]] = None) -> tuple[dict, ...]:
+    _check_indexes()
+    return get_backend().find_entities(list(component_types), shard, where)
+
+
+def list_entity_ids(shard: Optional[int] = None) -> set[uuid]:
+    _check_indexes()
+    return get_backend().list_entity_ids(shard)
+
+
+def list_shards() -> list[int]:
+    return get_backend().list_shards()
+
+
+# the update is built before handing off so a missing id raises here
+async def save_entity_async(entity_data: dict):
+    return await _run_in_executor(_save_update, *as_update(entity_data))
+
+
+async def remove_entity_async(uuid_: uuid):
+    return await _run_in_executor(remove_entity, uuid_)
+
+
+async def bulk_write_async(entities_data: Iterable[dict], removed: Iterable[uuid]):
+    return await _run_in_executor(bulk_write, list(entities_data), list(removed))
+
+
+async def apply_mutations_async(mutations: Iterable[tuple[uuid, Optional[dict]]]) -> bool:
+    return await _run_in_executor(apply_mutations, list(mutations))
+
+
+async def load_entity_async(uuid_: uuid) -> Optional[dict]:
+    return await _run_in_executor(load_entity, uuid_)
+
+
+async def find_entities_async(component_types: Iterable[str], shard: Optional[int] = None,
+                              where: Optional[dict[str, Any]] = None) -> tuple[dict, ...]:
+    return await _run_in_executor(find_entities, list(component_types), shard, where)
+
+
+# the cursor is opened and each batch read on the executor so the loop can use the entities of earlier batches
+# in the meantime
+async def iter_entities_async(shard: Optional[int] = None, batch_size: int = DEFAULT_LOAD_BATCH_SIZE,
+                              components: Optional[Iterable[str]] = None) -> AsyncIterator[list[dict]]:
+    batches = await _run_in_executor(iter_entities, shard, batch_size,
+                                     None if components is None else list(components))
+    while (batch := await _run_in_executor(next, batches, None)) is not None:
+        yield batch
+
+
+async def load_all_entities_async(shard: Optional[int] = None) -> tuple[dict, ...]:
+    return await _run_in_executor(load_all_entities, shard)
 
 
 # meant for testing to rest database
 def clear_entity_collection():
-    _database.get_collection(_entity_collection_name).delete_many({})
+    get_backend().clear()
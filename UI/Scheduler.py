@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Mapping, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# nextcord already paces requests by discord's rate limit headers, so by default a route only waits once a 429
+# gets past it or headers are fed in with update_from_headers
+DEFAULT_ROUTE_LIMIT = None
+DEFAULT_ROUTE_PERIOD = 5.0
+MAX_RETRIES = 3
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+# how long to wait before retrying a request that raised e, None when e is not a rate limit
+def retry_after(e: Exception) -> Optional[float]:
+    return e.retry_after if isinstance(e, RateLimited) else None
+
+
+class RouteBucket:
+    """Fixed window of limit requests every period seconds, corrected by the rate limit headers of responses.
+
+    Without a limit requests only wait while the bucket is blocked by a rate limit."""
+
+    def __init__(self, limit: Optional[int], period: float, clock: Callable[[], float]):
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self._clock = clock
+        self._reset_at = clock()
+
+    async def acquire(self):
+        while True:
+            now = self._clock()
+            if now >= self._reset_at:
+                self.remaining = self.limit
+                # without a limit there is no window, only the time a rate limit blocks the bucket until
+                if self.limit is not None:
+                    self._reset_at = now + self.period
+            if self.remaining is None:
+                return
+            if self.remaining > 0:
+                self.remaining -= 1
+                return
+            await asyncio.sleep(self._reset_at - now)
+
+    def update(self, limit: int, remaining: int, reset_after: float):
+        self.limit = limit
+        # responses can arrive out of order so the lower count is the safe one
+        self.remaining = remaining if self.remaining is None else min(self.remaining, remaining)
+        self._reset_at = self._clock() + reset_after
+
+    def block(self, retry_after: float):
+        self.remaining = 0
+        self._reset_at = max(self._reset_at, self._clock() + retry_after)
+
+
+class RequestScheduler:
+    """Runs outbound discord requests through per route buckets.
+
+    Requests on a route run concurrently while its bucket has room and wait for the next window otherwise, so a
+    burst of channel changes goes out as fast as discord allows instead of piling up 429s."""
+    _buckets: dict[Hashable, RouteBucket] = None
+
+    # retry_after_func tells rate limits apart from other failures, e.g. 429s raised by a client library
+    def __init__(self, limit: Optional[int] = DEFAULT_ROUTE_LIMIT, period: float = DEFAULT_ROUTE_PERIOD,
+                 clock: Callable[[], float] = time.monotonic,
+                 retry_after_func: Callable[[Exception], Optional[float]] = retry_after):
+        self.limit = limit
+        self.period = period
+        self._clock = clock
+        self._retry_after = retry_after_func
+        self._buckets = {}
+
+    def bucket(self, route: Hashable) -> RouteBucket:
+        if route not in self._buckets:
+            self._buckets[route] = RouteBucket(self.limit, self.period, self._clock)
+        return self._buckets[route]
+
+    def update(self, route: Hashable, limit: int, remaining: int, reset_after: float):
+        self.bucket(route).update(limit, remaining, reset_after)
+
+    def update_from_headers(self, route: Hashable, headers: Mapping[str, str]):
+        if "X-RateLimit-Remaining" not in headers or "X-RateLimit-Reset-After" not in headers:
+            return
+        self.update(route, int(headers.get("X-RateLimit-Limit", self.bucket(route).limit)),
+                    int(headers["X-RateLimit-Remaining"]), float(headers["X-RateLimit-Reset-After"]))
+
+    # retries when func is rate limited, which blocks the whole route for the time discord asked for
+    async def run(self, route: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        bucket = self.bucket(route)
+        for tries in range(MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                return await func()
+            except Exception as e:
+                wait = self._retry_after(e)
+                if wait is None or tries == MAX_RETRIES:
+                    raise
+                logger.warning(f"Rate limited on route {route}, retrying in {wait} seconds")
+                bucket.block(wait)
+
+    # runs independent requests on the same route, exceptions are returned in place of their results
+    async def gather(self, route: Hashable, *funcs: Callable[[], Awaitable[Any]]) -> list[Any | BaseException]:
+        return list(await asyncio.gather(*(self.run(route, f) for f in funcs), return_exceptions=True))
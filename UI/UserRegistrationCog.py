@@ -17,8 +17,8 @@ def game_exists():  # pragma: no cover
     return application_checks.check(predicate)
 
 
-async def user_check(id_: int):  # pragma: no cover
-    return any(await Events.EVENT_MANAGER.dispatch_event(EventList.CHECK_USER_EXIST, user=id_))
+async def user_check(id_: int, guild_id: int):  # pragma: no cover
+    return any(await Events.EVENT_MANAGER.dispatch_event(EventList.CHECK_USER_EXIST, user=id_, guild=guild_id))
 
 
 class UserRegistrationCog(commands.Cog):
@@ -29,13 +29,14 @@ class UserRegistrationCog(commands.Cog):
         discord_id = interaction.user.id
         display_name = interaction.user.display_name
 
-        if await user_check(discord_id):
+        if await user_check(discord_id, interaction.guild_id):
             await interaction.send("You are already in the game")
             return
 
         await Events.EVENT_MANAGER.dispatch_event(EventList.REGISTER_DISCORD_USER_EVENT,
                                                   discord_id=discord_id,
-                                                  display_name=display_name)
+                                                  display_name=display_name,
+                                                  guild=interaction.guild_id)
 
         await interaction.send("Joined the game")
 
@@ -44,12 +45,13 @@ class UserRegistrationCog(commands.Cog):
     async def leave(self, interaction: nextcord.Interaction):
         discord_id = interaction.user.id
 
-        if not await user_check(discord_id):
+        if not await user_check(discord_id, interaction.guild_id):
             await interaction.send("You are not in the game")
             return
 
         if (await Events.EVENT_MANAGER.dispatch_event(EventList.UNREGISTER_DISCORD_USER_EVENT,
-                                                      discord_id=discord_id))[0]:
+                                                      discord_id=discord_id,
+                                                      guild=interaction.guild_id))[0]:
             await interaction.send("Left the game")
         else:
             await interaction.send("Failed to remove you from the game\n(You may not have joined)")
@@ -1,19 +1,47 @@
+import asyncio
 import logging
+from functools import partial
+from typing import Callable, Awaitable, Any, Optional
 
 import nextcord
-from nextcord import Guild, CategoryChannel, Member, Role, PermissionOverwrite, TextChannel, Forbidden, \
-    ApplicationError, Color
+from nextcord import Guild, CategoryChannel, Member, Role, PermissionOverwrite, Forbidden, \
+    ApplicationError, Color, HTTPException
 from nextcord.ext import commands, application_checks
 from nextcord.ext.application_checks import ApplicationMissingPermissions
 
+from UI.Cache import TTLCache, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL
+from UI.Scheduler import RequestScheduler
 from UI.GameManagementCog import GameManagementCog
 from UI.MessagingCog import MessagingCog
 from UI.UserRegistrationCog import UserRegistrationCog
 from UI.guild_ids import GUILD_IDS
 
+# used when a 429 nextcord gave up on has no Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+
 logger = logging.getLogger(__name__)
 
-_bot = commands.Bot()
+# awaited in order when the bot closes, while the loop still runs
+_close_hooks: list[Callable[[], Awaitable[Any]]] = []
+
+
+class _Bot(commands.Bot):
+
+    async def close(self):
+        for hook in _close_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"Close hook {hook} failed")
+                logger.error(f"{str(e)}")
+        await super().close()
+
+
+_bot = _Bot()
+
+
+def add_close_hook(hook: Callable[[], Awaitable[Any]]):
+    _close_hooks.append(hook)
 
 
 def start_bot(token: str):
@@ -69,35 +97,131 @@ async def stop(interaction: nextcord.Interaction):
     await _bot.close()
 
 
-async def send_message(message: str, channel_id: int):
-    channel = _bot.get_channel(channel_id)
+async def send_message(message: str, channel_id: int) -> bool:
+    return (await broadcast_message(message, channel_id))[channel_id]
+
+
+# sends to every channel at once, each channel only once, and returns whether each one got the message
+async def broadcast_message(message: str, *channel_ids: int) -> dict[int, bool]:
+    channel_ids = tuple(dict.fromkeys(channel_ids))
+    channels = [_bot.get_channel(id_) for id_ in channel_ids]
+    delivered = await asyncio.gather(*(_deliver_message(message, id_, channel)
+                                       for id_, channel in zip(channel_ids, channels)))
+    return dict(zip(channel_ids, delivered))
+
+
+async def _deliver_message(message: str, channel_id: int, channel) -> bool:
     if channel is None:
         logger.warning(f"Failed to load channel with id: {channel_id}")
-        return
+        return False
+    try:
+        await _scheduler.run((MESSAGES_ROUTE, channel_id), partial(channel.send, message))
+    except HTTPException as e:
+        logger.error(f"Failed to send message to channel {channel_id}")
+        logger.error(f"{str(e)}")
+        return False
+    return True
 
-    await channel.send(message)
+
+# guilds are keyed by id, members and roles by (guild id, id). the gateway listeners below keep them current
+_guilds = TTLCache()
+_members = TTLCache()
+_roles = TTLCache()
+
+# nextcord waits out 429s itself and only raises one once its own retries run out, the route then waits as asked
+def _retry_after(e: Exception) -> Optional[float]:
+    if isinstance(e, HTTPException) and e.status == 429:
+        return float(e.response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+    return None
+
+
+# every discord mutation goes through here, routes are (kind of change, guild id) or (messages, channel id)
+_scheduler = RequestScheduler(retry_after_func=_retry_after)
+CHANNELS_ROUTE = "channels"
+ROLES_ROUTE = "roles"
+MEMBER_ROLES_ROUTE = "member_roles"
+MESSAGES_ROUTE = "messages"
+
+
+def configure_cache(max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL):
+    for cache in (_guilds, _members, _roles):
+        cache.max_size = max_size
+        cache.ttl = ttl
+        cache.clear()
 
 
 async def get_guild(guild_id: int) -> Guild:
-    guild: Guild = await _bot.fetch_guild(guild_id)
+    guild: Guild = _guilds.get(guild_id)
+    if guild is not None:
+        return guild
+    guild = await _bot.fetch_guild(guild_id)
     if guild is None:
         raise KeyError(f"Bot is not in guild with id: {guild}")
+    _guilds.set(guild_id, guild)
     return guild
 
 
 async def get_member(guild: Guild, member_id: int) -> Member:
-    member: Member = await guild.fetch_member(member_id)
+    member: Member = _members.get((guild.id, member_id))
+    if member is not None:
+        return member
+    member = await guild.fetch_member(member_id)
     if member is None:
         raise KeyError(f"Could not find member with id: {member_id}")
+    _members.set((guild.id, member_id), member)
     return member
 
 
 async def get_role(guild: Guild, role_id: int) -> Role:
-    roles = await guild.fetch_roles()
-    for role in roles:
-        if role.id == role_id:
-            return role
-    raise KeyError(f"Guild {guild.id}, does not have role with id {role_id}")
+    role: Role = _roles.get((guild.id, role_id))
+    if role is not None:
+        return role
+    # one fetch fills in every role of the guild
+    for r in await guild.fetch_roles():
+        _roles.set((guild.id, r.id), r)
+    role = _roles.get((guild.id, role_id))
+    if role is None:
+        raise KeyError(f"Guild {guild.id}, does not have role with id {role_id}")
+    return role
+
+
+@_bot.event
+async def on_guild_update(before: Guild, after: Guild):
+    if after.id in _guilds:
+        _guilds.set(after.id, after)
+
+
+@_bot.event
+async def on_guild_remove(guild: Guild):
+    _guilds.invalidate(guild.id)
+    _members.invalidate_where(lambda key: key[0] == guild.id)
+    _roles.invalidate_where(lambda key: key[0] == guild.id)
+
+
+@_bot.event
+async def on_member_update(before: Member, after: Member):
+    if (after.guild.id, after.id) in _members:
+        _members.set((after.guild.id, after.id), after)
+
+
+@_bot.event
+async def on_member_remove(member: Member):
+    _members.invalidate((member.guild.id, member.id))
+
+
+@_bot.event
+async def on_guild_role_create(role: Role):
+    _roles.set((role.guild.id, role.id), role)
+
+
+@_bot.event
+async def on_guild_role_update(before: Role, after: Role):
+    _roles.set((after.guild.id, after.id), after)
+
+
+@_bot.event
+async def on_guild_role_delete(role: Role):
+    _roles.invalidate((role.guild.id, role.id))
 
 
 @_bot.slash_command(description="test", guild_ids=GUILD_IDS)
@@ -108,58 +232,106 @@ async def test(interaction: nextcord.Interaction):
 
 
 async def make_role(name: str, guild: int) -> int:
-    guild: Guild = await _bot.fetch_guild(guild)
+    guild: Guild = await get_guild(guild)
     # color is a light blue hex #5FD0EB
-    role: Role = await guild.create_role(name=name, color=Color.from_rgb(95, 208, 235), mentionable=True)
+    role: Role = await _scheduler.run((ROLES_ROUTE, guild.id),
+                                      partial(guild.create_role, name=name, color=Color.from_rgb(95, 208, 235),
+                                              mentionable=True))
+    _roles.set((guild.id, role.id), role)
     logger.info(f"Created role with name: {name}")
     return role.id
 
 
 async def delete_role(guild_id: int, role_id: int):
-    guild: Guild = await _bot.fetch_guild(guild_id)
-    roles = [r for r in await guild.fetch_roles() if r.id == role_id]
-    if roles:
-        logger.info(f"Deleting role with id {roles[0].id}")
-        await roles[0].delete()
+    guild: Guild = await get_guild(guild_id)
+    try:
+        role: Role = await get_role(guild, role_id)
+    except KeyError:
+        return
+    logger.info(f"Deleting role with id {role.id}")
+    await _scheduler.run((ROLES_ROUTE, guild_id), role.delete)
+    _roles.invalidate((guild_id, role_id))
 
 
 async def assign_role(user_id: int, guild_id: int, role_id: int):
     guild: Guild = await get_guild(guild_id)
     member: Member = await get_member(guild, user_id)
     role: Role = await get_role(guild, role_id)
-    await member.add_roles(role)
+    await _scheduler.run((MEMBER_ROLES_ROUTE, guild_id), partial(member.add_roles, role))
 
 
 async def remove_role(user_id: int, guild_id: int, role_id: int):
     guild: Guild = await get_guild(guild_id)
     member: Member = await get_member(guild, user_id)
     role: Role = await get_role(guild, role_id)
-    await member.remove_roles(role)
+    await _scheduler.run((MEMBER_ROLES_ROUTE, guild_id), partial(member.remove_roles, role))
 
 
 async def make_player_channels(name: str, user_id: int, guild: int) -> tuple[int, int, int]:
+    return await _make_player_channels(await get_guild(guild), name, user_id)
+
+
+# players are (display name, user id), results are keyed by user id and hold the error message for failed players
+# so they can be sent back from a worker, nextcord's exceptions do not survive pickling
+async def make_player_channels_batch(guild: int, *players: tuple[str, int]) -> dict[int, tuple[int, int, int] | str]:
     guild: Guild = await get_guild(guild)
+    results = await asyncio.gather(*(_make_player_channels(guild, name, user_id) for name, user_id in players),
+                                   return_exceptions=True)
+    channels = {}
+    for (name, user_id), result in zip(players, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to make channels for {name}")
+            logger.error(f"{str(result)}")
+            result = f"{type(result).__name__}: {result}"
+        channels[user_id] = result
+    return channels
+
+
+async def _make_player_channels(guild: Guild, name: str, user_id: int) -> tuple[int, int, int]:
     member: Member = await get_member(guild, user_id)
     everyone: Role = guild.default_role
-    category: CategoryChannel = await guild.create_category(f"{name}",
-                                                            overwrites={everyone: EVERYONE_PERMS,
-                                                                        member: PLAYER_PERMS})
-    info: TextChannel = await category.create_text_channel(f"{name}-info")
-    command: TextChannel = await category.create_text_channel(f"{name}-commands")
+    route = (CHANNELS_ROUTE, guild.id)
+    category: CategoryChannel = await _scheduler.run(route, partial(guild.create_category, f"{name}",
+                                                                    overwrites={everyone: EVERYONE_PERMS,
+                                                                                member: PLAYER_PERMS}))
+    # the text channels only depend on the category
+    created = await _scheduler.gather(route, partial(category.create_text_channel, f"{name}-info"),
+                                      partial(category.create_text_channel, f"{name}-commands"))
+    failures = [c for c in created if isinstance(c, BaseException)]
+    if failures:
+        # don't leave half made channels behind, but report the failure that got us here over one from cleaning up
+        try:
+            await remove_channels(guild.id, category.id, *[c.id for c in created if not isinstance(c, BaseException)])
+        except Exception as e:
+            logger.error(f"Failed to remove the channels made for {name}")
+            logger.error(f"{str(e)}")
+        raise failures[0]
+    info, command = created
     return info.id, command.id, category.id
 
 
-async def remove_channels(guild: int, *channel_ids: int):
+# deletes the channels concurrently and returns whether each one was deleted
+async def remove_channels(guild: int, *channel_ids: int) -> dict[int, bool]:
     guild: Guild = _bot.get_guild(guild)
     if guild is None:
         raise KeyError(f"Bot is not in guild with id: {guild}")
-    for id_ in channel_ids:
-        logger.info(f"Removing channel with id {id_}")
-        channel = guild.get_channel_or_thread(id_)
-        if channel is None:
-            logger.error(f"Channel with id {id_} not found")
-            continue
-        try:
-            await channel.delete()
-        except Forbidden:
-            logger.error(f"No permission to delete channel {channel.name}")
+    deleted = await asyncio.gather(*(_remove_channel(guild, id_) for id_ in channel_ids))
+    return dict(zip(channel_ids, deleted))
+
+
+async def _remove_channel(guild: Guild, channel_id: int) -> bool:
+    logger.info(f"Removing channel with id {channel_id}")
+    channel = guild.get_channel_or_thread(channel_id)
+    if channel is None:
+        logger.error(f"Channel with id {channel_id} not found")
+        return False
+    try:
+        await _scheduler.run((CHANNELS_ROUTE, guild.id), channel.delete)
+    except Forbidden:
+        logger.error(f"No permission to delete channel {channel.name}")
+        return False
+    except HTTPException as e:
+        logger.error(f"Failed to delete channel {channel.name}")
+        logger.error(f"{str(e)}")
+        return False
+    return True
@@ -3,11 +3,20 @@ import logging
 import shutil
 import sys
 import time
+from functools import partial
 from pathlib import Path
+from typing import Callable
 
 import Mafia
 import Storage
 import UI
+from Storage.Backend import StorageBackend
+from Storage.MemoryBackend import MemoryBackend
+from Storage.MongoBackend import MongoBackend
+from Storage.SQLiteBackend import SQLiteBackend
+from Events.EventQueue import DEFAULT_MAX_QUEUE_SIZE, DEFAULT_QUEUE_WORKERS
+from Storage.WriteBehind import DEFAULT_MAX_STALENESS, DEFAULT_MAX_BATCH_SIZE
+from UI.Cache import DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL
 
 FILENAME = time.strftime("Log%Y-%m-%d-%H:%M.log")
 
@@ -19,6 +28,25 @@ LOG_PATH_KEY = "path"
 BOT_TOKEN_KEY = "token"
 DATABASE_KEY = "name"
 ENTITIES_KEY = "entities"
+MAX_STALENESS_KEY = "maxstaleness"
+MAX_BATCH_SIZE_KEY = "maxbatchsize"
+MAX_WORKERS_KEY = "maxworkers"
+LAZY_LOADING_KEY = "lazyloading"
+MAX_RESIDENT_KEY = "maxresidententities"
+SHARDED_KEY = "sharded"
+WORKERS_KEY = "workers"
+QUEUED_DISPATCH_KEY = "queueddispatch"
+MAX_QUEUE_SIZE_KEY = "maxqueuesize"
+QUEUE_WORKERS_KEY = "queueworkers"
+CACHE_SIZE_KEY = "cachesize"
+CACHE_TTL_KEY = "cachettl"
+SNAPSHOT_PATH_KEY = "snapshotpath"
+WRITE_AHEAD_LOG_KEY = "writeaheadlog"
+BACKEND_KEY = "backend"
+SQLITE_PATH_KEY = "sqlitepath"
+REQUIRE_INDEXES_KEY = "requireindexes"
+
+DEFAULT_SQLITE_PATH = "./entities.db"
 
 
 def read_config():
@@ -44,14 +72,67 @@ def stop_logging(path: str):
     shutil.copyfile(f"{path}/{FILENAME}", f"{path}/LATEST.log")
 
 
+# worker processes make their own backend from this, with the memory backend each one keeps its own entities
+def backend_factory(config_data: dict) -> Callable[[], StorageBackend]:
+    backend = config_data.get(BACKEND_KEY, "mongo").lower()
+    if backend == "sqlite":
+        return partial(SQLiteBackend, config_data.get(SQLITE_PATH_KEY, DEFAULT_SQLITE_PATH))
+    if backend == "memory":
+        return MemoryBackend
+    return partial(MongoBackend, config_data[DATABASE_KEY], config_data[ENTITIES_KEY])
+
+
 if __name__ == '__main__':
     config_data = read_config()
     start_logging(config_data[LOG_PATH_KEY], config_data[LOG_LEVEL_KEY])
 
-    Storage.configure_database(config_data[DATABASE_KEY], config_data[ENTITIES_KEY])
+    make_backend = backend_factory(config_data)
+    Storage.configure_backend(make_backend())
+    Storage.configure_executor(int(config_data.get(MAX_WORKERS_KEY, Storage.DEFAULT_MAX_WORKERS)))
+    require_indexes = config_data.get(REQUIRE_INDEXES_KEY, "true").lower() == "true"
+    Storage.require_indexes(require_indexes)
     Mafia.register_mafia_components()
-    world = Mafia.setup_world()
+    max_resident = config_data.get(MAX_RESIDENT_KEY)
+    world_options = (float(config_data.get(MAX_STALENESS_KEY, DEFAULT_MAX_STALENESS)),
+                     int(config_data.get(MAX_BATCH_SIZE_KEY, DEFAULT_MAX_BATCH_SIZE)),
+                     config_data.get(LAZY_LOADING_KEY, "false").lower() == "true",
+                     int(max_resident) if max_resident else None)
+    workers = int(config_data.get(WORKERS_KEY, 0))
+    sharded = config_data.get(SHARDED_KEY, "false").lower() == "true"
+    snapshot_path = config_data.get(SNAPSHOT_PATH_KEY) or None
+    log_path = config_data.get(WRITE_AHEAD_LOG_KEY) or None
+    if workers > 0 or sharded:
+        # the workers host their worlds as shards too
+        Mafia.shard_unsharded_entities()
+    if workers > 0:
+        pool = Mafia.setup_worker_pool(workers, make_backend,
+                                       int(config_data.get(MAX_WORKERS_KEY, Storage.DEFAULT_MAX_WORKERS)),
+                                       *world_options, require_indexes)
+    elif sharded:
+        world = Mafia.setup_world_manager(*world_options, log_path)
+    else:
+        world = Mafia.setup_world(*world_options, snapshot_path, log_path)
+    if workers == 0:
+        # the worlds have declared their indexes by now
+        Storage.ensure_indexes()
+    if config_data.get(QUEUED_DISPATCH_KEY, "false").lower() == "true":
+        Mafia.setup_event_queue(int(config_data.get(MAX_QUEUE_SIZE_KEY, DEFAULT_MAX_QUEUE_SIZE)),
+                                int(config_data.get(QUEUE_WORKERS_KEY, DEFAULT_QUEUE_WORKERS)))
+    UI.configure_cache(int(config_data.get(CACHE_SIZE_KEY, DEFAULT_CACHE_SIZE)),
+                       float(config_data.get(CACHE_TTL_KEY, DEFAULT_CACHE_TTL)))
+    if workers == 0:
+        # the last async flush runs before nextcord cancels the tasks left on the loop
+        UI.add_close_hook(world.flush_async)
     UI.setup_bot()
     UI.start_bot(config_data["token"])
 
+    if workers > 0:
+        logging.info("Stopping workers")
+        pool.stop()
+    else:
+        logging.info("Flushing unsaved entities")
+        Storage.shutdown_executor()
+        world.flush()
+        if snapshot_path is not None and not sharded:
+            world.save_snapshot(snapshot_path)
     stop_logging(config_data[LOG_PATH_KEY])
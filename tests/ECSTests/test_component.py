@@ -0,0 +1,67 @@
+import logging
+import unittest
+
+from ECS import Component, component, field
+
+logging.disable(logging.CRITICAL)
+
+
+@component
+class Point(Component):
+    x: int
+    y: int
+    label: str = field(key="name", compare=False)
+
+
+@component
+class Point3(Point):
+    z: int
+
+
+@component
+class Counter(Component):
+    count: int
+
+    def __init__(self, count: int = 0):
+        super().__init__()
+        self.count = count
+
+
+class LoosePoint(Point):
+    pass
+
+
+class ComponentDecoratorTestCase(unittest.TestCase):
+
+    def test_generated_methods(self):
+        point = Point(1, 2, "a")
+        self.assertEqual(point.__dict__(), {"x": 1, "y": 2, "name": "a"})
+        self.assertEqual(Point.from_dict(point.__dict__()), point)
+        self.assertEqual(point, Point(1, 2, "b"))
+        self.assertNotEqual(point, Point(1, 3, "a"))
+        self.assertNotEqual(point, Point3(1, 2, "a", 0))
+
+    def test_slots(self):
+        for point in (Point(1, 2, "a"), Point3(1, 2, "a", 3)):
+            with self.assertRaises(AttributeError):
+                point.other = 1
+        self.assertEqual(Point3.__slots__, ("z",))
+
+    def test_inheritance(self):
+        point = Point3(1, 2, "a", 3)
+        self.assertEqual(point.__dict__(), {"x": 1, "y": 2, "name": "a", "z": 3})
+        self.assertEqual(Point3.from_dict(point.__dict__()), point)
+
+        # subclasses without the decorator lose the slots but keep working
+        loose = LoosePoint(1, 2, "a")
+        self.assertEqual(loose.__dict__(), {"x": 1, "y": 2, "name": "a"})
+        self.assertEqual(LoosePoint.from_dict(loose.__dict__()), loose)
+
+    def test_storage_key(self):
+        self.assertEqual(Point.storage_key("label"), "name")
+        self.assertEqual(Point3.storage_key("x"), "x")
+        self.assertEqual(Counter.storage_key("count"), "count")
+
+    def test_own_methods_are_kept(self):
+        self.assertEqual(Counter().count, 0)
+        self.assertEqual(Counter.from_dict({"count": 2}), Counter(2))
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import threading
+import unittest
+from unittest.mock import patch
+
+import ECS
+import Storage
+from ECS import World, CachePolicy, Component, component, field
+from tests import ECSTests
+from tests.ECSTests import TestComponent, TestComponent2
+from tests.StorageTests.test_storage import TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION
+
+logging.disable(logging.CRITICAL)
+
+
+@component
+class Named(Component):
+    name: str = field(key="n")
+
+
+class LazyLoadingTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+        Storage.configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        Storage.clear_entity_collection()
+        stored = World()
+        self.id1 = stored.add_components(None, TestComponent(1))
+        self.id2 = stored.add_components(None, TestComponent(2), TestComponent2())
+        self.id3 = stored.add_components(None, TestComponent2())
+        self.world = World()
+
+    def tearDown(self) -> None:
+        Storage.clear_entity_collection()
+
+    def test_load_on_access(self):
+        self.world.enable_lazy_loading()
+        self.assertEqual(len(self.world._entities), 0)
+
+        self.assertEqual(self.world.get_components(self.id1), {TestComponent: TestComponent(1)})
+        self.assertEqual(len(self.world._entities), 1)
+        self.assertTrue(self.world.has_entity(self.id3))
+        self.assertEqual(len(self.world._entities), 2)
+
+        self.world.add_components(self.id1, TestComponent2())
+        self.assertEqual(set(Storage.load_entity(self.id1)["components"]),
+                         {TestComponent.__name__, TestComponent2.__name__})
+
+    def test_load_on_query(self):
+        self.world.enable_lazy_loading()
+
+        self.assertEqual(self.world.query_components(TestComponent, TestComponent2), {self.id2})
+        self.assertEqual(set(self.world._entities), {self.id2})
+
+        self.assertEqual(self.world.query_components(TestComponent), {self.id1, self.id2})
+        self.assertEqual(self.world.lookup(TestComponent2), {self.id2, self.id3})
+        self.assertEqual(self.world.lookup(TestComponent, test_int=1), {self.id1})
+
+    def test_lookup_loads_matches(self):
+        self.world.enable_lazy_loading()
+
+        self.assertEqual(self.world.lookup(TestComponent, test_int=2), {self.id2})
+        self.assertEqual(set(self.world._entities), {self.id2})
+        self.assertEqual(self.world.lookup(TestComponent, test_int=3), frozenset())
+
+        self.world.add_components(self.id2, TestComponent(1), replace=True)
+        self.assertEqual(self.world.lookup(TestComponent, test_int=1), {self.id1, self.id2})
+        self.assertEqual(self.world.lookup(TestComponent, test_int=2), frozenset())
+
+    def test_lookup_renamed_field(self):
+        ECS.add_component_mapping(Named)
+        stored = World()
+        id4 = stored.add_components(None, Named("a"))
+        stored.add_components(None, Named("b"))
+        self.world.enable_lazy_loading()
+
+        self.assertEqual(self.world.lookup(Named, name="a"), {id4})
+        self.assertEqual(set(self.world._entities), {id4})
+
+    async def test_async_loads_off_loop(self):
+        self.world.enable_lazy_loading()
+        loop_thread = threading.current_thread()
+        threads = []
+
+        def recorded(func):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return func(*args, **kwargs)
+            return wrapper
+
+        with patch.object(Storage, "load_entity", recorded(Storage.load_entity)), \
+                patch.object(Storage, "find_entities", recorded(Storage.find_entities)):
+            self.assertEqual(await self.world.get_components_async(self.id1), {TestComponent: TestComponent(1)})
+            self.assertEqual(await self.world.lookup_async(TestComponent, test_int=2), {self.id2})
+            self.assertEqual(await self.world.query_components_async(TestComponent2), {self.id2, self.id3})
+            rows = await self.world.query_component_rows_async(TestComponent)
+        self.assertEqual({uuid_ for uuid_, _ in rows}, {self.id1, self.id2})
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_eviction(self):
+        self.world.enable_lazy_loading(CachePolicy(2))
+
+        self.world.get_components(self.id3)
+        self.world.get_components(self.id1)
+        self.world.get_components(self.id2)
+        self.assertEqual(set(self.world._entities), {self.id1, self.id2})
+
+        # the query result stays loaded and the unloaded entity is fetched again by the next query
+        self.assertEqual(self.world.query_components(TestComponent2), {self.id2, self.id3})
+        self.assertEqual(set(self.world._entities), {self.id2, self.id3})
+        self.assertEqual(self.world.query_components(TestComponent), {self.id1, self.id2})
+        self.assertEqual(set(self.world._entities), {self.id1, self.id2})
+
+    def test_pinned(self):
+        self.world.enable_lazy_loading(CachePolicy(1, TestComponent2))
+
+        self.world.get_components(self.id3)
+        self.world.get_components(self.id1)
+        self.assertEqual(set(self.world._entities), {self.id1, self.id3})
+        self.world.get_components(self.id2)
+        self.assertEqual(set(self.world._entities), {self.id2, self.id3})
+
+    async def test_pending_changes(self):
+        self.world.enable_write_behind(max_staleness=10)
+        self.world.enable_lazy_loading(CachePolicy(1))
+
+        self.world.remove_entity(self.id1)
+        self.assertFalse(self.world.has_entity(self.id1))
+        self.assertEqual(self.world.query_components(TestComponent), {self.id2})
+
+        id4 = self.world.add_components(None, TestComponent(4))
+        self.world.get_components(self.id3)
+        self.assertTrue(id4 in self.world._entities)
+
+        await self.world.flush_async()
+        self.world.get_components(self.id3)
+        self.assertFalse(id4 in self.world._entities)
+        self.assertTrue(self.world.has_entity(id4))
+
+    async def test_evict_during_flush(self):
+        self.world.enable_write_behind(max_staleness=10, max_batch_size=1)
+        self.world.enable_lazy_loading(CachePolicy(1))
+        bulk_write_async = Storage.bulk_write_async
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def stalled(*args):
+            started.set()
+            await release.wait()
+            return await bulk_write_async(*args)
+
+        Storage.bulk_write_async = stalled
+        try:
+            id4 = self.world.add_components(None, TestComponent(4))
+            self.world.remove_entity(self.id1)
+            await started.wait()
+
+            # both writes are in flight, so neither entity may come back from storage
+            self.world.get_components(self.id3)
+            self.assertEqual(self.world.get_components(id4), {TestComponent: TestComponent(4)})
+            self.assertFalse(self.world.has_entity(self.id1))
+
+            release.set()
+            await self.world.flush_async()
+        finally:
+            Storage.bulk_write_async = bulk_write_async
+        self.assertIsNotNone(Storage.load_entity(id4))
+        self.assertIsNone(Storage.load_entity(self.id1))
@@ -0,0 +1,87 @@
+import logging
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+
+import Storage
+from ECS import World
+from Storage import Snapshot
+from tests import ECSTests
+from tests.ECSTests import TestComponent, TestComponent2
+from tests.StorageTests.test_storage import TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION
+
+logging.disable(logging.CRITICAL)
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+        Storage.configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        Storage.clear_entity_collection()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "world.snapshot")
+        self.world = World()
+        self.world.add_index(TestComponent, "test_int")
+        self.id1 = self.world.add_components(None, TestComponent(1))
+        self.id2 = self.world.add_components(None, TestComponent(2), TestComponent2())
+        self.id3 = self.world.add_components(None)
+
+    def tearDown(self) -> None:
+        Storage.clear_entity_collection()
+        self.directory.cleanup()
+
+    def test_save_and_load(self):
+        self.assertTrue(self.world.save_snapshot(self.path))
+
+        world = World()
+        self.assertTrue(world.load_snapshot(self.path))
+        for id_ in (self.id1, self.id2, self.id3):
+            self.assertEqual(world.get_components(id_), self.world.get_components(id_))
+        self.assertEqual(world.query_components(TestComponent2), {self.id2})
+        self.assertEqual(world.lookup(TestComponent, test_int=2), {self.id2})
+        self.assertIn("test_int", world._indexes[TestComponent])
+
+        # only empty worlds can be filled from a snapshot
+        self.assertFalse(world.load_snapshot(self.path))
+        self.assertFalse(World(1).load_snapshot(self.path))
+
+    @patch.object(Snapshot, "REPLAY_MARGIN", timedelta(0))
+    def test_replay_changes(self):
+        self.world.save_snapshot(self.path)
+        time.sleep(0.01)
+
+        # changes made without stamping saved_at are not replayed, so the snapshot must be what was loaded
+        Storage.get_backend().save_entity(self.id1, {"$set": {"components.TestComponent.test_int": 5}})
+
+        self.world.add_components(self.id2, TestComponent(3), replace=True)
+        self.world.remove_entity(self.id3)
+        id4 = self.world.add_components(None, TestComponent2())
+
+        world = World()
+        world.add_index(TestComponent, "test_int")
+        self.assertTrue(world.load_snapshot(self.path))
+        self.assertEqual(world.get_components(self.id1), {TestComponent: TestComponent(1)})
+        self.assertEqual(world.get_components(self.id2), {TestComponent: TestComponent(3),
+                                                          TestComponent2: TestComponent2()})
+        self.assertFalse(world.has_entity(self.id3))
+        self.assertEqual(world.get_components(id4), {TestComponent2: TestComponent2()})
+        self.assertEqual(world.lookup(TestComponent, test_int=2), set())
+        self.assertEqual(world.lookup(TestComponent, test_int=3), {self.id2})
+
+    def test_missing_or_invalid_snapshot(self):
+        self.assertFalse(World().load_snapshot(self.path))
+
+        with open(self.path, "wb") as file:
+            file.write(b"not a snapshot")
+        self.assertFalse(World().load_snapshot(self.path))
+
+        world = World()
+        world.enable_lazy_loading()
+        self.assertFalse(world.save_snapshot(self.path))
@@ -37,3 +37,4 @@ class IntWrapperTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertNotEqual(int_test, channel)
 
         self.assertEqual(int_test, int_test2)
+        self.assertEqual(IntWrapperTest.storage_key("data"), "test")
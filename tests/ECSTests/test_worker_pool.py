@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import unittest
+
+import Events
+from ECS import World
+from ECS.WorkerPool import WorkerPool, RemoteError, _Connection, _CALL, _RESPONSE
+from ECS.WorldManager import WorldManager
+
+logging.disable(logging.CRITICAL)
+
+GUILDS = range(12)
+
+# filled in the front end by calls from the workers
+front_end_calls = []
+
+
+async def record_call(guild: int, pid: int):
+    front_end_calls.append((guild, pid))
+    return True
+
+
+async def report_worker(world: World, *args, **kwargs):
+    # record_call is replaced in the worker with a call back to the front end
+    await record_call(world.shard_id, os.getpid())
+    return world.shard_id, os.getpid()
+
+
+async def failing_call():
+    raise ValueError("front end call failed")
+
+
+class StrictError(Exception):
+    # like nextcord's HTTPException it cannot be built again from its args, so it fails to unpickle
+    def __init__(self, response, message: str):
+        super().__init__(message)
+        self.response = response
+
+
+async def batch_call():
+    return {1: True, 2: StrictError(None, "forbidden")}
+
+
+async def call_batch(world: World, *args, **kwargs):
+    return await batch_call()
+
+
+async def fail(world: World, *args, **kwargs):
+    raise ValueError("processor failed")
+
+
+async def call_fail(world: World, *args, **kwargs):
+    try:
+        await failing_call()
+    except RemoteError as e:
+        return str(e)
+
+
+def setup_worker() -> WorldManager:
+    manager = WorldManager(World)
+    manager.register_processor_events(report_worker, "report", aggregator=list)
+    manager.register_processor_events(fail, "fail")
+    manager.register_processor_events(call_fail, "call_fail")
+    manager.register_processor_events(call_batch, "call_batch")
+    return manager
+
+
+class WorkerPoolTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        front_end_calls.clear()
+        self.pool = WorkerPool(setup_worker, 3, [f"{__name__}.record_call", f"{__name__}.failing_call",
+                                                    f"{__name__}.batch_call"])
+        self.pool.start()
+        self.pool.register_events("report", "fail", "call_fail", "call_batch")
+
+    async def asyncTearDown(self) -> None:
+        Events.EVENT_MANAGER.clear()
+        self.pool.stop(10)
+
+    async def test_guilds_served_by_workers(self):
+        self.assertEqual(len(self.pool), 3)
+
+        owners = {}
+        for guild in GUILDS:
+            results = await Events.EVENT_MANAGER.dispatch_event("report", guild=guild)
+            self.assertEqual(len(results), 1)
+            shard_id, pid = results[0]
+            self.assertEqual(shard_id, guild)
+            self.assertNotEqual(pid, os.getpid())
+            owners[guild] = pid
+
+        # every guild stays on the same worker and the guilds are spread over all of them
+        for guild in GUILDS:
+            self.assertEqual((await Events.EVENT_MANAGER.dispatch_event("report", guild=guild))[0][1], owners[guild])
+        self.assertEqual(len(set(owners.values())), 3)
+        self.assertEqual(sorted(front_end_calls), sorted(list(owners.items()) * 2))
+
+        # without a guild every worker runs the event on its loaded shards
+        results = await Events.EVENT_MANAGER.dispatch_event("report")
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(r for worker_results in results for r in worker_results), sorted(owners.items()))
+
+    async def test_errors(self):
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("fail", guild=1), [])
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("call_fail", guild=1),
+                         ["ValueError: front end call failed"])
+
+    async def test_exceptions_in_results(self):
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("call_batch", guild=1),
+                         [{1: True, 2: "StrictError: forbidden"}])
+        self.assertEqual(len(await Events.EVENT_MANAGER.dispatch_event("report", guild=1)), 1)
+
+
+class ConnectionTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def test_unreadable_message(self):
+        send, receive = multiprocessing.Queue(), multiprocessing.Queue()
+        connection = _Connection(send, receive)
+        serving = asyncio.create_task(connection.serve())
+        first = asyncio.create_task(connection.request(_CALL, "first"))
+        second = asyncio.create_task(connection.request(_CALL, "second"))
+        await asyncio.sleep(0)
+
+        receive.put((_RESPONSE, 0, StrictError(None, "forbidden"), None))
+        receive.put(None)
+        await serving
+
+        with self.assertRaises(RemoteError):
+            await first
+        with self.assertRaises(RemoteError):
+            await second
@@ -1,6 +1,7 @@
 import logging
 import unittest
 import uuid
+from unittest.mock import patch
 
 import ECS
 import Events
@@ -204,6 +205,20 @@ class WorldTestCase(unittest.IsolatedAsyncioTestCase):
         self.world.save_entity(id1)
         self.assertIsNotNone(Storage.load_entity(id1))
 
+    async def test_entity_update(self):
+        self.assertIsNone(self.world.get_entity_update(uuid.uuid4()))
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.assertEqual(self.world.get_entity_update(id1), {"$set": self.world.get_entity_data(id1)})
+
+        # components written by someone else are left alone
+        Storage.save_entity({"id": id1, "components": {TestComponent.__name__: {}, "Other": {}}})
+        self.world.add_components(id1, TestComponent2())
+        self.world.remove_components(id1, TestComponent)
+        self.assertEqual(Storage.load_entity(id1)["components"], {TestComponent2.__name__: {}, "Other": {}})
+
+        self.world.save_entity(id1)
+        self.assertEqual(Storage.load_entity(id1)["components"], {TestComponent2.__name__: {}})
+
     async def test_add_entities(self):
         id1 = self.world.add_components(None, *self.entity1_components)
         id2 = self.world.add_components(None, *self.entity1_components)
@@ -221,6 +236,47 @@ class WorldTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(self.world.has_entity(id2))
         self.assertTrue(self.world.has_entity(id3))
 
+    async def test_add_entities_without_saving(self):
+        id1 = self.world.add_components(None, TestComponent(1), TestComponent2())
+        id2 = self.world.add_components(None, TestComponent(2))
+        data = [Storage.load_entity(id1), Storage.load_entity(id2)]
+
+        world = World()
+        world.add_index(TestComponent, "test_int")
+        with patch.object(TestComponent, "from_dicts", wraps=TestComponent.from_dicts) as from_dicts, \
+                patch("Storage.save_entity") as save_entity, patch("Storage.bulk_write") as bulk_write:
+            world.add_entities(*data)
+        from_dicts.assert_called_once()
+        save_entity.assert_not_called()
+        bulk_write.assert_not_called()
+
+        self.assertEqual(world.get_components(id1), self.world.get_components(id1))
+        self.assertEqual(world.get_components(id2), self.world.get_components(id2))
+        self.assertEqual(world.query_components(TestComponent2), {id1})
+        self.assertEqual(world.lookup(TestComponent, test_int=2), {id2})
+
+    async def test_add_entities_lazy(self):
+        data = [{"id": uuid.uuid4(), "components": {TestComponent.__name__: TestComponent(i).__dict__()}}
+                for i in range(3)]
+        world = World()
+        world.enable_lazy_loading()
+        with patch("Storage.load_entity") as load_entity:
+            world.add_entities(*data)
+        load_entity.assert_not_called()
+        self.assertEqual(world.get_components(data[1]["id"]), {TestComponent: TestComponent(1)})
+
+    async def test_load_entities(self):
+        Storage.clear_entity_collection()
+        ids = {self.world.add_components(None, TestComponent(i)) for i in range(5)}
+
+        world = World()
+        self.assertEqual(world.load_entities(batch_size=2), 5)
+        self.assertEqual(world.query_components(TestComponent), ids)
+
+        world = World()
+        self.assertEqual(await world.load_entities_async(batch_size=2), 5)
+        self.assertEqual(world.query_components(TestComponent), ids)
+
     async def test_remove_components(self):
         id = self.world.add_components(None, *self.entity1_components)
 
@@ -247,3 +303,112 @@ class WorldTestCase(unittest.IsolatedAsyncioTestCase):
 
         id = uuid.uuid4()
         self.assertEqual(self.world.remove_components(id, TestComponent, TestComponent2), None)
+
+    async def test_archetypes(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        id2 = self.world.add_components(None, TestComponent(2))
+        id3 = self.world.add_components(None, TestComponent(3), TestComponent2())
+
+        self.assertEqual(len(self.world._archetypes), 2)
+        self.assertIs(self.world._entities[id1], self.world._entities[id2])
+
+        self.world.add_components(id1, TestComponent2())
+        self.assertIs(self.world._entities[id1], self.world._entities[id3])
+        self.assertEqual(self.world.get_components(id2), {TestComponent: TestComponent(2)})
+        self.assertEqual(self.world.query_components(TestComponent, TestComponent2), {id1, id3})
+
+        self.world.remove_entity(id3)
+        self.assertEqual(self.world.get_components(id1), {TestComponent: TestComponent(1),
+                                                          TestComponent2: TestComponent2()})
+        self.assertEqual(self.world.query_components(TestComponent2), {id1})
+
+    async def test_replace_components(self):
+        self.world.add_index(TestComponent, "test_int")
+        id1 = self.world.add_components(None, TestComponent(1))
+
+        self.world.add_components(id1, TestComponent(2), TestComponent2())
+        self.assertEqual(self.world.get_components(id1, TestComponent), {TestComponent: TestComponent(1)})
+
+        archetype = self.world._entities[id1]
+        self.world.add_components(id1, TestComponent(3), TestComponent(4), replace=True)
+        self.assertIs(self.world._entities[id1], archetype)
+        self.assertEqual(self.world.get_components(id1, TestComponent), {TestComponent: TestComponent(3)})
+        self.assertEqual(self.world.lookup(TestComponent, test_int=1), set())
+        self.assertEqual(self.world.lookup(TestComponent, test_int=3), {id1})
+        self.assertEqual(Storage.load_entity(id1)["components"][TestComponent.__name__],
+                         TestComponent(3).__dict__())
+
+    async def test_add_components_bulk(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        id2 = uuid.uuid4()
+
+        ids = self.world.add_components_bulk((id1, [TestComponent(2), TestComponent2()]), (id2, [TestComponent(3)]),
+                                             (None, []), replace=True)
+        self.assertEqual(ids[:2], [id1, id2])
+        self.assertEqual(self.world.get_components(id1), {TestComponent: TestComponent(2),
+                                                          TestComponent2: TestComponent2()})
+        self.assertEqual(self.world.get_components(id2), {TestComponent: TestComponent(3)})
+        self.assertEqual(self.world.get_components(ids[2]), {})
+        for id_ in ids:
+            self.assertEqual(Storage.load_entity(id_)["components"], self.world.get_entity_data(id_)["components"])
+
+    async def test_query_component_rows(self):
+        self.assertEqual(self.world.query_component_rows(TestComponent), [])
+
+        id1 = self.world.add_components(None, TestComponent(1))
+        id2 = self.world.add_components(None, TestComponent(2), TestComponent2())
+
+        rows = dict(self.world.query_component_rows(TestComponent))
+        self.assertEqual(rows, {id1: {TestComponent: TestComponent(1)},
+                                id2: {TestComponent: TestComponent(2)}})
+
+        rows = self.world.query_component_rows(TestComponent, TestComponent2)
+        self.assertEqual(rows, [(id2, {TestComponent: TestComponent(2), TestComponent2: TestComponent2()})])
+
+    async def test_registered_query(self):
+        id1 = self.world.add_components(None, TestComponent())
+        query = self.world.register_query(TestComponent, TestComponent2)
+        self.assertIs(self.world.register_query(TestComponent2, TestComponent), query)
+        self.assertEqual(query.result, set())
+
+        self.world.add_components(id1, TestComponent2())
+        self.assertEqual(query.result, {id1})
+
+        result = self.world.query_components(TestComponent, TestComponent2)
+        self.assertIs(self.world.query_components(TestComponent, TestComponent2), result)
+
+        id2 = self.world.add_components(None, TestComponent2(), TestComponent())
+        self.assertEqual(self.world.query_components(TestComponent, TestComponent2), {id1, id2})
+        self.assertEqual(result, {id1})
+
+        self.world.remove_components(id1, TestComponent)
+        self.assertEqual(query.result, {id2})
+        self.assertEqual(self.world.query_components(TestComponent), {id2})
+
+        self.world.remove_entity(id2)
+        self.assertEqual(len(query), 0)
+
+    async def test_index(self):
+        id1 = self.world.add_components(None, TestComponent(1, "a"))
+        self.world.add_index(TestComponent, "test_int")
+        id2 = self.world.add_components(None, TestComponent(2, "a"), TestComponent2())
+        id3 = self.world.add_components(None, TestComponent(2, "b"))
+
+        self.assertEqual(self.world.lookup(TestComponent, test_int=1), {id1})
+        self.assertEqual(self.world.lookup(TestComponent, test_int=2), {id2, id3})
+        self.assertEqual(self.world.lookup(TestComponent, test_int=3), set())
+
+        # test_str has no declared index so it is built on demand
+        self.assertEqual(self.world.lookup(TestComponent, test_int=2, test_str="a"), {id2})
+        self.assertEqual(self.world.lookup(TestComponent, test_str="a"), {id1, id2})
+
+        self.world.remove_components(id2, TestComponent)
+        self.assertEqual(self.world.lookup(TestComponent, test_int=2), {id3})
+
+        self.world.remove_entity(id3)
+        self.assertEqual(self.world.lookup(TestComponent, test_int=2), set())
+
+        self.world.get_components(id1, TestComponent)[TestComponent].test_int = 5
+        self.world.reindex(id1, TestComponent)
+        self.assertEqual(self.world.lookup(TestComponent, test_int=1), set())
+        self.assertEqual(self.world.lookup(TestComponent, test_int=5), {id1})
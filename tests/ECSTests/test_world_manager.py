@@ -0,0 +1,89 @@
+import logging
+import unittest
+
+import Events
+import Storage
+from ECS import World
+from ECS.ECSWrappers import query
+from ECS.WorldManager import WorldManager
+from tests import ECSTests
+from tests.ECSTests import TestComponent
+from tests.StorageTests.test_storage import TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION
+
+logging.disable(logging.CRITICAL)
+
+
+async def add_entity(world: World, *args, **kwargs):
+    world.add_components(None, TestComponent(kwargs["num"]))
+    await Events.EVENT_MANAGER.dispatch_event("nested")
+    return world.shard_id
+
+
+@query("test", TestComponent)
+async def count_entities(world: World, *args, **kwargs):
+    return len(kwargs["test"])
+
+
+def create_world(shard_id: int) -> World:
+    world = World(shard_id)
+    world.add_entities(*Storage.load_all_entities(shard_id))
+    return world
+
+
+class WorldManagerTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+        Storage.configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        Events.EVENT_MANAGER.clear()
+        self.manager = WorldManager(create_world)
+        self.manager.register_processor_events(add_entity, "add")
+        self.manager.register_processor_events(count_entities, "count", "nested", aggregator=sum)
+
+    def tearDown(self) -> None:
+        Events.EVENT_MANAGER.clear()
+        Storage.clear_entity_collection()
+
+    async def test_routing(self):
+        self.assertEqual(len(self.manager), 0)
+
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("add", guild=1, num=1), [1])
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("add", guild=1, num=2), [1])
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("add", guild=2, num=3), [2])
+
+        self.assertEqual(len(self.manager), 2)
+        self.assertEqual(len(self.manager.get_shard(1).query_components(TestComponent)), 2)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("count", guild=2), [1])
+
+        # without a guild the processor runs on every shard
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("count"), [3])
+
+    async def test_nested_events_stay_on_shard(self):
+        results = []
+
+        async def record(world: World, *args, **kwargs):
+            results.append(world.shard_id)
+
+        self.manager.register_processor_events(record, "nested")
+        self.manager.load_shard(3)
+
+        await Events.EVENT_MANAGER.dispatch_event("add", guild=1, num=1)
+        self.assertEqual(results, [1])
+
+    async def test_load_and_unload(self):
+        await Events.EVENT_MANAGER.dispatch_event("add", guild=1, num=1)
+        await Events.EVENT_MANAGER.dispatch_event("add", guild=2, num=2)
+        self.assertEqual(len(Storage.load_all_entities(1)), 1)
+        self.assertEqual(sorted(Storage.list_shards()), [1, 2])
+
+        world = self.manager.unload_shard(1)
+        self.assertEqual(world.shard_id, 1)
+        self.assertFalse(1 in self.manager)
+        self.assertIsNone(self.manager.unload_shard(1))
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("count"), [1])
+
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("count", guild=1), [1])
+        self.assertTrue(1 in self.manager)
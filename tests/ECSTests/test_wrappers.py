@@ -5,7 +5,7 @@ import uuid
 import ECS
 from ECS import World
 from ECS.ECSWrappers import _check_world_argument, query, InvalidParameterError, _extract_world, query_component_loop, \
-    query_entity_loop, StopProcess, query_entity_component_loop
+    query_entity_loop, StopProcess, query_entity_component_loop, lookup
 from tests.ECSTests import TestComponent, TestComponent2
 
 logging.disable(logging.CRITICAL)
@@ -280,3 +280,32 @@ class WrapperTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(await world_.run_processor(test_stop_return), 4)
 
         self.assertEqual(test_stop_return.counter, 4)
+
+    async def test_lookup_wrapper(self):
+        world_ = World()
+
+        try:
+            @lookup("test", TestComponent, test_int="value")
+            async def func_without_world():
+                pass
+
+            assert False
+        except InvalidParameterError:
+            assert True
+
+        @lookup("test", TestComponent, test_int="value")
+        async def func_with_world(world: World, **kwargs):
+            return kwargs["test"]
+
+        @lookup("test", TestComponent, TestComponent2, test_int="value")
+        async def func_with_components(world: World, **kwargs):
+            return kwargs["test"]
+
+        self.assertEqual(await world_.run_processor(func_with_world, value=1), set())
+
+        id1 = world_.add_components(None, TestComponent(num=1))
+        id2 = world_.add_components(None, TestComponent(num=1), TestComponent2())
+        world_.add_components(None, TestComponent(num=2), TestComponent2())
+
+        self.assertEqual(await world_.run_processor(func_with_world, value=1), {id1, id2})
+        self.assertEqual(await world_.run_processor(func_with_components, value=1), {id2})
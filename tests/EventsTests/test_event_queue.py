@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import unittest
+
+import Events
+from Events.EventQueue import EventQueue, Priority
+
+logging.disable(logging.CRITICAL)
+
+
+class EventQueueTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.order = []
+        self.release = asyncio.Event()
+
+    async def asyncTearDown(self) -> None:
+        self.release.set()
+        Events.EVENT_MANAGER.clear()
+
+    def use_queue(self, max_size: int = 10, num_workers: int = 1) -> EventQueue:
+        queue = EventQueue(Events.EVENT_MANAGER, max_size, num_workers)
+        Events.EVENT_MANAGER.set_queue(queue)
+        return queue
+
+    async def blocking_handler(self, *args, **kwargs):
+        await self.release.wait()
+        self.order.append("block")
+
+    async def recording_handler(self, name: str, *args, **kwargs):
+        self.order.append(name)
+        return name
+
+    async def test_dispatch(self):
+        queue = self.use_queue()
+        Events.EVENT_MANAGER.set_handler("foo", self.recording_handler)
+
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo", "a"), ["a"])
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("bar", "a"), [])
+        self.assertEqual(queue.metrics.processed, 2)
+        self.assertEqual(len(queue), 0)
+
+        with self.assertRaises(TypeError):
+            await Events.EVENT_MANAGER.dispatch_event("foo")
+
+    async def test_priority(self):
+        queue = self.use_queue()
+        queue.set_priority("background", Priority.BACKGROUND)
+        queue.set_priority("interactive", Priority.INTERACTIVE)
+        Events.EVENT_MANAGER.set_handler("block", self.blocking_handler)
+        for name in ("background", "normal", "interactive"):
+            Events.EVENT_MANAGER.set_handler(name, self.recording_handler)
+
+        blocked = asyncio.create_task(Events.EVENT_MANAGER.dispatch_event("block"))
+        await asyncio.sleep(0.01)
+        futures = [await queue.put(name, name) for name in ("background", "normal", "interactive", "normal")]
+        self.assertEqual(len(queue), 4)
+        self.assertEqual(queue.metrics.max_depth, 4)
+
+        self.release.set()
+        await blocked
+        await asyncio.gather(*futures)
+        self.assertEqual(self.order, ["block", "interactive", "normal", "normal", "background"])
+        self.assertGreater(queue.metrics.max_wait, 0)
+
+    async def test_backpressure(self):
+        queue = self.use_queue(max_size=1)
+        Events.EVENT_MANAGER.set_handler("block", self.blocking_handler)
+
+        blocked = asyncio.create_task(Events.EVENT_MANAGER.dispatch_event("block"))
+        await asyncio.sleep(0.01)
+        await queue.put("block")
+        put = asyncio.create_task(queue.put("block"))
+        await asyncio.sleep(0.01)
+        self.assertFalse(put.done())
+
+        self.release.set()
+        await asyncio.gather(blocked, await put)
+        self.assertEqual(self.order, ["block"] * 3)
+
+    async def test_limit(self):
+        queue = self.use_queue(num_workers=4)
+        queue.set_limit("foo", 2)
+        running = []
+
+        async def handler(*args, **kwargs):
+            running.append(len(running) + 1)
+            await asyncio.sleep(0.01)
+            running.remove(max(running))
+
+        Events.EVENT_MANAGER.set_handler("foo", handler)
+        peak = 0
+
+        async def watch():
+            nonlocal peak
+            while not done.is_set():
+                peak = max(peak, len(running))
+                await asyncio.sleep(0)
+
+        done = asyncio.Event()
+        watcher = asyncio.create_task(watch())
+        await asyncio.gather(*(Events.EVENT_MANAGER.dispatch_event("foo") for _ in range(6)))
+        done.set()
+        await watcher
+        self.assertEqual(peak, 2)
+
+    async def test_limit_does_not_hold_workers(self):
+        queue = self.use_queue(num_workers=2)
+        queue.set_limit("slow", 1)
+        queue.set_priority("fast", Priority.INTERACTIVE)
+        Events.EVENT_MANAGER.set_handler("slow", self.blocking_handler)
+        Events.EVENT_MANAGER.set_handler("fast", self.recording_handler)
+
+        slow = [await queue.put("slow") for _ in range(2)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(queue), 1)
+        # one worker runs the first slow event and the second waits aside, leaving the other worker free
+        self.assertEqual(await asyncio.wait_for(Events.EVENT_MANAGER.dispatch_event("fast", "fast"), 1), ["fast"])
+
+        self.release.set()
+        await asyncio.gather(*slow)
+        self.assertEqual(self.order, ["fast", "block", "block"])
+        await queue.stop()
+
+    async def test_limited_events_fill_queue(self):
+        queue = self.use_queue(max_size=3, num_workers=2)
+        queue.set_limit("slow", 1)
+        Events.EVENT_MANAGER.set_handler("slow", self.blocking_handler)
+
+        # one runs and the other three wait aside, which fills the queue
+        slow = [await queue.put("slow") for _ in range(4)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(queue), 3)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.put("slow"), 0.05)
+
+        self.release.set()
+        await asyncio.gather(*slow)
+        self.assertEqual(self.order, ["block"] * 4)
+        await queue.stop()
+
+    async def test_nested_events_are_not_queued(self):
+        self.use_queue()
+
+        async def outer(*args, **kwargs):
+            return await Events.EVENT_MANAGER.dispatch_event("inner", "inner")
+
+        Events.EVENT_MANAGER.set_handler("outer", outer)
+        Events.EVENT_MANAGER.set_handler("inner", self.recording_handler)
+        # would deadlock on the single worker if the inner event was queued
+        self.assertEqual(await asyncio.wait_for(Events.EVENT_MANAGER.dispatch_event("outer"), 1), [["inner"]])
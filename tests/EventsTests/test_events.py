@@ -3,6 +3,7 @@ import unittest
 
 import Events
 from ECS import World
+from Events.EventWrappers import batch_handler
 
 logging.disable(logging.CRITICAL)
 
@@ -23,6 +24,15 @@ async def handler_two_args(arg1, arg2, *args):
     return arg2 + arg1
 
 
+@batch_handler
+async def batch_handler_sum(*args, **kwargs):
+    return sum(p["value"] for p in kwargs["payloads"])
+
+
+async def handler_value(*args, **kwargs):
+    return kwargs["value"]
+
+
 async def handler_throws():
     raise Exception("test_events exception message")
 
@@ -86,6 +96,14 @@ class EventsTestCase(unittest.IsolatedAsyncioTestCase):
             assert False
         assert True
 
+    async def test_exception_handling_multiple_handlers(self):
+        Events.EVENT_MANAGER.set_handler("foo", handler_throws)
+        Events.EVENT_MANAGER.set_handler("foo", safe_handler_no_args)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo"), [True])
+
+        Events.EVENT_MANAGER.remove_handler("foo", safe_handler_no_args)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo"), [])
+
     async def test_set_instance_method_as_handler(self):
         class MyClass:
             value = 0
@@ -96,3 +114,34 @@ class EventsTestCase(unittest.IsolatedAsyncioTestCase):
         my_class = MyClass()
         Events.EVENT_MANAGER.set_handler("foo", my_class.process)
         self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo", World()), [0])
+
+    async def test_forwarder(self):
+        async def forward(*args, **kwargs):
+            return ["forwarded", *args]
+
+        async def forward_throws(*args, **kwargs):
+            raise Exception("test_events forward exception message")
+
+        Events.EVENT_MANAGER.set_handler("foo", handler_one_arg)
+        Events.EVENT_MANAGER.set_forwarder("foo", forward)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo", 1), ["forwarded", 1])
+
+        Events.EVENT_MANAGER.set_forwarder("foo", forward_throws)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo", 1), [])
+
+        Events.EVENT_MANAGER.remove_forwarder("foo")
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo", 1), [1])
+
+    async def test_dispatch_batch(self):
+        payloads = [{"value": 1}, {"value": 2}, {"value": 3}]
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_batch("foo", payloads), [])
+
+        Events.EVENT_MANAGER.set_handler("foo", handler_value)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_batch("foo", payloads), [1, 2, 3])
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_batch("foo", []), [])
+
+        Events.EVENT_MANAGER.remove_handler("foo", handler_value)
+        Events.EVENT_MANAGER.set_handler("foo", batch_handler_sum)
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_batch("foo", payloads), [6])
+        # single events are passed to batch handlers as a batch of one
+        self.assertEqual(await Events.EVENT_MANAGER.dispatch_event("foo", value=4), [4])
@@ -38,10 +38,14 @@ class ChannelTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(components[Channel], Channel(123))
 
     async def test_send_message(self):
-        UI.send_message = AsyncMock()
+        UI.broadcast_message = AsyncMock()
 
         self.world.add_components(None, Channel(123))
 
         await self.world.run_processor(send_message, message="test")
 
-        UI.send_message.assert_called_once_with("test", 123)
+        UI.broadcast_message.assert_called_once_with("test", 123)
+
+        self.world.add_components(None, Channel(456))
+        await self.world.run_processor(send_message, message="test2")
+        UI.broadcast_message.assert_called_with("test2", 123, 456)
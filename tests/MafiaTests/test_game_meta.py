@@ -67,6 +67,7 @@ class ChannelTestCase(unittest.IsolatedAsyncioTestCase):
 
         UI.make_role = AsyncMock(return_value=678)
         Events.EVENT_MANAGER.dispatch_event = AsyncMock()
+        Events.EVENT_MANAGER.dispatch_batch = AsyncMock()
 
         self.assertEqual(await Mafia.remove_games(world), 0)
         await sleep(0.05)
@@ -82,7 +83,7 @@ class ChannelTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(world.query_components(GameMeta)), 0)
         self.assertEqual(len(Storage.load_all_entities()), 0)
 
-        Events.EVENT_MANAGER.dispatch_event.assert_called_with(EventList.PRE_REMOVE_GAME_EVENT, uuid=entity_id)
+        Events.EVENT_MANAGER.dispatch_batch.assert_called_with(EventList.PRE_REMOVE_GAME_EVENT, [{"uuid": entity_id}])
 
         await Mafia.create_game(world, guild=123)
         await Mafia.create_game(world, guild=456)
@@ -132,3 +133,23 @@ class ChannelTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(await Mafia.game_exists(world, guild=123))
 
         self.assertFalse(await Mafia.game_exists(world, guild=456))
+
+    def test_shard_unsharded_entities(self):
+        world = ECS.World()
+        game = world.add_components(None, GameMeta(), Guild(123))
+        channel = world.add_components(None, Channel(1))
+        ECS.World(456).add_components(None, GameMeta(), Guild(456))
+
+        self.assertEqual(Mafia.shard_unsharded_entities(), 2)
+        self.assertEqual(Storage.load_entity(game)["shard"], 123)
+        self.assertEqual(Storage.load_entity(channel)["shard"], 123)
+        self.assertEqual(Mafia.shard_unsharded_entities(), 0)
+
+        # with two games there is no telling which one the channel belongs to
+        Storage.clear_entity_collection()
+        world.add_components(None, GameMeta(), Guild(123))
+        world.add_components(None, GameMeta(), Guild(456))
+        channel = world.add_components(None, Channel(1))
+        with self.assertRaisesRegex(Mafia.UnshardedEntitiesError, str(channel)):
+            Mafia.shard_unsharded_entities()
+        self.assertIsNone(Storage.load_entity(channel).get("shard"))
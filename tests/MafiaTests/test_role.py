@@ -40,6 +40,20 @@ class RoleTestCase(unittest.IsolatedAsyncioTestCase):
 
         UI.delete_role.assert_called_with(123, 456)
 
+    async def test_delete_roles_batch(self):
+        world: World = World()
+        UI.delete_role = AsyncMock()
+
+        entity_ids = [world.add_components(None, Guild(123), PlayerRole(456)),
+                      world.add_components(None, Guild(789), PlayerRole(12)),
+                      world.add_components(None, Guild(345))]
+
+        await world.run_processor(delete_player_role, payloads=[{"uuid": id_} for id_ in entity_ids])
+
+        self.assertEqual(UI.delete_role.await_count, 2)
+        UI.delete_role.assert_any_await(123, 456)
+        UI.delete_role.assert_any_await(789, 12)
+
     async def test_make_role(self):
         world: World = World()
         UI.make_role = AsyncMock(return_value=456)
@@ -85,9 +85,10 @@ class UserTestCase(unittest.IsolatedAsyncioTestCase):
 
         game_id = world.add_components(None, GameMeta(), Guild(123))
         user_id = world.add_components(None, DiscordUser(456, "test"))
-        UI.make_player_channels = AsyncMock(return_value=(789, 321, 654))
+        UI.make_player_channels_batch = AsyncMock(return_value={456: (789, 321, 654)})
 
         await world.run_processor(make_channels, entity_id=user_id)
+        UI.make_player_channels_batch.assert_called_with(123, ("test", 456))
 
         entity = world.get_components(user_id)
         self.assertTrue(PlayerChannel in entity)
@@ -98,6 +99,20 @@ class UserTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(entity[PlayerCommandChannel].data, 321)
         self.assertEqual(entity[PlayerCategory].data, 654)
 
+    async def test_make_channels_batch(self):
+        world = World()
+
+        world.add_components(None, GameMeta(), Guild(123))
+        user_id = world.add_components(None, DiscordUser(456, "test"))
+        user_id2 = world.add_components(None, DiscordUser(457, "test2"))
+        UI.make_player_channels_batch = AsyncMock(return_value={456: (789, 321, 654), 457: "KeyError: 'failed'"})
+
+        await world.run_processor(make_channels, payloads=[{"entity_id": user_id}, {"entity_id": user_id2}])
+        UI.make_player_channels_batch.assert_called_with(123, ("test", 456), ("test2", 457))
+
+        self.assertEqual(world.get_components(user_id, PlayerChannel)[PlayerChannel].data, 789)
+        self.assertFalse(PlayerChannel in world.get_components(user_id2, PlayerChannel))
+
     async def test_remove_channels(self):
         world = World()
         UI.remove_channels = AsyncMock()
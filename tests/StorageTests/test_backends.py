@@ -0,0 +1,231 @@
+import logging
+import os
+import tempfile
+import time
+import unittest
+import uuid
+from functools import partial
+
+import Storage
+from ECS import World
+from Storage.Backend import StorageBackend, INDEX_READY, INDEX_CREATED, INDEX_MISSING, \
+    MissingIndexError, DuplicateEntityIdError, as_update, utc_now
+from Storage.MemoryBackend import MemoryBackend
+from Storage.MongoBackend import MongoBackend
+from Storage.SQLiteBackend import SQLiteBackend
+from tests import ECSTests
+from tests.ECSTests import TestComponent, TestComponent2
+from tests.StorageTests.test_storage import TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION
+
+logging.disable(logging.CRITICAL)
+
+
+class BackendTests:
+    """Run against every backend by the test cases below."""
+    backend: StorageBackend = None
+
+    def make_backend(self) -> StorageBackend:
+        raise NotImplementedError
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+
+    @classmethod
+    def tearDownClass(cls):
+        Storage.configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        self.backend = self.make_backend()
+        self.backend.clear()
+        self.id1 = uuid.uuid4()
+        self.id2 = uuid.uuid4()
+
+    def tearDown(self) -> None:
+        self.backend.clear()
+        self.backend.close()
+
+    def save(self, data: dict):
+        self.assertTrue(self.backend.save_entity(*as_update(data)))
+
+    def test_save_and_update(self):
+        self.assertIsNone(self.backend.load_entity(self.id1))
+        self.save({"id": self.id1, "components": {"A": {"x": 1}, "B": {}}, "shard": 1})
+        self.save({"$set": {"id": self.id1, "components.A": {"x": 2}}, "$unset": {"components.B": ""}})
+
+        loaded = self.backend.load_entity(self.id1)
+        self.assertEqual(loaded["id"], self.id1)
+        self.assertEqual(loaded["components"], {"A": {"x": 2}})
+        self.assertEqual(loaded["shard"], 1)
+
+        self.assertTrue(self.backend.remove_entity(self.id1))
+        self.assertIsNone(self.backend.load_entity(self.id1))
+
+    def test_writes(self):
+        self.save({"id": self.id2, "components": {}})
+        self.assertTrue(self.backend.bulk_write([as_update({"id": self.id1, "components": {"A": {}}})], [self.id2]))
+        self.assertEqual(self.backend.list_entity_ids(None), {self.id1})
+
+        self.assertTrue(self.backend.apply_mutations([
+            (self.id2, as_update({"id": self.id2, "components": {"A": {}}})[1]),
+            (self.id1, None),
+            (self.id1, as_update({"$set": {"id": self.id1, "components.B": {}}})[1]),
+        ]))
+        self.assertEqual(self.backend.load_entity(self.id1)["components"], {"B": {}})
+        self.assertEqual(self.backend.load_entity(self.id2)["components"], {"A": {}})
+
+    def test_queries(self):
+        id3 = uuid.uuid4()
+        self.save({"id": self.id1, "components": {"A": {}, "B": {}}, "shard": 1})
+        self.save({"id": self.id2, "components": {"A": {}}, "shard": 2})
+        before = utc_now()
+        time.sleep(0.01)
+        self.save({"id": id3, "components": {"B": {}}})
+
+        self.assertEqual({d["id"] for d in self.backend.find_entities(["A"], None, None)}, {self.id1, self.id2})
+        self.assertEqual({d["id"] for d in self.backend.find_entities(["A", "B"], None, None)}, {self.id1})
+        self.assertEqual({d["id"] for d in self.backend.find_entities(["A"], 2, None)}, {self.id2})
+        self.assertEqual(len(self.backend.find_entities([], None, None)), 3)
+
+        self.assertEqual(sorted(self.backend.list_shards()), [1, 2])
+        self.assertEqual(self.backend.list_entity_ids(1), {self.id1})
+
+        batches = list(self.backend.iter_entities(None, 2, None, None))
+        self.assertEqual([len(b) for b in batches], [2, 1])
+        batch = next(self.backend.iter_entities(1, 10, ["B"], None))
+        self.assertEqual(batch[0]["components"], {"B": {}})
+        self.assertEqual([d["id"] for b in self.backend.iter_entities(None, 10, None, before) for d in b], [id3])
+
+    def test_where(self):
+        self.save({"id": self.id1, "components": {"A": {"x": 1, "y": {"z": 2}}, "B": {}}})
+        self.save({"id": self.id2, "components": {"A": {"x": 2}}})
+
+        self.assertEqual([d["id"] for d in self.backend.find_entities(["A"], None, {"A.x": 2})], [self.id2])
+        self.assertEqual([d["id"] for d in self.backend.find_entities(["B"], None, {"A.x": 1})], [self.id1])
+        self.assertEqual([d["id"] for d in self.backend.find_entities([], None, {"A.y.z": 2})], [self.id1])
+        self.assertEqual(self.backend.find_entities(["A"], None, {"A.x": 3, "A.y.z": 2}), ())
+        self.assertEqual(len(self.backend.find_entities(["A"], None, {"B.x": None})), 2)
+
+    def test_ensure_indexes(self):
+        status = self.backend.ensure_indexes(["A.x"])
+        self.assertEqual(set(status), {"id", "shard", "saved_at", "components.A.x"})
+        self.assertTrue(all(s in (INDEX_READY, INDEX_CREATED) for s in status.values()))
+        self.assertEqual(set(self.backend.index_status(["A.x"]).values()), {INDEX_READY})
+
+    def test_failed_index_check_retried(self):
+        Storage.configure_backend(self.backend)
+
+        def unreachable(fields):
+            raise ConnectionError("storage is down")
+
+        self.backend.ensure_indexes = unreachable
+        with self.assertRaises(ConnectionError):
+            Storage.bulk_write([{"id": self.id1, "components": {}}], [])
+        # not checked again until the retry delay has passed
+        with self.assertRaises(MissingIndexError):
+            Storage.bulk_write([{"id": self.id1, "components": {}}], [])
+
+        del self.backend.ensure_indexes
+        Storage._index_retry_at = 0.0
+        self.assertTrue(Storage.bulk_write([{"id": self.id1, "components": {}}], []))
+        self.assertIsNotNone(Storage.load_entity(self.id1))
+
+    def test_world(self):
+        Storage.configure_backend(self.backend)
+        world = World()
+        id1 = world.add_components(None, TestComponent(1), TestComponent2())
+        world.remove_components(id1, TestComponent2)
+
+        loaded = World()
+        self.assertEqual(loaded.load_entities(), 1)
+        self.assertEqual(loaded.get_components(id1), {TestComponent: TestComponent(1)})
+
+
+class MemoryBackendTestCase(BackendTests, unittest.TestCase):
+
+    def make_backend(self) -> StorageBackend:
+        return MemoryBackend()
+
+    def test_copies(self):
+        self.save({"id": self.id1, "components": {"A": {"x": 1}}})
+        self.backend.load_entity(self.id1)["components"]["A"]["x"] = 2
+        self.assertEqual(self.backend.load_entity(self.id1)["components"], {"A": {"x": 1}})
+
+
+class SQLiteBackendTestCase(BackendTests, unittest.TestCase):
+
+    def make_backend(self) -> StorageBackend:
+        return SQLiteBackend()
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "entities.db")
+            backend = SQLiteBackend(path)
+            backend.save_entity(*as_update({"id": self.id1, "components": {"A": {}}}))
+            backend.close()
+
+            backend = SQLiteBackend(path)
+            self.assertEqual(backend.load_entity(self.id1)["components"], {"A": {}})
+            backend.close()
+
+
+class MongoBackendTestCase(BackendTests, unittest.TestCase):
+
+    def test_indexes_created(self):
+        self.backend.find_entities(["A"], None, {"A.x": 1})
+        self.backend.find_entities(["A"], None, None)
+        keys = [[k for k, _ in index["key"]] for index in self.backend.collection().index_information().values()]
+        self.assertIn(["components.A"], keys)
+        self.assertIn(["components.A.x"], keys)
+
+    def test_unique_id_index(self):
+        self.backend.collection().drop_indexes()
+        self.backend.collection().create_index("id")
+        self.assertEqual(self.backend.index_status([])["id"], INDEX_MISSING)
+
+        self.assertEqual(self.backend.ensure_indexes([])["id"], INDEX_CREATED)
+        unique = [index.get("unique") for index in self.backend.collection().index_information().values()
+                  if index["key"][0][0] == "id"]
+        self.assertEqual(unique, [True])
+
+    def test_failed_rebuild_keeps_index(self):
+        self.backend.collection().drop_indexes()
+        self.backend.collection().create_index("id")
+        self.backend.collection().insert_many([{"id": self.id1}, {"id": self.id1}, {"id": self.id2}])
+
+        with self.assertRaisesRegex(DuplicateEntityIdError, str(self.id1)):
+            self.backend.ensure_indexes([])
+        self.assertIn("id", self.backend._existing_indexes())
+
+        self.backend.collection().delete_one({"id": self.id1})
+        self.assertEqual(self.backend.ensure_indexes([])["id"], INDEX_CREATED)
+        self.assertEqual([index.get("unique") for index in self.backend.collection().index_information().values()
+                          if index["key"][0][0] == "id"], [True])
+
+    def test_index_declared_later(self):
+        self.backend.collection().drop_indexes()
+        Storage.configure_backend(self.backend)
+        Storage.ensure_indexes()
+        world = World()
+        world.lookup(TestComponent, test_int=1)
+        self.assertIn("components.TestComponent.test_int", self.backend._existing_indexes())
+
+    def test_refuses_without_id_index(self):
+        self.backend.collection().drop_indexes()
+        self.backend.collection().insert_many([{"id": self.id1}, {"id": self.id1}])
+        Storage.configure_backend(self.backend)
+
+        with self.assertRaisesRegex(DuplicateEntityIdError, str(self.id1)):
+            Storage.ensure_indexes()
+        for load in (partial(Storage.load_entity, self.id1), Storage.iter_entities, Storage.list_entity_ids,
+                     partial(Storage.find_entities, ["A"])):
+            with self.assertRaises(MissingIndexError):
+                load()
+        try:
+            Storage.require_indexes(False)
+            self.assertIsNotNone(Storage.load_entity(self.id1))
+        finally:
+            Storage.require_indexes()
+
+    def make_backend(self) -> StorageBackend:
+        return MongoBackend(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
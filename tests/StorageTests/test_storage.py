@@ -7,7 +7,7 @@ import Storage
 from ECS import World
 from Storage import configure_database
 from tests import ECSTests
-from tests.ECSTests import TestComponent
+from tests.ECSTests import TestComponent, TestComponent2
 
 TEST_DATABASE_NAME = "MafiaUnitTest"
 TEST_ENTITY_COLLECTION = "Entities"
@@ -67,3 +67,54 @@ class StorageTestCase(unittest.TestCase):
         retrieved = Storage.load_all_entities()
 
         self.assertEqual(len(retrieved), 3)
+
+    def test_iter_entities(self):
+        for i in range(4):
+            self.world.add_components(None, TestComponent(i))
+
+        batches = list(Storage.iter_entities(batch_size=2))
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+
+        batch = next(Storage.iter_entities(components=[TestComponent2.__name__]))
+        self.assertEqual(batch[0]["components"], {})
+        self.assertIn("id", batch[0])
+
+
+class AsyncStorageTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+        configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        self.world = World()
+        self.test_entity_id: uuid = self.world.add_components(None, TestComponent(num=5))
+        Storage.clear_entity_collection()
+
+    def tearDown(self) -> None:
+        Storage.clear_entity_collection()
+
+    async def test_save_and_load_async(self):
+        with self.assertRaises(KeyError):
+            await Storage.save_entity_async({})
+
+        self.assertIsNone(await Storage.load_entity_async(self.test_entity_id))
+        self.assertTrue(await Storage.save_entity_async(self.world.get_entity_data(self.test_entity_id)))
+
+        loaded = ECS.entity_from_dict(await Storage.load_entity_async(self.test_entity_id))
+        self.assertEqual(loaded[0], self.test_entity_id)
+        self.assertEqual(len(await Storage.load_all_entities_async()), 1)
+
+        self.assertEqual([len(b) async for b in Storage.iter_entities_async(batch_size=1)], [1])
+
+        self.assertTrue(await Storage.remove_entity_async(self.test_entity_id))
+        self.assertIsNone(await Storage.load_entity_async(self.test_entity_id))
+
+    async def test_bulk_write_async(self):
+        id1 = self.world.add_components(None, TestComponent(num=1))
+        Storage.save_entity(self.world.get_entity_data(self.test_entity_id))
+
+        self.assertTrue(await Storage.bulk_write_async([self.world.get_entity_data(id1)], [self.test_entity_id]))
+        self.assertIsNotNone(Storage.load_entity(id1))
+        self.assertIsNone(Storage.load_entity(self.test_entity_id))
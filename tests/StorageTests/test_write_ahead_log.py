@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import tempfile
+import unittest
+
+import Storage
+from ECS import World
+from Storage import configure_database
+from Storage.WriteAheadLog import WriteAheadLog, RecoveryError, read_records, COMPACTING_SUFFIX
+from tests import ECSTests
+from tests.ECSTests import TestComponent, TestComponent2
+from tests.StorageTests.test_storage import TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION
+
+logging.disable(logging.CRITICAL)
+
+
+class WriteAheadLogTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+        configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        Storage.clear_entity_collection()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "world.log")
+        self.world = World()
+        self.world.enable_write_ahead_log(self.path, group_size=3, sync_delay=0.01, compact_interval=0.05)
+
+    def tearDown(self) -> None:
+        self.world._log.close()
+        Storage.clear_entity_collection()
+        self.directory.cleanup()
+
+    async def test_log_then_compact(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.world.add_components(id1, TestComponent2())
+        self.world.remove_components(id1, TestComponent)
+        id2 = self.world.add_components(None, TestComponent(2))
+        self.world.remove_entity(id2)
+
+        self.world._log.sync()
+        self.assertEqual([r[0] for r in read_records(self.path)], [id1, id1, id1, id2, id2])
+        self.assertIsNone(Storage.load_entity(id1))
+        self.assertTrue(self.world._is_pending(id1))
+        self.assertTrue(self.world._is_pending_removal(id2))
+
+        self.assertTrue(self.world.flush())
+        self.assertEqual(list(read_records(self.path)), [])
+        self.assertEqual(len(self.world._log), 0)
+        self.assertEqual(Storage.load_entity(id1)["components"], {TestComponent2.__name__: {}})
+        self.assertIsNone(Storage.load_entity(id2))
+
+    async def test_group_sync(self):
+        log = self.world._log
+        self.world.add_components(None, TestComponent(1))
+        self.world.add_components(None, TestComponent(2))
+        self.assertEqual(log._unsynced, 2)
+        self.world.add_components(None, TestComponent(3))
+        self.assertEqual(log._unsynced, 0)
+
+        self.world.add_components(None, TestComponent(4))
+        await asyncio.sleep(0.02)
+        self.assertEqual(log._unsynced, 0)
+
+    async def test_background_compaction(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        await asyncio.sleep(0.1)
+        self.assertIsNotNone(Storage.load_entity(id1))
+        self.assertFalse(self.world._is_pending(id1))
+
+    async def test_recover(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        id2 = self.world.add_components(None, TestComponent(2))
+        self.world._log.sync()
+        # a crash while compacting leaves the moved log, and one while writing leaves a partial record
+        os.replace(self.path, self.path + COMPACTING_SUFFIX)
+        log = WriteAheadLog(self.path + ".other")
+        log.append_removal(id2)
+        log._file.write(b"\x00\x00\x00\xffpartial")
+        log._file.close()
+        os.replace(self.path + ".other", self.path)
+
+        self.world = World()
+        self.world.enable_write_ahead_log(self.path)
+        self.assertFalse(os.path.exists(self.path + COMPACTING_SUFFIX))
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.assertIsNotNone(Storage.load_entity(id1))
+        self.assertIsNone(Storage.load_entity(id2))
+
+        self.world.load_entities()
+        self.assertEqual(self.world.get_components(id1), {TestComponent: TestComponent(1)})
+        self.assertFalse(self.world.has_entity(id2))
+
+    def test_failed_recovery(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.world._log.sync()
+        self.world._log._file.close()
+
+        apply_mutations = Storage.apply_mutations
+        Storage.apply_mutations = lambda mutations: None
+        try:
+            with self.assertRaises(RecoveryError):
+                WriteAheadLog(self.path)
+        finally:
+            Storage.apply_mutations = apply_mutations
+        self.assertEqual([uuid_ for uuid_, _ in read_records(self.path + COMPACTING_SUFFIX)], [id1])
+
+        self.world._log = WriteAheadLog(self.path)
+        self.assertIsNotNone(Storage.load_entity(id1))
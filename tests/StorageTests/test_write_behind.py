@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import unittest
+
+import Storage
+from ECS import World
+from Storage import configure_database
+from Storage.WriteBehind import WriteBehindBuffer
+from tests import ECSTests
+from tests.ECSTests import TestComponent, TestComponent2
+from tests.StorageTests.test_storage import TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION
+
+logging.disable(logging.CRITICAL)
+
+
+class WriteBehindTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ECSTests.register_test_components()
+        configure_database(TEST_DATABASE_NAME, TEST_ENTITY_COLLECTION)
+
+    def setUp(self):
+        self.world = World()
+        self.world.enable_write_behind(max_staleness=0.05, max_batch_size=10)
+
+    def tearDown(self) -> None:
+        Storage.clear_entity_collection()
+
+    async def test_coalesce(self):
+        loads = []
+
+        def load_data(uuid_):
+            loads.append(uuid_)
+            return self.world.get_entity_data(uuid_)
+
+        self.world._write_behind = WriteBehindBuffer(load_data, 10, 10)
+
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.world.add_components(id1, TestComponent2())
+        self.world.remove_components(id1, TestComponent)
+        self.assertEqual(len(self.world._write_behind), 1)
+        self.assertIsNone(Storage.load_entity(id1))
+
+        self.assertTrue(self.world.flush())
+        self.assertEqual(loads, [id1])
+        self.assertEqual(Storage.load_entity(id1)["components"], {TestComponent2.__name__: {}})
+
+        self.world.remove_entity(id1)
+        self.assertEqual(len(self.world._write_behind), 1)
+        self.world.flush()
+        self.assertIsNone(Storage.load_entity(id1))
+
+    async def test_changed_components(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.world.flush()
+
+        self.world.add_components(id1, TestComponent2())
+        self.world.remove_components(id1, TestComponent)
+        self.assertEqual(self.world.get_entity_update(id1), {
+            "$set": {"id": id1, f"components.{TestComponent2.__name__}": {}},
+            "$unset": {f"components.{TestComponent.__name__}": ""},
+        })
+
+        self.world.add_components(id1, TestComponent(2))
+        self.world.save_entity(id1)
+        self.world.remove_components(id1, TestComponent2)
+        self.assertEqual(self.world.get_entity_update(id1), {"$set": self.world.get_entity_data(id1)})
+
+    async def test_flush_after_staleness(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.assertIsNone(Storage.load_entity(id1))
+
+        await asyncio.sleep(0.1)
+        self.assertIsNotNone(Storage.load_entity(id1))
+        self.assertEqual(len(self.world._write_behind), 0)
+
+    async def test_flush_on_batch_size(self):
+        ids = [self.world.add_components(None, TestComponent(i)) for i in range(10)]
+        self.assertTrue(self.world._write_behind._flush_queued)
+        self.assertEqual(len(self.world._write_behind._flush_tasks), 1)
+
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(Storage.load_all_entities()), 10)
+        for id_ in ids:
+            self.assertIsNotNone(Storage.load_entity(id_))
+
+    async def test_cancelled_flush(self):
+        self.world.enable_write_behind(max_staleness=10, max_batch_size=1)
+        ids = [self.world.add_components(None, TestComponent(i)) for i in range(3)]
+        for task in self.world._write_behind._flush_tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+
+        self.assertTrue(self.world.flush())
+        for id_ in ids:
+            self.assertIsNotNone(Storage.load_entity(id_))
+
+    async def test_cancelled_write(self):
+        self.world.enable_write_behind(max_staleness=10, max_batch_size=1)
+        bulk_write_async = Storage.bulk_write_async
+        started = asyncio.Event()
+
+        async def stalled(*args):
+            started.set()
+            await asyncio.sleep(10)
+
+        Storage.bulk_write_async = stalled
+        try:
+            id1 = self.world.add_components(None, TestComponent(1))
+            await started.wait()
+            for task in self.world._write_behind._flush_tasks:
+                task.cancel()
+            await asyncio.sleep(0)
+        finally:
+            Storage.bulk_write_async = bulk_write_async
+
+        self.assertTrue(await self.world.flush_async())
+        self.assertIsNotNone(Storage.load_entity(id1))
+
+    def test_flush_without_loop(self):
+        id1 = self.world.add_components(None, TestComponent(1))
+        self.assertIsNotNone(Storage.load_entity(id1))
+
+    async def test_flush_async(self):
+        self.assertTrue(await self.world.flush_async())
+
+        id1 = self.world.add_components(None, TestComponent(1))
+        id2 = self.world.add_components(None, TestComponent(2))
+        self.world.remove_entity(id2)
+        self.assertTrue(await self.world.flush_async())
+
+        self.assertEqual(len(self.world._write_behind), 0)
+        self.assertIsNotNone(Storage.load_entity(id1))
+        self.assertIsNone(Storage.load_entity(id2))
+
+    async def test_failed_write(self):
+        bulk_write_async = Storage.bulk_write_async
+
+        async def failing(*args):
+            raise RuntimeError("storage is down")
+
+        Storage.bulk_write_async = failing
+        try:
+            id1 = self.world.add_components(None, TestComponent(1))
+            self.assertFalse(await self.world.flush_async())
+        finally:
+            Storage.bulk_write_async = bulk_write_async
+
+        self.assertTrue(self.world._write_behind.is_pending(id1))
+        self.assertIsNone(Storage.load_entity(id1))
+
+        await asyncio.sleep(0.1)
+        self.assertIsNotNone(Storage.load_entity(id1))
+        self.assertFalse(self.world._write_behind.is_pending(id1))
+        self.assertTrue(await self.world.flush_async())
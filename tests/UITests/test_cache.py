@@ -0,0 +1,48 @@
+import unittest
+
+from UI.Cache import TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = TTLCache(2, 10, lambda: self.now)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get(1))
+        self.cache.set(1, "a")
+        self.assertEqual(self.cache.get(1), "a")
+        self.assertTrue(1 in self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1))
+        self.cache.invalidate(1)
+
+    def test_ttl(self):
+        self.cache.set(1, "a")
+        self.now = 9.9
+        self.assertEqual(self.cache.get(1), "a")
+        self.now = 10
+        self.assertFalse(1 in self.cache)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru(self):
+        self.cache.set(1, "a")
+        self.cache.set(2, "b")
+        self.cache.get(1)
+        self.cache.set(3, "c")
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.get(1), "a")
+        self.assertEqual(self.cache.get(3), "c")
+
+    def test_invalidate_where(self):
+        self.cache.max_size = 10
+        for key in ((1, 1), (1, 2), (2, 1)):
+            self.cache.set(key, key)
+        self.cache.invalidate_where(lambda key: key[0] == 1)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get((2, 1)), (2, 1))
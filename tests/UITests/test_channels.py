@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+
+import UI
+from UI.Scheduler import RequestScheduler
+
+logging.disable(logging.CRITICAL)
+
+DELAY = 0.05
+
+# other tests replace these with mocks so the real ones are kept from import time
+REAL_FUNCTIONS = {name: getattr(UI, name) for name in ("make_player_channels", "make_player_channels_batch",
+                                                        "remove_channels", "send_message", "broadcast_message")}
+
+
+class SlowCalls:
+    """Stands in for discord requests and counts how many of them run at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def call(self, *args, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(DELAY)
+        self.running -= 1
+        return MagicMock()
+
+
+class ChannelsTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.calls = SlowCalls()
+        self.guild = MagicMock(id=123)
+        self.channels = {}
+        for id_ in (1, 2, 3):
+            self.channels[id_] = MagicMock(id=id_, delete=AsyncMock(side_effect=self.calls.call),
+                                           send=AsyncMock(side_effect=self.calls.call))
+        self.guild.get_channel_or_thread = self.channels.get
+
+        self.category = MagicMock(id=10, create_text_channel=AsyncMock(side_effect=self.calls.call))
+
+        async def create_category(*args, **kwargs):
+            await self.calls.call()
+            return self.category
+
+        self.guild.create_category = AsyncMock(side_effect=create_category)
+
+        patchers = [patch.object(UI._bot, "get_guild", return_value=self.guild),
+                    patch.object(UI._bot, "get_channel", side_effect=self.channels.get),
+                    patch.object(UI, "get_guild", AsyncMock(return_value=self.guild)),
+                    patch.object(UI, "get_member", AsyncMock(side_effect=lambda guild, id_: MagicMock(id=id_))),
+                    patch.object(UI, "_scheduler", RequestScheduler(retry_after_func=UI._retry_after))]
+        patchers += [patch.object(UI, name, func) for name, func in REAL_FUNCTIONS.items()]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def test_remove_channels(self):
+        self.assertEqual(await UI.remove_channels(123, 1, 2, 3, 4), {1: True, 2: True, 3: True, 4: False})
+        self.assertEqual(self.calls.peak, 3)
+
+        self.channels[2].delete.side_effect = UI.HTTPException(MagicMock(status=500), "failed")
+        self.assertEqual(await UI.remove_channels(123, 1, 2), {1: True, 2: False})
+
+    async def test_rate_limited(self):
+        rate_limited = UI.HTTPException(MagicMock(status=429, headers={"Retry-After": "0.01"}), "rate limited")
+        self.channels[1].delete.side_effect = [rate_limited, None]
+        self.assertEqual(await UI.remove_channels(123, 1), {1: True})
+        self.assertEqual(self.channels[1].delete.await_count, 2)
+
+    async def test_make_player_channels_batch(self):
+        results = await UI.make_player_channels_batch(123, ("a", 1), ("b", 2), ("c", 3))
+        # category then both text channels, for every player at once
+        self.assertGreaterEqual(self.calls.peak, 3)
+        self.assertEqual(set(results), {1, 2, 3})
+        self.assertEqual(self.category.create_text_channel.await_count, 6)
+
+        self.category.create_text_channel.side_effect = KeyError("failed")
+        results = await UI.make_player_channels_batch(123, ("a", 1))
+        self.assertEqual(results[1], "KeyError: 'failed'")
+        with self.assertRaises(KeyError):
+            await UI.make_player_channels("a", 1, 123)
+
+    async def test_make_player_channels_rollback(self):
+        self.category.create_text_channel.side_effect = [MagicMock(id=11), RuntimeError("failed")]
+        # the guild left the gateway cache, so removing the made channels fails too
+        with patch.object(UI._bot, "get_guild", return_value=None):
+            with self.assertRaisesRegex(RuntimeError, "failed"):
+                await UI.make_player_channels("a", 1, 123)
+
+    async def test_broadcast_message(self):
+        self.assertEqual(await UI.broadcast_message("test", 1, 2, 1, 3, 4), {1: True, 2: True, 3: True, 4: False})
+        self.assertEqual(self.calls.peak, 3)
+        self.channels[1].send.assert_awaited_once_with("test")
+
+        self.channels[2].send.side_effect = UI.HTTPException(MagicMock(status=500), "failed")
+        self.assertFalse(await UI.send_message("test", 2))
+        self.assertTrue(await UI.send_message("test", 3))
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from UI.Scheduler import RequestScheduler, RateLimited
+
+logging.disable(logging.CRITICAL)
+
+LIMIT = 3
+PERIOD = 0.2
+
+
+class FakeDiscord:
+    """Allows LIMIT requests per route every PERIOD seconds and answers 429 beyond that."""
+
+    def __init__(self):
+        self.windows: dict[str, tuple[float, int]] = {}
+        self.accepted = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        route = request.match_info["route"]
+        now = time.monotonic()
+        start, count = self.windows.get(route, (now, 0))
+        if now - start >= PERIOD:
+            start, count = now, 0
+        reset_after = PERIOD - (now - start)
+        if count >= LIMIT:
+            self.rejected += 1
+            return web.json_response({"retry_after": reset_after}, status=429)
+        self.windows[route] = (start, count + 1)
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.accepted += 1
+        return web.json_response({"id": self.accepted}, headers={
+            "X-RateLimit-Limit": str(LIMIT),
+            "X-RateLimit-Remaining": str(LIMIT - count - 1),
+            "X-RateLimit-Reset-After": str(reset_after),
+        })
+
+
+class SchedulerTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.discord = FakeDiscord()
+        app = web.Application()
+        app.router.add_post("/{route}", self.discord.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.close()
+
+    def request(self, scheduler: RequestScheduler, route: str):
+        async def send():
+            async with self.session.post(self.server.make_url(f"/{route}")) as response:
+                data = await response.json()
+                if response.status == 429:
+                    raise RateLimited(data["retry_after"])
+                scheduler.update_from_headers(route, response.headers)
+                return data["id"]
+
+        return send
+
+    async def test_stays_within_limit(self):
+        scheduler = RequestScheduler(LIMIT, PERIOD)
+        start = time.monotonic()
+        results = await scheduler.gather("channels", *(self.request(scheduler, "channels") for _ in range(10)))
+
+        self.assertEqual(sorted(results), list(range(1, 11)))
+        self.assertEqual(self.discord.rejected, 0)
+        # requests in a window run together and 10 requests need 4 windows
+        self.assertEqual(self.discord.max_in_flight, LIMIT)
+        self.assertGreaterEqual(time.monotonic() - start, 3 * PERIOD)
+
+    async def test_routes_are_independent(self):
+        scheduler = RequestScheduler(LIMIT, PERIOD)
+        start = time.monotonic()
+        await asyncio.gather(*(scheduler.run(route, self.request(scheduler, route))
+                               for route in ("a", "b", "c") for _ in range(LIMIT)))
+        self.assertLess(time.monotonic() - start, PERIOD)
+        self.assertEqual(self.discord.accepted, 3 * LIMIT)
+
+    async def test_retries_rate_limited(self):
+        # the scheduler starts out allowing more than the fake server, the 429s correct it
+        scheduler = RequestScheduler(LIMIT * 2, PERIOD)
+        results = await scheduler.gather("channels", *(self.request(scheduler, "channels") for _ in range(LIMIT * 2)))
+        self.assertEqual(sorted(results), list(range(1, LIMIT * 2 + 1)))
+        self.assertGreater(self.discord.rejected, 0)
+
+    async def test_retry_after_func(self):
+        calls = []
+
+        async def limited():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                raise KeyError(0.01)
+            return len(calls)
+
+        scheduler = RequestScheduler(retry_after_func=lambda e: e.args[0] if isinstance(e, KeyError) else None)
+        self.assertEqual(await scheduler.run("a", limited), 2)
+        with self.assertRaises(ValueError):
+            await scheduler.run("a", self.failing)
+
+    @staticmethod
+    async def failing():
+        raise ValueError("failed")